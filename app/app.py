@@ -1,14 +1,45 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
 
-from app.endpoints import comments
-from app.schemas.comment_schema import HealthCheckResponse, WelcomeMessage
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 
-# Creating an instance of the FastAPI application
-app = FastAPI(title="Feddit API", version="1.0.0", docs_url="/docs", redoc_url="/redoc")
+from app.deadline import DeadlineMiddleware
+from app.endpoints import comments, subfeddits
+from app.logging_config import logging_is_set_up, setup_logging
+from app.metrics import CONTENT_TYPE, MetricsMiddleware, render_metrics
+from app.schemas.comment_schema import (
+    HealthCheckResponse,
+    StatsResponse,
+    WelcomeMessage,
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: write the logs from a background thread, so that requests never wait for the disk. It is done when the
+    # server starts rather than on import, and kept when the process already set it up, e.g. a benchmark
+    if not logging_is_set_up():
+        setup_logging()
+
+    yield
+
+
+# Creating an instance of the FastAPI application, whose lifespan runs before the ones of the routers
+app = FastAPI(title="Feddit API", version="1.0.0", docs_url="/docs", redoc_url="/redoc", lifespan=lifespan)
+
+# Cancel the requests whose client disconnected or whose deadline passed, so that they release their resources
+app.add_middleware(DeadlineMiddleware)
+
+# Time every request, and the stages of the requests, for the '/metrics' endpoint. It is added last so that it wraps
+# the other middlewares, and records the requests they cancel
+app.add_middleware(MetricsMiddleware)
 
 # Including the 'comments' router into the main FastAPI application, which adds all routes from 'comments' to the app
 app.include_router(comments.router)
 
+# Including the 'subfeddits' router, whose routes share the database client of 'comments'
+app.include_router(subfeddits.router)
+
 
 @app.get("/", response_model=WelcomeMessage)
 async def root():
@@ -24,9 +55,73 @@ async def root():
 @app.get("/health", response_model=HealthCheckResponse)
 async def health_check():
     """
-    Health check endpoint to check if the API is running smoothly.
+    Liveness endpoint to check if the API process is running. It does not depend on the database, so that a process
+    is not restarted because the database is unreachable.
 
     Returns:\n
         dict: A dictionary with the status of the application, which is 'ok' when healthy.
     """
     return {"status": "ok"}
+
+
+@app.get(
+    "/health/ready",
+    response_model=HealthCheckResponse,
+    responses={503: {"model": HealthCheckResponse, "description": "Not ready to receive traffic"}},
+)
+async def readiness_check(request: Request):
+    """
+    Readiness endpoint to check if the API process can receive traffic: it is ready once it has opened its database
+    connections and loaded the sentiment lexicon, and until it starts shutting down.
+
+    Returns:\n
+        dict: A dictionary with the status of the application, which is 'ok' when ready, or 'unavailable' with a
+        503 status while the process is starting or shutting down.
+    """
+    if not getattr(request.app.state, "ready", False) or comments.comments_handler.db_client.pool is None:
+        return JSONResponse(status_code=503, content={"status": "unavailable"})
+
+    return {"status": "ok"}
+
+
+@app.get("/stats", response_model=StatsResponse)
+async def stats():
+    """
+    Stats endpoint exposing the saturation of the database connection pool and of the admission control, the
+    efficiency of the polarity and response caches, and the fan-out of the live feeds, to tune them under load.
+
+    Returns:\n
+        dict: The connection pool metrics (connections in use and idle, callers waiting, acquisition latency),
+        the polarity cache counters (hits, misses, evictions, size), the response cache counters
+        (fresh and stale hits, misses, coalesced requests, size), the admission control state (capacity in use,
+        requests in flight and waiting, wait time, rejections) and the live feeds state (feeds and subscribers,
+        polls, comments read and sent, overflowed subscribers).
+    """
+    return {
+        "pool": comments.comments_handler.db_client.pool_stats(),
+        "polarity_cache": comments.comments_handler.polarity_cache.stats(),
+        "response_cache": comments.comments_handler.response_cache.stats(),
+        "admission": comments.admission_controller.stats(),
+        "live": subfeddits.subfeddits_handler.live_feeds.stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Metrics endpoint in the Prometheus text format, to find where the time of the requests goes without a profiler.
+
+    Returns:\n
+        PlainTextResponse: The latency histograms of the requests and of their stages (pool acquisition, subfeddit and
+        comments queries, polarity cache, scoring, handler, serialization) by endpoint and outcome, the per comment
+        scoring time, the connection pool saturation, the counters and hit ratios of the caches, and the state of
+        the admission control and of the live feeds.
+    """
+    content = render_metrics(
+        comments.comments_handler.db_client.pool_stats(),
+        comments.comments_handler.polarity_cache.stats(),
+        comments.comments_handler.response_cache.stats(),
+        comments.admission_controller.stats(),
+        subfeddits.subfeddits_handler.live_feeds.stats(),
+    )
+    return PlainTextResponse(content, media_type=CONTENT_TYPE)
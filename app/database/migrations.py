@@ -0,0 +1,270 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Dict, List, Optional
+
+import asyncpg
+
+from app.database.postgre import SEARCH_CONFIG, PostgreClient
+from app.logging_config import setup_logging
+
+SCHEMA_MIGRATIONS_ENABLED = os.getenv("SCHEMA_MIGRATIONS_ENABLED", "true").lower() == "true"
+
+# Estimated number of rows from which a sequential scan of a table is reported by the plan check; the planner
+# rightly reads smaller tables whole
+PLAN_CHECK_MIN_ROWS = int(os.getenv("PLAN_CHECK_MIN_ROWS", 10000))
+
+# Key of the advisory lock held by the instance applying the migrations
+MIGRATIONS_LOCK_KEY = 7_340_113
+
+logger = logging.getLogger(__name__)
+
+
+class Migration:
+    """
+    A named schema change of the database, applied once. When it builds an index, the index is built concurrently,
+    without blocking the writes to its table, so the statement runs outside of a transaction; an index left invalid
+    by an interrupted build is dropped and built again.
+    """
+
+    def __init__(self, name: str, statement: str, index: Optional[str] = None):
+        """
+        Initializes the Migration instance.
+
+        Args:
+            name (str): The unique name of the migration, recorded once it is applied.
+            statement (str): The statement applying it.
+            index (Optional[str]): The name of the index the statement builds concurrently, if any. Defaults to None.
+        """
+        self.name = name
+        self.statement = statement
+        self.index = index
+
+
+# The migrations, in the order they are applied
+MIGRATIONS = [
+    # Full-text search of the comments, with the expression of the search predicate of `PostgreClient`
+    Migration(
+        "comment_text_search",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS comment_text_search_idx "
+        f"ON comment USING gin (to_tsvector('{SEARCH_CONFIG}', text));",
+        index="comment_text_search_idx",
+    ),
+    # Comments of a subfeddit in the order of `get_comments`, from the most recent, so that a page and the pages
+    # after it are read from the index rather than sorted from all the comments of the subfeddit
+    Migration(
+        "comment_subfeddit_created_at",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS comment_subfeddit_created_at_idx "
+        "ON comment (subfeddit_id, created_at DESC, id DESC);",
+        index="comment_subfeddit_created_at_idx",
+    ),
+    # Lookup of a subfeddit by name, which is then also unique. The build fails, and is retried on the next start,
+    # while two subfeddits have the same name.
+    Migration(
+        "subfeddit_title_unique",
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS subfeddit_title_idx ON subfeddit (title);",
+        index="subfeddit_title_idx",
+    ),
+]
+
+
+def seq_scans(plan: dict) -> List[str]:
+    """
+    Lists the tables a query plan reads with a sequential scan.
+
+    Args:
+        plan (dict): A node of the plan, as returned by `EXPLAIN (FORMAT JSON)`, with its children.
+
+    Returns:
+        List[str]: The names of the tables, in the order of the plan.
+    """
+    tables = [plan["Relation Name"]] if plan["Node Type"] == "Seq Scan" else []
+    for child in plan.get("Plans", []):
+        tables.extend(seq_scans(child))
+
+    return tables
+
+
+class SchemaMigrator:
+    """
+    Applies the migrations not applied yet, and records them in the `schema_migrations` table. A single instance
+    applies them at a time: the others skip them rather than wait, as building an index can take long and searches
+    work, only slower, until it is built.
+    """
+
+    def __init__(self, db_client: PostgreClient, migrations: List[Migration] = MIGRATIONS):
+        """
+        Initializes the SchemaMigrator instance.
+
+        Args:
+            db_client (PostgreClient): The client of the database to migrate.
+            migrations (List[Migration]): The migrations, in order. Defaults to MIGRATIONS.
+        """
+        self.db_client = db_client
+        self.migrations = migrations
+        self.task: Optional[asyncio.Task] = None
+
+    async def apply(self, conn, migration: Migration):
+        """
+        Applies a migration and records it.
+
+        Args:
+            conn (asyncpg.Connection): The connection holding the migrations lock.
+            migration (Migration): The migration.
+        """
+        if migration.index is not None:
+            valid = await conn.fetchval(
+                "SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass($1);", migration.index
+            )
+            # `IF NOT EXISTS` would keep the invalid index an interrupted build leaves behind
+            if valid is False:
+                logger.warning("Dropping the invalid index %s, to build it again", migration.index)
+                await conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {migration.index};")
+
+        logger.info("Applying the migration %s...", migration.name)
+        start = time.perf_counter()
+        await conn.execute(migration.statement)
+        await conn.execute("INSERT INTO schema_migrations (name) VALUES ($1);", migration.name)
+        logger.info("Applied the migration %s in %.1fs", migration.name, time.perf_counter() - start)
+
+    async def run(self) -> Optional[List[str]]:
+        """
+        Applies the migrations not applied yet, in order, unless another instance is applying them.
+
+        Returns:
+            Optional[List[str]]: The names of the migrations applied, or None if another instance is applying them.
+        """
+        # A dedicated connection, so that long index builds neither hold a connection of the pool nor hit its timeout
+        conn = await self.db_client.connect()
+        try:
+            if not await conn.fetchval("SELECT pg_try_advisory_lock($1);", MIGRATIONS_LOCK_KEY):
+                logger.info("Another instance is applying the migrations, skipping them")
+                return None
+
+            await conn.execute(
+                "CREATE TABLE IF NOT EXISTS schema_migrations ("
+                "name TEXT PRIMARY KEY, applied_at TIMESTAMPTZ NOT NULL DEFAULT now());"
+            )
+            applied = {row["name"] for row in await conn.fetch("SELECT name FROM schema_migrations;")}
+
+            names = []
+            for migration in self.migrations:
+                if migration.name not in applied:
+                    await self.apply(conn, migration)
+                    names.append(migration.name)
+
+            return names
+        finally:
+            # Closing the connection also releases the lock
+            await conn.close()
+
+    async def check_plans(self, min_rows: int = PLAN_CHECK_MIN_ROWS) -> Dict[str, List[str]]:
+        """
+        Explains the query shapes of `PostgreClient.query_shapes` and warns about the ones the planner runs with a
+        sequential scan of a table of at least `min_rows` rows, as estimated by the table's statistics.
+
+        Args:
+            min_rows (int): The estimated number of rows from which a table is reported. Defaults to
+                PLAN_CHECK_MIN_ROWS.
+
+        Returns:
+            Dict[str, List[str]]: The tables read with a sequential scan, by name of the query shapes reading some.
+        """
+        conn = await self.db_client.connect()
+        try:
+            found = {}
+            for name, (query, params) in self.db_client.query_shapes().items():
+                try:
+                    plan = json.loads(await conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *params))
+                except asyncpg.PostgresError as e:
+                    logger.warning("Cannot check the plan of the %s query: %s", name, e)
+                    continue
+
+                tables = seq_scans(plan[0]["Plan"])
+                if tables:
+                    # Keep the tables large enough for a sequential scan to be slow
+                    rows = await conn.fetch(
+                        "SELECT relname FROM pg_class WHERE relname = ANY($1::text[]) AND reltuples >= $2;",
+                        tables,
+                        min_rows,
+                    )
+                    large = {row["relname"] for row in rows}
+                    tables = [table for table in tables if table in large]
+
+                if tables:
+                    logger.warning("The %s query reads %s with a sequential scan", name, ", ".join(tables))
+                    found[name] = tables
+
+            return found
+        finally:
+            await conn.close()
+
+    async def run_in_background(self):
+        """
+        Applies the migrations, then checks the plans of the queries, logging the failure of a migration rather
+        than raising it. The plans are only checked by the instance that applied the migrations.
+        """
+        try:
+            if await self.run() is not None:
+                await self.check_plans()
+        except Exception as e:
+            logger.error("Error while applying the migrations: %s", e)
+
+    def start(self):
+        """
+        Starts applying the migrations in the background, so that building indexes does not delay the startup.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self.run_in_background())
+
+    async def stop(self):
+        """
+        Stops applying the migrations, interrupting the current one. It is applied again on the next start.
+        """
+        if self.task is None:
+            return
+
+        task, self.task = self.task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+async def main(args) -> int:
+    """
+    Applies the migrations of the database of DATABASE_URI, then checks the plans of the queries.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+
+    Returns:
+        int: The exit status, 1 if a query reads a table with a sequential scan.
+    """
+    migrator = SchemaMigrator(PostgreClient(replica_urls=[]))
+
+    if not args.check:
+        names = await migrator.run()
+        if names is None:
+            print("another instance is applying the migrations")
+            return 1
+        print(f"applied {len(names)} migrations: {', '.join(names) or 'none'}")
+
+    found = await migrator.check_plans()
+    for name, tables in found.items():
+        print(f"{name}: sequential scan of {', '.join(tables)}")
+    print(f"checked the query plans: {len(found)} with a sequential scan")
+
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Applies the schema migrations of the service to the database.")
+    parser.add_argument("--check", action="store_true", help="only check the query plans, without migrating")
+    setup_logging(log_file="")
+    sys.exit(asyncio.run(main(parser.parse_args())))
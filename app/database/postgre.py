@@ -1,28 +1,288 @@
+import asyncio
+import itertools
 import os
+import time
+from contextlib import AsyncExitStack, asynccontextmanager
 from datetime import datetime
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
 
 import asyncpg
 
+from app import deadline, metrics
+from app.database.replicas import CONNECTION_ERRORS, DATABASE_REPLICA_URIS, ReplicaSet
+from app.scoring.polarity import SCORER_VERSION
+
 DATABASE_URL = os.getenv("DATABASE_URI")
 
+# Connection pool settings, the defaults are asyncpg's
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 10))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", 0)) or None
+DB_MAX_QUERIES = int(os.getenv("DB_MAX_QUERIES", 50000))
+DB_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", 300))
+
+SUBFEDDIT_ID_QUERY = "SELECT id FROM subfeddit WHERE title = $1;"
+
+# Text search configuration of the comments' full-text index; the search predicate must use the same expression as
+# the index for the index to be used
+SEARCH_CONFIG = "english"
+SEARCH_DOCUMENT = f"to_tsvector('{SEARCH_CONFIG}', c.text)"
+SUBFEDDITS_QUERY = "SELECT id, title FROM subfeddit;"
+
+# The comments of a subfeddit scored after a watermark, i.e. with a greater change sequence number, read by the live
+# feeds. The range scan of the (subfeddit_id, change_seq) index only reads the comments scored after the watermark
+LIVE_COMMENTS_QUERY = (
+    "SELECT p.change_seq, p.comment_id AS id, c.text, p.polarity_score, p.polarity_classification "
+    "FROM comment_polarity p JOIN comment c ON c.id = p.comment_id "
+    "WHERE p.subfeddit_id = $1 AND p.change_seq > $2 ORDER BY p.change_seq LIMIT $3;"
+)
+LIVE_WATERMARK_QUERY = "SELECT coalesce(max(change_seq), 0) FROM comment_polarity WHERE subfeddit_id = $1;"
+
+# Adds the scored comments selected by `{rows}`, with a sign of 1 to count them or -1 to uncount them, to the daily
+# sentiment counts of their subfeddit
+SENTIMENT_ROLLUP_DELTA = """
+    INSERT INTO subfeddit_sentiment_daily AS r
+        (subfeddit_id, day, positive, neutral, negative, polarity_sum)
+    SELECT d.subfeddit_id,
+           (to_timestamp(d.created_at) AT TIME ZONE 'UTC')::date,
+           coalesce(sum(d.sign) FILTER (WHERE d.polarity_classification = 'positive'), 0),
+           coalesce(sum(d.sign) FILTER (WHERE d.polarity_classification = 'neutral'), 0),
+           coalesce(sum(d.sign) FILTER (WHERE d.polarity_classification = 'negative'), 0),
+           sum(d.sign * d.polarity_score)
+    FROM ({rows}) d
+    GROUP BY 1, 2
+    ON CONFLICT (subfeddit_id, day) DO UPDATE SET
+        positive = r.positive + EXCLUDED.positive,
+        neutral = r.neutral + EXCLUDED.neutral,
+        negative = r.negative + EXCLUDED.negative,
+        polarity_sum = r.polarity_sum + EXCLUDED.polarity_sum
+"""
+SENTIMENT_ROLLUP_COLUMNS = "subfeddit_id, created_at, polarity_score, polarity_classification"
+
+# Key of the advisory lock serializing the creation of the service's tables by instances starting at once
+SCHEMA_LOCK_KEY = 7_340_112
+
+
+class SubfedditNotFoundError(ValueError):
+    """
+    Raised when no subfeddit has the requested name.
+    """
+
 
 class PostgreClient:
     """
     A client for interacting with a PostgreSQL database. This class provides methods to connect to the
     database, query subfeddit IDs, and retrieve comments from the database with filtering options.
+
+    Writes go to the primary of `DATABASE_URI`. The reads of the comments and subfeddits are load-balanced over the
+    healthy read replicas, if any, and go to the primary when none is healthy.
     """
 
-    def __init__(self):
+    def __init__(self, replica_urls: List[str] = DATABASE_REPLICA_URIS):
         """
         Initializes the PostgreClient instance to none.
+
+        Args:
+            replica_urls (List[str]): The connection URIs of the read replicas. Defaults to DATABASE_REPLICA_URIS.
         """
         self.pool = None
+        self.replicas = ReplicaSet(replica_urls, self.create_pool)
+
+        # Pool saturation counters
+        self.waiting = 0
+        self.acquire_count = 0
+        self.acquire_seconds_total = 0.0
+        self.acquire_seconds_max = 0.0
+
+    async def create_pool(self, dsn: str, **options) -> asyncpg.Pool:
+        """
+        Opens a connection pool, tuned by the DB_* settings. The queries run on every request are prepared
+        into the statement cache of each connection when the connection is opened.
+
+        Args:
+            dsn (str): The connection URI of the database.
+            **options: Connection options, e.g. the connection `timeout`.
+
+        Returns:
+            asyncpg.Pool: The pool.
+        """
+        return await asyncpg.create_pool(
+            dsn,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            command_timeout=DB_COMMAND_TIMEOUT,
+            max_queries=DB_MAX_QUERIES,
+            max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
+            init=self.prepare_connection,
+            **options,
+        )
 
     async def connect_to_db(self):
         """
-        Initializes the asyncpg connection pool.
+        Initializes the asyncpg connection pool of the primary, then the pools of the read replicas, which are
+        health-checked in the background.
+        """
+        self.pool = await self.create_pool(DATABASE_URL)
+        await self.replicas.open()
+
+    async def close(self):
+        """
+        Closes the asyncpg connection pools, waiting for the acquired connections to be released.
+        """
+        await self.replicas.close()
+
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            await pool.close()
+
+    @classmethod
+    def prepared_queries(cls) -> List[Tuple[str, list]]:
+        """
+        Lists the queries prepared on every connection: the subfeddit lookups, the polls of the live feeds, and each
+        shape of the `get_comments` query, i.e. each combination of the filters it can be built with. Each query
+        comes with parameters matching no rows, as the query is run once to be prepared.
+
+        Returns:
+            List[Tuple[str, list]]: The queries and their parameters.
+        """
+        queries = [(SUBFEDDIT_ID_QUERY, [""]), (SUBFEDDITS_QUERY, []), (LIVE_COMMENTS_QUERY, [0, 0, 1])]
+        polarity_filters = [(-1, 1, None), (0, 1, None), (-1, 1, "asc"), (-1, 1, "desc")]
+
+        for from_date, to_date, (min_polarity, max_polarity, polarity_sorting), after in itertools.product(
+            [None, "01-01-1970"], [None, "01-01-1970"], polarity_filters, [None, [0, 0]]
+        ):
+            queries.append(
+                cls._build_page_query(0, from_date, to_date, 1, min_polarity, max_polarity, polarity_sorting, after)
+            )
+
+        return queries
+
+    @classmethod
+    def query_shapes(cls) -> Dict[str, Tuple[str, list]]:
         """
-        self.pool = await asyncpg.create_pool(DATABASE_URL)
+        Lists the shapes of the queries run on every request, with example parameters, to check their plans:
+        the subfeddit lookup, the poll of the live feeds, and the `get_comments` query for each sort order, with the
+        filters it is most often built with.
+
+        Returns:
+            Dict[str, Tuple[str, list]]: The query and its parameters, by name of the shape.
+        """
+        shapes = {
+            "subfeddit_id": (SUBFEDDIT_ID_QUERY, ["example"]),
+            "live_comments": (LIVE_COMMENTS_QUERY, [1, 0, 500]),
+        }
+        filters = {
+            "latest": {},
+            "latest_next_page": {"after": [0, 0]},
+            "date_range": {"from_date": "01-01-2022", "to_date": "31-01-2022"},
+            "polarity_desc": {"polarity_sorting": "desc"},
+            "polarity_range": {"min_polarity": 0.1},
+            "search": {"search": "example"},
+        }
+
+        for name, options in filters.items():
+            shapes[f"comments_{name}"] = cls._build_page_query(1, n_comments=25, **options)
+
+        return shapes
+
+    async def prepare_connection(self, conn: asyncpg.Connection):
+        """
+        Prepares the queries of `prepared_queries` on a new connection of the pool. asyncpg prepares each query the
+        first time it runs on a connection and keeps the statement in its statement cache, so running each query once
+        spares that round trip to the first requests served by the connection.
+
+        Args:
+            conn (asyncpg.Connection): The new connection.
+        """
+        for query, params in self.prepared_queries():
+            try:
+                await conn.fetch(query, *params)
+            except (asyncpg.UndefinedTableError, asyncpg.UndefinedColumnError):
+                # The service's own tables and columns do not exist yet on the first start, or the first one after
+                # they were added, these queries will be prepared on their first run instead
+                pass
+
+    @asynccontextmanager
+    async def acquire(self, read_only: bool = False):
+        """
+        Acquires a connection from the pool, recording how long it took and how many callers are waiting.
+        Read-only connections are acquired from a healthy read replica when there is one, and from the primary
+        when the replica fails to provide one.
+
+        Args:
+            read_only (bool): Whether the connection is only used to read. Defaults to False.
+
+        Yields:
+            The acquired connection, released on exit.
+        """
+        replica = self.replicas.choose() if read_only else None
+
+        self.waiting += 1
+        start = time.perf_counter()
+        acquired = False
+        try:
+            async with AsyncExitStack() as stack:
+                if replica is None:
+                    conn = await stack.enter_async_context(self.pool.acquire())
+                else:
+                    try:
+                        conn = await stack.enter_async_context(replica.pool.acquire())
+                        replica.acquire_count += 1
+                    except CONNECTION_ERRORS as e:
+                        # Fail over to the primary
+                        self.replicas.mark_failed(replica, e)
+                        replica = None
+                        conn = await stack.enter_async_context(self.pool.acquire())
+
+                acquired = True
+                self.waiting -= 1
+                elapsed = time.perf_counter() - start
+                self.acquire_count += 1
+                self.acquire_seconds_total += elapsed
+                self.acquire_seconds_max = max(self.acquire_seconds_max, elapsed)
+                metrics.record_stage("pool_acquire", elapsed)
+                try:
+                    yield conn
+                except CONNECTION_ERRORS as e:
+                    # The replica was lost while in use, keep the next reads away from it. A query running out of
+                    # time, e.g. past the deadline of its request, does not tell the replica is lost.
+                    if replica is not None and not isinstance(e, asyncio.TimeoutError):
+                        self.replicas.mark_failed(replica, e)
+                    raise
+        finally:
+            # The caller stopped waiting without getting a connection, e.g. on a timeout
+            if not acquired:
+                self.waiting -= 1
+
+    def pool_stats(self) -> dict:
+        """
+        Returns the saturation metrics of the connection pools.
+
+        Returns:
+            dict: The size limits and the connections in use and idle of the primary pool, the callers waiting for
+            a connection and the number and latency of the connection acquisitions over all the pools, and the state
+            of each read replica.
+        """
+        stats = {
+            "waiting": self.waiting,
+            "acquire_count": self.acquire_count,
+            "acquire_seconds_total": self.acquire_seconds_total,
+            "acquire_seconds_max": self.acquire_seconds_max,
+        }
+
+        if self.pool is not None:
+            stats.update(
+                min_size=self.pool.get_min_size(),
+                max_size=self.pool.get_max_size(),
+                size=self.pool.get_size(),
+                idle=self.pool.get_idle_size(),
+                in_use=self.pool.get_size() - self.pool.get_idle_size(),
+            )
+
+        stats["replicas"] = self.replicas.stats()
+        return stats
 
     async def get_subfeddit_id(self, subfeddit_name: str) -> int:
         """
@@ -35,45 +295,108 @@ class PostgreClient:
             int: The ID of the subfeddit.
 
         Raises:
-            ValueError: If no subfeddit is found with the given name.
+            SubfedditNotFoundError: If no subfeddit is found with the given name.
         """
-        query = "SELECT id FROM subfeddit WHERE title = $1;"
+        query = SUBFEDDIT_ID_QUERY
 
-        async with self.pool.acquire() as conn:
-            row = await conn.fetchrow(query, subfeddit_name)
+        async with self.acquire(read_only=True) as conn:
+            with metrics.stage("get_subfeddit_id"):
+                row = await conn.fetchrow(query, subfeddit_name, timeout=deadline.remaining())
             if row:
                 return row["id"]
             else:
-                raise ValueError(f"Subfeddit '{subfeddit_name}' not found.")
+                raise SubfedditNotFoundError(f"Subfeddit '{subfeddit_name}' not found.")
 
-    async def get_comments(
-        self,
+    async def get_subfeddits(self) -> Dict[str, int]:
+        """
+        Fetches the IDs of all the subfeddits in a single query.
+
+        Returns:
+            Dict[str, int]: The ID of each subfeddit, by name.
+        """
+        query = SUBFEDDITS_QUERY
+
+        async with self.acquire(read_only=True) as conn:
+            rows = await conn.fetch(query)
+            return {row["title"]: row["id"] for row in rows}
+
+    async def connect(self) -> asyncpg.Connection:
+        """
+        Opens a connection to the primary outside of the pool, without the pool's command timeout.
+
+        Returns:
+            asyncpg.Connection: The connection, to be closed by the caller.
+        """
+        return await asyncpg.connect(DATABASE_URL)
+
+    async def listen(self, channel: str, callback: Callable) -> asyncpg.Connection:
+        """
+        Opens a dedicated connection listening to the notifications sent on a channel, so that listening
+        does not hold a connection of the pool.
+
+        Args:
+            channel (str): The channel to listen to.
+            callback (Callable): Called with (connection, pid, channel, payload) for each notification.
+
+        Returns:
+            asyncpg.Connection: The listening connection, to be closed to stop listening.
+        """
+        conn = await self.connect()
+        await conn.add_listener(channel, callback)
+        return conn
+
+    @staticmethod
+    def _build_comments_query(
         subfeddit_id: str,
         from_date: str = None,
         to_date: str = None,
-        n_comments: int = 25,
-    ) -> list:
+        min_polarity: float = -1,
+        max_polarity: float = 1,
+        polarity_sorting: str = None,
+        after: Optional[List] = None,
+        subfeddit: str = "$1",
+        search: Optional[str] = None,
+    ) -> Tuple[str, list]:
         """
-        Retrieves comments from the database for a given subfeddit, with optional filtering by date range and number.
+        Builds the query selecting the comments of a subfeddit matching the filters, in order, without limit.
+        See `get_comments` for the meaning of the arguments. The subfeddit_id is always the first parameter;
+        `subfeddit` is the SQL expression the comments' subfeddit is compared to, which is that parameter by default.
 
-        Args:
-            subfeddit_id (str): The ID of the subfeddit for which comments are to be fetched.
-            from_date (str, optional): The start date for filtering comments. Defaults to None.
-            to_date (str, optional): The end date for filtering comments. Defaults to None.
-            n_comments (int, optional): The maximum number of comments to retrieve. Defaults to 25.
+        The stored scores are not checked against the text of the comments, which would hash every comment read: the
+        scoring workers score the edited comments again when they rescan them.
 
         Returns:
-            list: A list of comments, each represented as a dictionary containing the comment data.
+            Tuple[str, list]: The query and its parameters.
         """
-        query = f"SELECT id, text FROM comment WHERE subfeddit_id = $1"
-        params = [subfeddit_id]
+        params = [subfeddit_id, SCORER_VERSION]
+        filter_by_polarity = (
+            polarity_sorting is not None or min_polarity > -1 or max_polarity < 1
+        )
+
+        if filter_by_polarity:
+            # Start from the scored comments, so that the polarity index is used for filtering and sorting
+            query = (
+                "SELECT c.id, c.text, p.polarity_score, p.polarity_classification, p.created_at "
+                "FROM comment_polarity p JOIN comment c ON c.id = p.comment_id "
+                f"WHERE p.subfeddit_id = {subfeddit} AND p.scorer_version = $2"
+            )
+            created_at, comment_id = "p.created_at", "p.comment_id"
+        else:
+            # Start from all the comments, the ones not scored yet have no polarity
+            query = (
+                "SELECT c.id, c.text, p.polarity_score, p.polarity_classification, c.created_at "
+                "FROM comment c LEFT JOIN comment_polarity p "
+                "ON p.comment_id = c.id AND p.scorer_version = $2 "
+                f"WHERE c.subfeddit_id = {subfeddit}"
+            )
+            created_at, comment_id = "c.created_at", "c.id"
 
         # If a from_date is provided, add it to the query to filter comments created after the specified date
         if from_date:
             start_date = datetime.strptime(from_date, "%d-%m-%Y")
             start_unix_timestamp = int(start_date.timestamp())
 
-            query += " AND created_at >= $2"
+            query += f" AND {created_at} >= ${len(params)+1}"
             params.append(start_unix_timestamp)
 
         # If a to_date is provided, add it to the query to filter comments created before the specified date
@@ -81,14 +404,605 @@ class PostgreClient:
             end_date = datetime.strptime(to_date, "%d-%m-%Y")
             end_unix_timestamp = int(end_date.timestamp())
 
-            query += f" AND created_at <= ${len(params)+1}"
+            query += f" AND {created_at} <= ${len(params)+1}"
             params.append(end_unix_timestamp)
 
+        # If a search is given, keep the comments matching it, with the full-text index of the comments
+        if search:
+            query += f" AND {SEARCH_DOCUMENT} @@ websearch_to_tsquery('{SEARCH_CONFIG}', ${len(params)+1})"
+            params.append(search)
+
+        # If the comments are filtered by polarity, keep the ones within the polarity range
+        if filter_by_polarity:
+            query += f" AND p.polarity_score BETWEEN ${len(params)+1} AND ${len(params)+2}"
+            params.extend([min_polarity, max_polarity])
+
+        # Sort by polarity if requested, from the most recent to the oldest otherwise
+        if polarity_sorting:
+            sort_columns = f"p.polarity_score, {comment_id}"
+            direction = "DESC" if polarity_sorting == "desc" else "ASC"
+        else:
+            sort_columns = f"{created_at}, {comment_id}"
+            direction = "DESC"
+
+        # If a page was already returned, continue after its last comment
+        if after:
+            operator = "<" if direction == "DESC" else ">"
+            query += f" AND ({sort_columns}) {operator} (${len(params)+1}, ${len(params)+2})"
+            params.extend(after)
+
+        query += " ORDER BY " + ", ".join(
+            f"{column} {direction}" for column in sort_columns.split(", ")
+        )
+
+        return query, params
+
+    @classmethod
+    def _build_page_query(
+        cls,
+        subfeddit_id: str,
+        from_date: str = None,
+        to_date: str = None,
+        n_comments: int = 25,
+        min_polarity: float = -1,
+        max_polarity: float = 1,
+        polarity_sorting: str = None,
+        after: Optional[List] = None,
+        subfeddit: str = "$1",
+        search: Optional[str] = None,
+    ) -> Tuple[str, list]:
+        """
+        Builds the query selecting a page of comments, i.e. the comments query limited to `n_comments`.
+        See `get_comments` and `_build_comments_query` for the meaning of the arguments.
+
+        Returns:
+            Tuple[str, list]: The query and its parameters.
+        """
+        query, params = cls._build_comments_query(
+            subfeddit_id, from_date, to_date, min_polarity, max_polarity, polarity_sorting, after, subfeddit, search
+        )
+
         # Limit the number of comments retrieved based on n_comments
-        query += f" ORDER BY created_at DESC LIMIT ${len(params)+1};"
+        query += f" LIMIT ${len(params)+1};"
         params.append(n_comments)
 
-        # Executing the query and fetching all results
-        async with self.pool.acquire() as conn:
+        return query, params
+
+    async def get_comments(
+        self,
+        subfeddit_id: str,
+        from_date: str = None,
+        to_date: str = None,
+        n_comments: int = 25,
+        min_polarity: float = -1,
+        max_polarity: float = 1,
+        polarity_sorting: str = None,
+        after: Optional[List] = None,
+        search: Optional[str] = None,
+    ) -> list:
+        """
+        Retrieves comments from the database for a given subfeddit, with optional filtering by date range and number,
+        along with their precomputed polarity scores and creation date.
+
+        When the comments are filtered or sorted by polarity, the filtering and sorting are done by the database on the
+        `comment_polarity` table, so only the comments with a precomputed score of the current scorer version are
+        returned. Otherwise, the comments without one are returned with a None polarity score and classification.
+
+        Pages are walked with keyset predicates: `after` holds the sort key of the last comment of the previous page,
+        i.e. its (created_at, id), or its (polarity_score, id) when sorted by polarity, so every page costs the same.
+
+        A search only keeps the comments matching it, through the full-text index of the comments created by the
+        `comment_text_search` migration, and combines with the other filters and the sort order.
+
+        Args:
+            subfeddit_id (str): The ID of the subfeddit for which comments are to be fetched.
+            from_date (str, optional): The start date for filtering comments. Defaults to None.
+            to_date (str, optional): The end date for filtering comments. Defaults to None.
+            n_comments (int, optional): The maximum number of comments to retrieve. Defaults to 25.
+            min_polarity (float, optional): The minimum polarity score of the comments. Defaults to -1.
+            max_polarity (float, optional): The maximum polarity score of the comments. Defaults to 1.
+            polarity_sorting (str, optional): 'asc' or 'desc' to sort comments by polarity score. Defaults to None.
+            after (List, optional): The sort key of the last comment of the previous page. Defaults to None.
+            search (str, optional): A web search style query, e.g. `checkout -paypal`, the comments must match.
+                Defaults to None.
+
+        Returns:
+            list: A list of comments, each a read-only record of the comment data, accessed like a dictionary.
+        """
+        query, params = self._build_page_query(
+            subfeddit_id,
+            from_date,
+            to_date,
+            n_comments,
+            min_polarity,
+            max_polarity,
+            polarity_sorting,
+            after,
+            search=search,
+        )
+
+        # Executing the query and fetching all results, the records are returned as they are rather than copied.
+        # The query is cancelled when the deadline of the request passes.
+        async with self.acquire(read_only=True) as conn:
+            with metrics.stage("get_comments_sql"):
+                return await conn.fetch(query, *params, timeout=deadline.remaining())
+
+    async def get_comments_by_title(
+        self,
+        subfeddit_name: str,
+        from_date: str = None,
+        to_date: str = None,
+        n_comments: int = 25,
+        min_polarity: float = -1,
+        max_polarity: float = 1,
+        polarity_sorting: str = None,
+        after: Optional[List] = None,
+        search: Optional[str] = None,
+    ) -> Tuple[int, list]:
+        """
+        Retrieves the ID of a subfeddit and a page of its comments in a single round trip, resolving the subfeddit
+        by name within the comments query. The comments are the same as the ones of `get_comments`.
+
+        Args:
+            subfeddit_name (str): The name of the subfeddit for which comments are to be fetched.
+            from_date (str, optional): The start date for filtering comments. Defaults to None.
+            to_date (str, optional): The end date for filtering comments. Defaults to None.
+            n_comments (int, optional): The maximum number of comments to retrieve. Defaults to 25.
+            min_polarity (float, optional): The minimum polarity score of the comments. Defaults to -1.
+            max_polarity (float, optional): The maximum polarity score of the comments. Defaults to 1.
+            polarity_sorting (str, optional): 'asc' or 'desc' to sort comments by polarity score. Defaults to None.
+            after (List, optional): The sort key of the last comment of the previous page. Defaults to None.
+            search (str, optional): A web search style query, e.g. `checkout -paypal`, the comments must match.
+                Defaults to None.
+
+        Returns:
+            Tuple[int, list]: The ID of the subfeddit, and a list of comments, each a read-only record of the comment
+            data, accessed like a dictionary. The records also hold the 'subfeddit_id'.
+
+        Raises:
+            SubfedditNotFoundError: If no subfeddit is found with the given name.
+        """
+        page_query, params = self._build_page_query(
+            subfeddit_name,
+            from_date,
+            to_date,
+            n_comments,
+            min_polarity,
+            max_polarity,
+            polarity_sorting,
+            after,
+            subfeddit="s.id",
+            search=search,
+        )
+
+        # The page is joined to the subfeddit, so that an existing subfeddit without comments still returns
+        # one row, with null comment columns, while an unknown subfeddit returns no row at all
+        if polarity_sorting:
+            direction = "DESC" if polarity_sorting == "desc" else "ASC"
+            order = f"page.polarity_score {direction}, page.id {direction}"
+        else:
+            order = "page.created_at DESC, page.id DESC"
+
+        query = (
+            "WITH s AS (SELECT id FROM subfeddit WHERE title = $1) "
+            f"SELECT s.id AS subfeddit_id, page.* FROM s LEFT JOIN LATERAL ({page_query.rstrip(';')}) page ON true "
+            f"ORDER BY {order};"
+        )
+
+        async with self.acquire(read_only=True) as conn:
+            with metrics.stage("get_comments_sql"):
+                rows = await conn.fetch(query, *params, timeout=deadline.remaining())
+
+        if not rows:
+            raise SubfedditNotFoundError(f"Subfeddit '{subfeddit_name}' not found.")
+
+        return rows[0]["subfeddit_id"], [row for row in rows if row["id"] is not None]
+
+    async def stream_comments(
+        self,
+        subfeddit_id: str,
+        from_date: str = None,
+        to_date: str = None,
+        min_polarity: float = -1,
+        max_polarity: float = 1,
+        polarity_sorting: str = None,
+        batch_size: int = 500,
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Streams all the comments of a given subfeddit matching the filters, in batches read from a server-side cursor,
+        so that only one batch is held in memory at a time. The comments are the same as the ones of `get_comments`.
+
+        Args:
+            subfeddit_id (str): The ID of the subfeddit for which comments are to be streamed.
+            from_date (str, optional): The start date for filtering comments. Defaults to None.
+            to_date (str, optional): The end date for filtering comments. Defaults to None.
+            min_polarity (float, optional): The minimum polarity score of the comments. Defaults to -1.
+            max_polarity (float, optional): The maximum polarity score of the comments. Defaults to 1.
+            polarity_sorting (str, optional): 'asc' or 'desc' to sort comments by polarity score. Defaults to None.
+            batch_size (int, optional): The number of comments fetched from the cursor at once. Defaults to 500.
+
+        Yields:
+            list: The next batch of comments, as read-only records.
+        """
+        query, params = self._build_comments_query(
+            subfeddit_id, from_date, to_date, min_polarity, max_polarity, polarity_sorting
+        )
+
+        # Server-side cursors only live within a transaction
+        async with self.acquire(read_only=True) as conn:
+            async with conn.transaction(readonly=True):
+                cursor = await conn.cursor(query, *params)
+                while True:
+                    rows = await cursor.fetch(batch_size)
+                    if not rows:
+                        return
+                    yield rows
+
+    async def get_live_watermark(self, subfeddit_id: int) -> int:
+        """
+        Fetches the change sequence number of the last comment of a subfeddit scored, from which its live feed starts.
+
+        Args:
+            subfeddit_id (int): The ID of the subfeddit.
+
+        Returns:
+            int: The greatest change sequence number of the comments of the subfeddit, 0 when none is scored yet.
+        """
+        query = LIVE_WATERMARK_QUERY
+
+        async with self.acquire(read_only=True) as conn:
+            return await conn.fetchval(query, subfeddit_id)
+
+    async def get_live_comments(self, subfeddit_id: int, after_seq: int, limit: int = 500) -> list:
+        """
+        Retrieves, in the order they were scored, the comments of a subfeddit scored after a watermark, with their
+        polarity scores and change sequence numbers. It is the poll of the live feed of the subfeddit.
+
+        Args:
+            subfeddit_id (int): The ID of the subfeddit.
+            after_seq (int): The watermark, the change sequence number of the last comment already read.
+            limit (int, optional): The maximum number of comments to retrieve. Defaults to 500.
+
+        Returns:
+            list: The comments, as read-only records.
+        """
+        query = LIVE_COMMENTS_QUERY
+
+        async with self.acquire(read_only=True) as conn:
+            with metrics.stage("get_live_comments_sql"):
+                return await conn.fetch(query, subfeddit_id, after_seq, limit)
+
+    async def get_unscored_comments(
+        self, after_id: int = 0, limit: int = 500, shard_count: int = 1, shard_index: int = 0
+    ) -> List[dict]:
+        """
+        Retrieves, in ID order, the comments that have no precomputed polarity score, or whose score is stale because
+        their text or the scorer version changed.
+
+        Args:
+            after_id (int, optional): Only comments with an ID greater than this one are retrieved. Defaults to 0.
+            limit (int, optional): The maximum number of comments to retrieve. Defaults to 500.
+            shard_count (int, optional): The number of shards the comments are split into by ID. Defaults to 1.
+            shard_index (int, optional): The shard to retrieve, i.e. the comments whose ID modulo `shard_count`
+                is `shard_index`. Defaults to 0.
+
+        Returns:
+            List[dict]: The comments to be scored, with their 'id' and 'text'.
+        """
+        query = (
+            "SELECT c.id, c.text FROM comment c "
+            "LEFT JOIN comment_polarity p ON p.comment_id = c.id "
+            "WHERE c.id > $1 AND (p.comment_id IS NULL OR p.scorer_version <> $2 OR p.text_hash <> md5(c.text)) "
+        )
+        params = [after_id, SCORER_VERSION]
+
+        # Keep only the comments of the shard, when they are split between several workers
+        if shard_count > 1:
+            query += f"AND c.id % ${len(params)+1} = ${len(params)+2} "
+            params.extend([shard_count, shard_index])
+
+        query += f"ORDER BY c.id LIMIT ${len(params)+1};"
+        params.append(limit)
+
+        async with self.acquire() as conn:
             rows = await conn.fetch(query, *params)
             return [dict(row) for row in rows]
+
+    async def execute_schema(self, query: str):
+        """
+        Runs schema statements in a transaction holding an advisory lock, so that API instances and workers
+        starting at the same time do not create the same tables concurrently, which `IF NOT EXISTS` does not prevent.
+
+        Args:
+            query (str): The schema statements.
+        """
+        async with self.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1);", SCHEMA_LOCK_KEY)
+                await conn.execute(query)
+
+    @asynccontextmanager
+    async def try_advisory_lock(self, key: int):
+        """
+        Holds a session advisory lock for the duration of the block, unless another session holds it, so that a
+        background job runs in a single process at a time.
+
+        Args:
+            key (int): The key of the lock.
+
+        Yields:
+            bool: Whether the lock was acquired. It is released on exit.
+        """
+        async with self.acquire() as conn:
+            locked = await conn.fetchval("SELECT pg_try_advisory_lock($1);", key)
+            try:
+                yield locked
+            finally:
+                if locked:
+                    await conn.execute("SELECT pg_advisory_unlock($1);", key)
+
+    async def create_checkpoint_table(self):
+        """
+        Creates the `scoring_checkpoint` table, where the scoring workers record the last comment ID they processed,
+        if it does not exist yet.
+        """
+        query = """
+            CREATE TABLE IF NOT EXISTS scoring_checkpoint (
+                name TEXT PRIMARY KEY,
+                last_id BIGINT NOT NULL,
+                updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        """
+
+        await self.execute_schema(query)
+
+    async def get_last_comment_id(self) -> int:
+        """
+        Retrieves the greatest comment ID, up to which a scoring worker scanning the comments has seen them all.
+
+        Returns:
+            int: The greatest comment ID, 0 when there is no comment.
+        """
+        query = "SELECT coalesce(max(id), 0) FROM comment;"
+
+        async with self.acquire() as conn:
+            return await conn.fetchval(query)
+
+    async def get_checkpoint(self, name: str) -> int:
+        """
+        Retrieves the last comment ID processed by a scoring worker.
+
+        Args:
+            name (str): The name of the checkpoint.
+
+        Returns:
+            int: The last processed comment ID, 0 if the checkpoint does not exist yet.
+        """
+        query = "SELECT last_id FROM scoring_checkpoint WHERE name = $1;"
+
+        async with self.acquire() as conn:
+            last_id = await conn.fetchval(query, name)
+            return last_id or 0
+
+    async def store_checkpoint(self, name: str, last_id: int):
+        """
+        Records the last comment ID processed by a scoring worker.
+
+        Args:
+            name (str): The name of the checkpoint.
+            last_id (int): The last processed comment ID.
+        """
+        query = (
+            "INSERT INTO scoring_checkpoint (name, last_id) VALUES ($1, $2) "
+            "ON CONFLICT (name) DO UPDATE SET last_id = EXCLUDED.last_id, updated_at = now();"
+        )
+
+        async with self.acquire() as conn:
+            await conn.execute(query, name, last_id)
+
+    async def create_polarity_table(self):
+        """
+        Creates the `comment_polarity` side table, where the polarity scores of the comments are stored,
+        and its indexes if they do not exist yet. The subfeddit and creation date of the comments are copied
+        into the table, so that comments can be filtered and sorted by polarity using its index alone.
+
+        Each write of a score takes the next change sequence number, so that the live feeds read the comments in the
+        order they are scored, whatever their ID, and read the comments scored again as well.
+        """
+        query = """
+            CREATE SEQUENCE IF NOT EXISTS comment_polarity_change_seq;
+            CREATE TABLE IF NOT EXISTS comment_polarity (
+                comment_id BIGINT PRIMARY KEY,
+                subfeddit_id BIGINT NOT NULL,
+                created_at BIGINT NOT NULL,
+                text_hash TEXT NOT NULL,
+                scorer_version TEXT NOT NULL,
+                polarity_score DOUBLE PRECISION NOT NULL,
+                polarity_classification TEXT NOT NULL,
+                scored_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+                change_seq BIGINT DEFAULT nextval('comment_polarity_change_seq')
+            );
+
+            -- Tables created before the change sequence numbers: the column is added without rewriting the table, and
+            -- the comments scored before have none, as the live feeds start from the comments scored after them
+            DO $$
+            BEGIN
+                IF NOT EXISTS (
+                    SELECT FROM pg_attribute
+                    WHERE attrelid = 'comment_polarity'::regclass AND attname = 'change_seq' AND NOT attisdropped
+                ) THEN
+                    ALTER TABLE comment_polarity ADD COLUMN change_seq BIGINT;
+                    ALTER TABLE comment_polarity ALTER COLUMN change_seq SET DEFAULT nextval('comment_polarity_change_seq');
+                END IF;
+            END $$;
+
+            CREATE INDEX IF NOT EXISTS comment_polarity_subfeddit_polarity_idx
+                ON comment_polarity (subfeddit_id, polarity_score, comment_id);
+            CREATE INDEX IF NOT EXISTS comment_polarity_subfeddit_created_at_idx
+                ON comment_polarity (subfeddit_id, created_at, comment_id);
+            CREATE INDEX IF NOT EXISTS comment_polarity_subfeddit_change_seq_idx
+                ON comment_polarity (subfeddit_id, change_seq);
+        """
+
+        await self.execute_schema(query)
+
+    async def create_sentiment_rollup(self):
+        """
+        Creates the `subfeddit_sentiment_daily` rollup table, which counts the scored comments of each subfeddit per day
+        and sentiment classification, and the triggers keeping it up to date as rows of `comment_polarity` are inserted,
+        updated or deleted. When the table is created, it is filled from the comments already scored.
+        """
+        count_new_rows = SENTIMENT_ROLLUP_DELTA.format(
+            rows=f"SELECT 1 AS sign, {SENTIMENT_ROLLUP_COLUMNS} FROM new_rows"
+        )
+        uncount_old_rows = SENTIMENT_ROLLUP_DELTA.format(
+            rows=f"SELECT -1 AS sign, {SENTIMENT_ROLLUP_COLUMNS} FROM old_rows"
+        )
+        count_all_rows = SENTIMENT_ROLLUP_DELTA.format(
+            rows=f"SELECT 1 AS sign, {SENTIMENT_ROLLUP_COLUMNS} FROM comment_polarity"
+        )
+
+        # The triggers run once per statement, so that a batch of scores updates each day of the rollup once
+        query = f"""
+            CREATE TABLE subfeddit_sentiment_daily (
+                subfeddit_id BIGINT NOT NULL,
+                day DATE NOT NULL,
+                positive BIGINT NOT NULL,
+                neutral BIGINT NOT NULL,
+                negative BIGINT NOT NULL,
+                polarity_sum DOUBLE PRECISION NOT NULL,
+                PRIMARY KEY (subfeddit_id, day)
+            );
+
+            CREATE OR REPLACE FUNCTION comment_polarity_rollup() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    {count_new_rows};
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    {uncount_old_rows};
+                END IF;
+                RETURN NULL;
+            END;
+            $$;
+
+            CREATE OR REPLACE TRIGGER comment_polarity_rollup_insert AFTER INSERT ON comment_polarity
+                REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION comment_polarity_rollup();
+            CREATE OR REPLACE TRIGGER comment_polarity_rollup_update AFTER UPDATE ON comment_polarity
+                REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+                FOR EACH STATEMENT EXECUTE FUNCTION comment_polarity_rollup();
+            CREATE OR REPLACE TRIGGER comment_polarity_rollup_delete AFTER DELETE ON comment_polarity
+                REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION comment_polarity_rollup();
+
+            {count_all_rows};
+        """
+
+        exists_query = "SELECT to_regclass('subfeddit_sentiment_daily');"
+
+        async with self.acquire() as conn:
+            # The rollup exists on every start but the first one, which is the only one to block the writers
+            if await conn.fetchval(exists_query) is not None:
+                return
+
+            async with conn.transaction():
+                # Block the writers of comment_polarity, so that no score is missed or counted twice while filling the
+                # table, then check again, as another instance may have created it meanwhile
+                await conn.execute("LOCK TABLE comment_polarity IN SHARE ROW EXCLUSIVE MODE;")
+                if await conn.fetchval(exists_query) is None:
+                    await conn.execute(query)
+
+    async def get_sentiment(
+        self,
+        subfeddit_id: int,
+        from_date: str = None,
+        to_date: str = None,
+        bucket: str = "day",
+    ) -> List[dict]:
+        """
+        Retrieves the sentiment distribution of the scored comments of a subfeddit over time, from the rollup table.
+
+        Args:
+            subfeddit_id (int): The ID of the subfeddit.
+            from_date (str): The first day to include, formatted as DD-MM-YYYY. Defaults to None.
+            to_date (str): The last day to include, formatted as DD-MM-YYYY. Defaults to None.
+            bucket (str): The size of the time buckets, 'day', 'week' or 'month'. Defaults to 'day'.
+
+        Returns:
+            List[dict]: For each bucket with scored comments, in chronological order, its first day, the number of
+            positive, neutral and negative comments and the sum of their polarity scores.
+        """
+        query = (
+            "SELECT date_trunc($2, day::timestamp)::date AS bucket, sum(positive)::bigint AS positive, "
+            "sum(neutral)::bigint AS neutral, sum(negative)::bigint AS negative, sum(polarity_sum) AS polarity_sum "
+            "FROM subfeddit_sentiment_daily WHERE subfeddit_id = $1"
+        )
+        params = [subfeddit_id, bucket]
+
+        # If a from_date or a to_date is provided, keep the days within the range
+        if from_date:
+            query += f" AND day >= ${len(params)+1}"
+            params.append(datetime.strptime(from_date, "%d-%m-%Y").date())
+
+        if to_date:
+            query += f" AND day <= ${len(params)+1}"
+            params.append(datetime.strptime(to_date, "%d-%m-%Y").date())
+
+        query += " GROUP BY 1 ORDER BY 1;"
+
+        async with self.acquire() as conn:
+            with metrics.stage("get_sentiment_sql"):
+                rows = await conn.fetch(query, *params, timeout=deadline.remaining())
+            return [dict(row) for row in rows]
+
+    async def get_polarities(self, comment_ids: List[int]) -> List[dict]:
+        """
+        Retrieves the stored polarity scores of the given comments.
+
+        Args:
+            comment_ids (List[int]): The IDs of the comments whose polarity scores are to be fetched.
+
+        Returns:
+            List[dict]: The stored scores, with the text hash and scorer version they were computed with.
+        """
+        query = (
+            "SELECT comment_id, text_hash, scorer_version, polarity_score, polarity_classification "
+            "FROM comment_polarity WHERE comment_id = ANY($1::bigint[]);"
+        )
+
+        async with self.acquire() as conn:
+            rows = await conn.fetch(query, comment_ids)
+            return [dict(row) for row in rows]
+
+    async def store_polarities(self, polarities: List[tuple]):
+        """
+        Inserts or updates the polarity scores of comments in the `comment_polarity` table, in a single statement.
+        The subfeddit and creation date of the comments are taken from the `comment` table, and each score written
+        takes the next change sequence number.
+
+        Args:
+            polarities (List[tuple]): Tuples of (comment_id, text_hash, scorer_version, polarity_score,
+                polarity_classification).
+        """
+        query = """
+            INSERT INTO comment_polarity
+                (comment_id, subfeddit_id, created_at, text_hash, scorer_version,
+                 polarity_score, polarity_classification)
+            SELECT c.id, c.subfeddit_id, c.created_at, s.text_hash, s.scorer_version,
+                   s.polarity_score, s.polarity_classification
+            FROM unnest($1::bigint[], $2::text[], $3::text[], $4::float8[], $5::text[])
+                AS s(comment_id, text_hash, scorer_version, polarity_score, polarity_classification)
+            JOIN comment c ON c.id = s.comment_id
+            ON CONFLICT (comment_id) DO UPDATE SET
+                text_hash = EXCLUDED.text_hash,
+                scorer_version = EXCLUDED.scorer_version,
+                polarity_score = EXCLUDED.polarity_score,
+                polarity_classification = EXCLUDED.polarity_classification,
+                scored_at = now(),
+                change_seq = EXCLUDED.change_seq;
+        """
+
+        if not polarities:
+            return
+
+        async with self.acquire() as conn:
+            await conn.execute(query, *(list(column) for column in zip(*polarities)))
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional
+from urllib.parse import urlsplit
+
+import asyncpg
+
+# Comma-separated connection URIs of the read replicas of the feddit database, none by default
+DATABASE_REPLICA_URIS = [
+    uri.strip() for uri in os.getenv("DATABASE_REPLICA_URIS", "").split(",") if uri.strip()
+]
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 0)) or None
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 5))
+DB_REPLICA_CHECK_TIMEOUT = float(os.getenv("DB_REPLICA_CHECK_TIMEOUT", 2))
+
+# Seconds the replica is behind the primary, and whether it receives the WAL of the primary. A replica streaming the
+# WAL that replayed all of it is up to date, even when its last replayed transaction is old because nothing was
+# written since; a replica that lost its connection to the primary is as far behind as its last replayed transaction.
+# The status of the WAL receiver is only visible to the roles with pg_read_all_stats, a running receiver is deemed
+# streaming for the others.
+REPLICATION_LAG_QUERY = """
+    SELECT
+        CASE
+            WHEN NOT pg_is_in_recovery() THEN 0
+            WHEN streaming AND pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+            ELSE coalesce(extract(epoch FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END::float8 AS lag,
+        NOT pg_is_in_recovery() OR streaming AS streaming
+    FROM (
+        SELECT EXISTS (
+            SELECT FROM pg_stat_wal_receiver WHERE coalesce(status, 'streaming') = 'streaming'
+        ) AS streaming
+    ) AS receiver;
+"""
+
+# Errors telling that a replica cannot serve queries, rather than that a query is wrong
+CONNECTION_ERRORS = (
+    OSError,
+    asyncio.TimeoutError,
+    asyncpg.PostgresConnectionError,
+    asyncpg.CannotConnectNowError,
+    asyncpg.InterfaceError,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class Replica:
+    """
+    A read replica, with its connection pool and the outcome of its last health check.
+    """
+
+    def __init__(self, uri: str):
+        """
+        Initializes the Replica instance, unhealthy until it is checked.
+
+        Args:
+            uri (str): The connection URI of the replica.
+        """
+        self.uri = uri
+        self.pool = None
+        self.healthy = False
+        self.lag: Optional[float] = None
+        self.acquire_count = 0
+        self.failures = 0
+
+    @property
+    def name(self) -> str:
+        """
+        The host and port of the replica, without the credentials of its URI.
+        """
+        parts = urlsplit(self.uri)
+        return f"{parts.hostname}:{parts.port or 5432}"
+
+    def stats(self) -> dict:
+        return {
+            "name": self.name,
+            "healthy": self.healthy,
+            "lag_seconds": self.lag,
+            "acquire_count": self.acquire_count,
+            "failures": self.failures,
+        }
+
+
+class ReplicaSet:
+    """
+    Load-balances the reads over the healthy read replicas of the database. The replicas are checked in the
+    background: one is healthy when it answers within `check_timeout` seconds and, if `max_lag` is set, is at most
+    `max_lag` seconds behind the primary. A replica failing to serve a connection is set aside until its next
+    successful check, and the reads fall back to the primary when no replica is healthy.
+    """
+
+    def __init__(
+        self,
+        uris: List[str],
+        create_pool: Callable[..., Awaitable[asyncpg.Pool]],
+        max_lag: Optional[float] = DB_REPLICA_MAX_LAG,
+        check_interval: float = DB_REPLICA_CHECK_INTERVAL,
+        check_timeout: float = DB_REPLICA_CHECK_TIMEOUT,
+    ):
+        """
+        Initializes the ReplicaSet instance, without connecting to the replicas.
+
+        Args:
+            uris (List[str]): The connection URIs of the replicas.
+            create_pool (Callable[..., Awaitable[asyncpg.Pool]]): Opens the pool of a replica, given its URI and the
+                connection timeout.
+            max_lag (Optional[float]): The replication lag above which a replica is not used, in seconds, or None for
+                no limit. Defaults to DB_REPLICA_MAX_LAG.
+            check_interval (float): Seconds between two health checks. Defaults to DB_REPLICA_CHECK_INTERVAL.
+            check_timeout (float): Seconds a replica has to answer a health check. Defaults to DB_REPLICA_CHECK_TIMEOUT.
+        """
+        self.replicas = [Replica(uri) for uri in uris]
+        self.create_pool = create_pool
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self.check_timeout = check_timeout
+        self.next_index = 0
+        self.task: Optional[asyncio.Task] = None
+
+    async def check(self, replica: Replica):
+        """
+        Checks the health and the replication lag of a replica, opening its pool first if it is not open yet.
+        Failed checks are logged and leave the replica unhealthy.
+
+        Args:
+            replica (Replica): The replica to check.
+        """
+        try:
+            if replica.pool is None:
+                replica.pool = await self.create_pool(replica.uri, timeout=self.check_timeout)
+
+            async with replica.pool.acquire(timeout=self.check_timeout) as conn:
+                row = await conn.fetchrow(REPLICATION_LAG_QUERY, timeout=self.check_timeout)
+                replica.lag = row["lag"]
+        except (*CONNECTION_ERRORS, asyncpg.PostgresError) as e:
+            if replica.healthy:
+                logger.warning("Read replica %s is unavailable: %s", replica.name, e)
+            replica.healthy = False
+            replica.lag = None
+            return
+
+        # A replica that lost its connection to the primary serves stale data however recent its last transaction
+        if not row["streaming"]:
+            if replica.healthy:
+                logger.warning("Read replica %s does not receive the WAL of the primary", replica.name)
+            replica.healthy = False
+            return
+
+        healthy = self.max_lag is None or replica.lag <= self.max_lag
+        if replica.healthy and not healthy:
+            logger.warning(
+                "Read replica %s is %.1fs behind the primary, above the %.1fs limit",
+                replica.name,
+                replica.lag,
+                self.max_lag,
+            )
+        elif healthy and not replica.healthy:
+            logger.info("Read replica %s is healthy", replica.name)
+        replica.healthy = healthy
+
+    async def check_all(self):
+        """
+        Checks all the replicas at once.
+        """
+        await asyncio.gather(*(self.check(replica) for replica in self.replicas))
+
+    async def check_forever(self):
+        """
+        Checks the replicas every `check_interval` seconds, until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self.check_all()
+
+    def choose(self) -> Optional[Replica]:
+        """
+        Chooses the replica to read from, in turn among the healthy ones.
+
+        Returns:
+            Optional[Replica]: The replica, or None if no replica is healthy.
+        """
+        healthy = [replica for replica in self.replicas if replica.healthy]
+        if not healthy:
+            return None
+
+        self.next_index = (self.next_index + 1) % len(healthy)
+        return healthy[self.next_index]
+
+    def mark_failed(self, replica: Replica, error: Exception):
+        """
+        Sets a replica aside after it failed to serve a read, until its next successful health check.
+
+        Args:
+            replica (Replica): The replica.
+            error (Exception): The error it failed with.
+        """
+        replica.failures += 1
+        if replica.healthy:
+            logger.warning("Read replica %s failed, reading from the primary: %s", replica.name, error)
+        replica.healthy = False
+
+    async def open(self):
+        """
+        Opens the pools of the replicas, checks them and starts checking them in the background. The replicas that
+        cannot be reached are retried on each check, so that they do not prevent starting.
+        """
+        if not self.replicas:
+            return
+
+        await self.check_all()
+
+        if self.task is None:
+            self.task = asyncio.create_task(self.check_forever())
+
+    async def close(self):
+        """
+        Stops the health checks and closes the pools of the replicas.
+        """
+        if self.task is not None:
+            task, self.task = self.task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        for replica in self.replicas:
+            if replica.pool is not None:
+                pool, replica.pool = replica.pool, None
+                await pool.close()
+            replica.healthy = False
+
+    def stats(self) -> List[dict]:
+        """
+        Returns the state of each replica.
+
+        Returns:
+            List[dict]: The name, health, replication lag, acquisitions and failures of each replica.
+        """
+        return [replica.stats() for replica in self.replicas]
@@ -0,0 +1,201 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Dict, Optional
+
+from app.database.postgre import SubfedditNotFoundError
+
+SUBFEDDIT_CACHE_REFRESH_INTERVAL = float(
+    os.getenv("SUBFEDDIT_CACHE_REFRESH_INTERVAL", 300)
+)
+SUBFEDDIT_CACHE_NEGATIVE_TTL = float(os.getenv("SUBFEDDIT_CACHE_NEGATIVE_TTL", 30))
+SUBFEDDIT_NOTIFY_CHANNEL = os.getenv("SUBFEDDIT_NOTIFY_CHANNEL", "")
+
+logger = logging.getLogger(__name__)
+
+
+class SubfedditCache:
+    """
+    Caches the ID of the subfeddits by name, so that resolving a subfeddit does not need a database round trip.
+    The whole name to ID map is loaded at once and refreshed in the background, on an interval and, optionally,
+    whenever a notification is received on a channel. Names that are not found are remembered for a short time.
+    """
+
+    def __init__(
+        self,
+        db_client,
+        refresh_interval: float = SUBFEDDIT_CACHE_REFRESH_INTERVAL,
+        negative_ttl: float = SUBFEDDIT_CACHE_NEGATIVE_TTL,
+        notify_channel: str = SUBFEDDIT_NOTIFY_CHANNEL,
+    ):
+        """
+        Initializes the SubfedditCache instance, empty.
+
+        Args:
+            db_client (PostgreClient): The client used to load the subfeddits.
+            refresh_interval (float): Seconds between two background refreshes. Defaults to SUBFEDDIT_CACHE_REFRESH_INTERVAL.
+            negative_ttl (float): Seconds an unknown name is remembered. Defaults to SUBFEDDIT_CACHE_NEGATIVE_TTL.
+            notify_channel (str): Channel whose notifications trigger a refresh, '' to disable. Defaults to
+                SUBFEDDIT_NOTIFY_CHANNEL.
+        """
+        self.db_client = db_client
+        self.refresh_interval = refresh_interval
+        self.negative_ttl = negative_ttl
+        self.notify_channel = notify_channel
+        self.ids: Dict[str, int] = {}
+        self.unknown: Dict[str, float] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.refresh_task: Optional[asyncio.Task] = None
+        self.listen_conn = None
+
+    async def refresh(self):
+        """
+        Reloads the whole name to ID map from the database, and forgets the unknown names.
+        """
+        self.ids = await self.db_client.get_subfeddits()
+        self.unknown = {}
+
+    def lookup(self, subfeddit_name: str) -> Optional[int]:
+        """
+        Returns the cached ID of a subfeddit, without querying the database.
+
+        Args:
+            subfeddit_name (str): The name of the subfeddit.
+
+        Returns:
+            Optional[int]: The ID of the subfeddit, or None if it is not cached.
+        """
+        return self.ids.get(subfeddit_name)
+
+    def add(self, subfeddit_name: str, subfeddit_id: int):
+        """
+        Records the ID of a subfeddit resolved by another query.
+
+        Args:
+            subfeddit_name (str): The name of the subfeddit.
+            subfeddit_id (int): The ID of the subfeddit.
+        """
+        self.ids[subfeddit_name] = subfeddit_id
+        self.unknown.pop(subfeddit_name, None)
+
+    def is_unknown(self, subfeddit_name: str) -> bool:
+        """
+        Tells whether a subfeddit was recently found not to exist.
+
+        Args:
+            subfeddit_name (str): The name of the subfeddit.
+
+        Returns:
+            bool: True if the name is in the negative cache.
+        """
+        expires_at = self.unknown.get(subfeddit_name)
+        if expires_at is None:
+            return False
+
+        if expires_at < time.monotonic():
+            del self.unknown[subfeddit_name]
+            return False
+
+        return True
+
+    def add_unknown(self, subfeddit_name: str):
+        """
+        Records that a subfeddit was found not to exist.
+
+        Args:
+            subfeddit_name (str): The name of the subfeddit.
+        """
+        self.unknown[subfeddit_name] = time.monotonic() + self.negative_ttl
+
+    async def get_id(self, subfeddit_name: str) -> int:
+        """
+        Returns the ID of a subfeddit, from the cache or, when it is not cached, from the database.
+
+        Args:
+            subfeddit_name (str): The name of the subfeddit.
+
+        Returns:
+            int: The ID of the subfeddit.
+
+        Raises:
+            SubfedditNotFoundError: If no subfeddit is found with the given name.
+        """
+        subfeddit_id = self.lookup(subfeddit_name)
+        if subfeddit_id is not None:
+            return subfeddit_id
+
+        if self.is_unknown(subfeddit_name):
+            raise SubfedditNotFoundError(f"Subfeddit '{subfeddit_name}' not found.")
+
+        try:
+            subfeddit_id = await self.db_client.get_subfeddit_id(
+                subfeddit_name=subfeddit_name
+            )
+        except SubfedditNotFoundError:
+            self.add_unknown(subfeddit_name)
+            raise
+
+        self.add(subfeddit_name, subfeddit_id)
+        return subfeddit_id
+
+    async def refresh_forever(self):
+        """
+        Refreshes the cache every `refresh_interval` seconds, until cancelled. Failed refreshes are logged and
+        the cache keeps its current content until the next one.
+        """
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error("Error while refreshing the subfeddit cache: %s", e)
+
+    async def refresh_on_notification(self):
+        """
+        Refreshes the cache after a notification, logging a failed refresh.
+        """
+        try:
+            await self.refresh()
+        except Exception as e:
+            logger.error("Error while refreshing the subfeddit cache on a notification: %s", e)
+
+    def on_notification(self, conn, pid, channel, payload):
+        """
+        Refreshes the cache in the background when a notification is received, unless a refresh started by a
+        previous notification is still running. The task is kept, so that it is not garbage collected before it ends.
+        """
+        if self.refresh_task is None or self.refresh_task.done():
+            self.refresh_task = asyncio.create_task(self.refresh_on_notification())
+
+    async def start(self):
+        """
+        Warms the cache up and starts refreshing it in the background.
+        """
+        await self.refresh()
+
+        if self.task is None:
+            self.task = asyncio.create_task(self.refresh_forever())
+
+        if self.notify_channel and self.listen_conn is None:
+            self.listen_conn = await self.db_client.listen(
+                self.notify_channel, self.on_notification
+            )
+
+    async def stop(self):
+        """
+        Stops the background refreshes.
+        """
+        if self.listen_conn is not None:
+            await self.listen_conn.close()
+            self.listen_conn = None
+
+        tasks = [task for task in (self.refresh_task, self.task) if task is not None]
+        self.refresh_task = self.task = None
+        for task in tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
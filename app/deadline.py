@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Iterable, Optional, Tuple
+
+from app import metrics
+
+# Seconds a request has to start its response, 0 for no deadline. Clients can ask for a shorter one with the
+# X-Request-Timeout header.
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 30)) or None
+REQUEST_TIMEOUT_HEADER = b"x-request-timeout"
+
+DEADLINE_EXCEEDED_DETAIL = "The request did not complete within its deadline."
+
+logger = logging.getLogger(__name__)
+
+# The time, on the monotonic clock, by which the request being served must have started its response, if any
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceededError(TimeoutError):
+    """
+    Raised when the deadline of the request has passed before a step could start.
+    """
+
+
+def remaining() -> Optional[float]:
+    """
+    Returns the time left before the deadline of the current request, to be used as the timeout of its queries.
+
+    Returns:
+        Optional[float]: The number of seconds left, or None outside of requests and for requests without deadline.
+
+    Raises:
+        DeadlineExceededError: If the deadline has passed.
+    """
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceededError(DEADLINE_EXCEEDED_DETAIL)
+
+    return left
+
+
+def context_without_deadline() -> contextvars.Context:
+    """
+    Returns a copy of the current context without the deadline of the request, to run work that other requests, each
+    with its own deadline, may wait for.
+
+    Returns:
+        contextvars.Context: The context.
+    """
+    context = contextvars.copy_context()
+    context.run(_deadline.set, None)
+    return context
+
+
+def request_timeout(headers: Iterable[Tuple[bytes, bytes]], default: Optional[float] = REQUEST_TIMEOUT) -> Optional[float]:
+    """
+    Returns the timeout of a request: the one of its X-Request-Timeout header, if valid and shorter than the default.
+
+    Args:
+        headers (Iterable[Tuple[bytes, bytes]]): The headers of the request, as in the ASGI scope.
+        default (Optional[float]): The timeout of the requests without header, None for none. Defaults to
+            REQUEST_TIMEOUT.
+
+    Returns:
+        Optional[float]: The timeout in seconds, or None for no deadline.
+    """
+    for name, value in headers:
+        if name.lower() != REQUEST_TIMEOUT_HEADER:
+            continue
+
+        try:
+            timeout = float(value)
+        except ValueError:
+            return default
+
+        if timeout > 0 and (default is None or timeout < default):
+            return timeout
+
+    return default
+
+
+async def cancel(task: asyncio.Task):
+    """
+    Cancels a task and waits for it to stop, without raising its cancellation.
+    """
+    task.cancel()
+    await asyncio.wait({task})
+
+
+class DeadlineMiddleware:
+    """
+    ASGI middleware giving each HTTP request a deadline, by which its response must have started, and cancelling the
+    request when the deadline passes, with a 504 response, or when the client disconnects. Cancelling the request
+    cancels its database queries and its pending scoring work, so that they stop holding a connection and the
+    scoring workers for a response nobody will read.
+
+    The request body is read before the request is served, so that the client can be listened to meanwhile.
+    """
+
+    def __init__(self, app, timeout: Optional[float] = REQUEST_TIMEOUT):
+        """
+        Initializes the DeadlineMiddleware instance.
+
+        Args:
+            app: The ASGI application.
+            timeout (Optional[float]): The timeout of the requests without X-Request-Timeout header, None for none.
+                Defaults to REQUEST_TIMEOUT.
+        """
+        self.app = app
+        self.timeout = timeout
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timeout = request_timeout(scope["headers"], self.timeout)
+        token = _deadline.set(time.monotonic() + timeout if timeout is not None else None)
+        try:
+            await self.serve(scope, receive, send, timeout)
+        finally:
+            _deadline.reset(token)
+
+    async def serve(self, scope, receive, send, timeout: Optional[float]):
+        """
+        Serves a request, cancelling it if it does not start its response within `timeout` seconds or if the client
+        disconnects.
+        """
+        # Read the body first, as the client cannot be listened to while the application reads it
+        messages = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            messages.append(message)
+            more_body = message.get("more_body", False)
+
+        disconnected = asyncio.Event()
+        started = complete = False
+
+        async def replay_receive():
+            if messages:
+                return messages.pop(0)
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def tracking_send(message):
+            nonlocal started, complete
+            if message["type"] == "http.response.start":
+                started = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                complete = True
+            await send(message)
+
+        async def listen():
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            disconnected.set()
+
+        handler = asyncio.create_task(self.app(scope, replay_receive, tracking_send))
+        listener = asyncio.create_task(listen())
+        try:
+            done, _ = await asyncio.wait({handler, listener}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done and started:
+                # The deadline only bounds the time to the response, a streamed body is sent as long as it is read
+                done, _ = await asyncio.wait({handler, listener}, return_when=asyncio.FIRST_COMPLETED)
+
+            if handler in done or complete:
+                await handler
+                return
+
+            await cancel(handler)
+            if listener in done:
+                metrics.record_disconnect()
+                logger.info(
+                    "The client disconnected, cancelled the request to %s",
+                    scope["path"],
+                    extra={"path": scope["path"]},
+                )
+                return
+
+            logger.warning(
+                "Cancelled the request to %s, which did not complete within its %.1fs deadline",
+                scope["path"],
+                timeout,
+                extra={"path": scope["path"], "timeout": timeout},
+            )
+            await send_json(send, 504, {"detail": DEADLINE_EXCEEDED_DETAIL})
+        finally:
+            for task in (handler, listener):
+                if not task.done():
+                    await cancel(task)
+
+
+async def send_json(send, status_code: int, content: dict):
+    """
+    Sends a JSON response through an ASGI send callable.
+    """
+    body = json.dumps(content).encode("utf-8")
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
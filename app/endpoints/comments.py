@@ -1,23 +1,51 @@
+import csv
+import io
+import json
 import logging
-from contextlib import asynccontextmanager
-from typing import List, Literal, Optional
+from contextlib import AsyncExitStack, asynccontextmanager
+from datetime import datetime
+from typing import Annotated, AsyncIterator, List, Literal, Optional
 
-from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi import APIRouter, FastAPI, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
-from app.handlers.comments_handler import CommentsHandler
-from app.schemas.comment_schema import Comment, ErrorResponse
-
-# Configure the logger
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    handlers=[logging.StreamHandler(), logging.FileHandler("app.log", mode="a")],
+from app.database.migrations import SCHEMA_MIGRATIONS_ENABLED, SchemaMigrator
+from app.database.postgre import SubfedditNotFoundError
+from app.deadline import DEADLINE_EXCEEDED_DETAIL
+from app.handlers.admission import (
+    AdmissionController,
+    AdmissionRejectedError,
+    ClientQueueFullError,
+    client_of,
+)
+from app.handlers.comments_handler import STREAM_BATCH_SIZE, CommentsHandler
+from app.handlers.cursor import InvalidCursorError
+from app.handlers.response_cache import etag_matches
+from app.metrics import timed_handler
+from app.schemas.comment_schema import (
+    COMMENTS_MAX_PAGE_SIZE,
+    Comment,
+    CommentsBatchRequest,
+    CommentsBatchResponse,
+    CommentsBatchResult,
+    ErrorResponse,
 )
+from app.scoring.backfill import POLARITY_BACKFILL_ENABLED
+
 logger = logging.getLogger(__name__)
 
 # Creating an instance of CommentsHandler to handle comment-related functionality
 comments_handler = CommentsHandler()
 
+# Applies the schema migrations of the service, e.g. the indexes of the comments, to the database of the handler
+schema_migrator = SchemaMigrator(comments_handler.db_client)
+
+# Bounds the number of comments of the requests served at once, queuing the clients' requests fairly
+admission_controller = AdmissionController()
+
+# Fields of the comments written by the streaming endpoint, in order
+STREAM_FIELDS = list(Comment.model_fields)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -25,87 +53,615 @@ async def lifespan(app: FastAPI):
     logger.info("Connecting to the database...")
 
     await comments_handler.db_client.connect_to_db()
+
+    # Startup: load the subfeddit names and keep them up to date in the background
+    await comments_handler.subfeddit_cache.start()
+
+    # Startup: start the pool that scores comments off the event loop, with the sentiment lexicon loaded in each of
+    # its workers, so that the first requests do not pay for loading it
+    logger.info("Starting the scoring engine...")
+    comments_handler.scoring_engine.start()
+    await comments_handler.scoring_engine.warm_up()
+
+    # Startup: open the durable backend of the polarity cache, if any
+    await comments_handler.polarity_cache.open()
+
+    # Startup: create the table of precomputed polarity scores, with the daily sentiment rollup maintained from it,
+    # and start filling it in the background
+    await comments_handler.db_client.create_polarity_table()
+    await comments_handler.db_client.create_sentiment_rollup()
+    if POLARITY_BACKFILL_ENABLED:
+        logger.info("Starting the polarity backfill...")
+        comments_handler.polarity_backfill.start()
+
+    # Startup: apply the pending schema migrations in the background, as building an index can take long
+    if SCHEMA_MIGRATIONS_ENABLED:
+        schema_migrator.start()
+
+    # Startup: the process is warm, report it ready to receive traffic
+    app.state.ready = True
+
     yield
 
+    # Shutdown: report the process not ready anymore, so that no new traffic is sent to it while it drains
+    app.state.ready = False
+
+    await comments_handler.subfeddit_cache.stop()
+
+    # Shutdown: interrupt the migration being applied, it is applied again on the next start
+    await schema_migrator.stop()
+
+    # Shutdown: stop refreshing the cached responses
+    await comments_handler.response_cache.close()
+
+    # Shutdown: stop the polarity backfill before the scoring engine it relies on
+    await comments_handler.polarity_backfill.stop()
+
+    # Shutdown: let the pending scoring work finish before releasing the pool
+    logger.info("Shutting down the scoring engine...")
+    await comments_handler.scoring_engine.shutdown()
+
+    logger.info("Polarity cache stats: %s", comments_handler.polarity_cache.stats())
+    await comments_handler.polarity_cache.close()
+
+    # Shutdown: close the database connections last, once nothing uses them anymore
+    logger.info("Closing the database connections...")
+    await comments_handler.db_client.close()
+
 
 # Creating an instance of APIRouter to define routes in the application
 router = APIRouter(lifespan=lifespan)
 
 
-@router.get(
-    "/comments",
-    response_model=List[Comment],
-    responses={
-        400: {
-            "model": ErrorResponse,
-            "description": "Bad Request (Invalid Parameters)",
-        },
-        500: {"model": ErrorResponse, "description": "Internal Server Error"},
+def validate_polarity_range(min_polarity: float, max_polarity: float):
+    """
+    Ensures the polarity range filters are between -1 and 1.
+
+    Raises:
+        HTTPException: If min_polarity or max_polarity is out of range, a 400 error is raised.
+    """
+    if min_polarity < -1 or min_polarity > 1:
+        raise HTTPException(
+            status_code=400, detail="min_polarity must be between -1 and 1"
+        )
+
+    if max_polarity < -1 or max_polarity > 1:
+        raise HTTPException(
+            status_code=400, detail="max_polarity must be between -1 and 1"
+        )
+
+
+def validate_date(name: str, value: Optional[str]):
+    """
+    Ensures a date filter is formatted as DD-MM-YYYY.
+
+    Raises:
+        HTTPException: If the date is malformed, a 400 error is raised.
+    """
+    if value is None:
+        return
+
+    try:
+        datetime.strptime(value, "%d-%m-%Y")
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be formatted as DD-MM-YYYY")
+
+
+def rejected(error: AdmissionRejectedError) -> HTTPException:
+    """
+    Builds the error response of a request that was not admitted: 429 when its client has too many requests waiting,
+    503 when the API is overloaded, both with the seconds to wait before retrying in the Retry-After header.
+    """
+    status_code = 429 if isinstance(error, ClientQueueFullError) else 503
+    return HTTPException(
+        status_code=status_code, detail=str(error), headers={"Retry-After": str(error.retry_after)}
+    )
+
+
+def cache_control() -> str:
+    """
+    Returns the Cache-Control header of the cacheable responses, matching the freshness of the response cache.
+    """
+    response_cache = comments_handler.response_cache
+    if not response_cache.enabled:
+        return "no-cache"
+
+    return (
+        f"public, max-age={int(response_cache.ttl)}, "
+        f"stale-while-revalidate={int(response_cache.stale_ttl)}"
+    )
+
+
+def format_ndjson(comments: List[dict]) -> bytes:
+    """
+    Serializes a batch of comments as newline-delimited JSON, one comment per line.
+    """
+    return "".join(
+        json.dumps({field: comment[field] for field in STREAM_FIELDS}) + "\n"
+        for comment in comments
+    ).encode("utf-8")
+
+
+def format_csv(comments: List[dict]) -> bytes:
+    """
+    Serializes a batch of comments as CSV rows, without header.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerows([comment[field] for field in STREAM_FIELDS] for comment in comments)
+    return buffer.getvalue().encode("utf-8")
+
+
+class AdmittedStreamingResponse(StreamingResponse):
+    """
+    A streaming response holding the admission of its request until it is sent, or until the client disconnects.
+    """
+
+    def __init__(self, content, admission: AsyncExitStack, **kwargs):
+        super().__init__(content, **kwargs)
+        self.admission = admission
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.admission.aclose()
+
+
+async def comments_page(
+    subfeddit_name: str,
+    n_comments: Optional[int],
+    from_date: Optional[str],
+    to_date: Optional[str],
+    polarity_sorting: Optional[str],
+    min_polarity: Optional[float],
+    max_polarity: Optional[float],
+    cursor: Optional[str],
+    search: Optional[str],
+    if_none_match: Optional[str],
+    client: str,
+) -> Response:
+    """
+    Builds the response of a page of comments of `GET /comments` and `GET /comments/search`, whose arguments it takes,
+    along with the client sending the request. The request is first admitted by the admission controller, then the
+    page is taken from the response cache when possible, and returned as the JSON the cache holds, without being
+    validated against the response model again.
+
+    Returns:
+        Response: The JSON page of comments, with its ETag and the cursor of the next page in the X-Next-Cursor header,
+        or an empty 304 response when the page matches the If-None-Match header.
+
+    Raises:
+        HTTPException: If a wrong value is sent as parameter, a 400 error is raised.
+        HTTPException: If the subfeddit does not exist, a 404 error is raised.
+        HTTPException: If the client has too many requests waiting, a 429 error is raised.
+        HTTPException: If the API is overloaded, a 503 error is raised.
+        HTTPException: If the deadline of the request passes, a 504 error is raised.
+        HTTPException: If an unexpected error occurs during the process, a 500 error is raised.
+    """
+    filters = {
+        "subfeddit_name": subfeddit_name,
+        "n_comments": n_comments,
+        "from_date": from_date,
+        "to_date": to_date,
+        "polarity_sorting": polarity_sorting,
+        "min_polarity": min_polarity,
+        "max_polarity": max_polarity,
+        "search": search,
+    }
+    logger.debug("Fetching comments for subfeddit %s", subfeddit_name, extra=filters)
+
+    # Ensure min_polarity and max_polarity are within the valid range
+    validate_polarity_range(min_polarity, max_polarity)
+
+    try:
+        # Wait for the turn of the request, its cost being the number of comments it asks for
+        async with admission_controller.admit(client, n_comments):
+            # Fetch the comments with the specified filters, from the response cache when possible
+            body, next_cursor, etag = await comments_handler.get_comments_cached(
+                subfeddit_name=subfeddit_name,
+                from_date=from_date,
+                to_date=to_date,
+                polarity_sorting=polarity_sorting,
+                n_comments=n_comments,
+                min_polarity=min_polarity,
+                max_polarity=max_polarity,
+                cursor=cursor,
+                search=search,
+            )
+        logger.info(
+            "Successfully fetched comments", extra={**filters, "sampled": True}
+        )
+    except AdmissionRejectedError as e:
+        raise rejected(e)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SubfedditNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=DEADLINE_EXCEEDED_DETAIL)
+    except Exception as e:
+        logger.error("Error while fetching comments: %s", e, extra=filters)
+
+        raise HTTPException(
+            status_code=500, detail=f"An unexpected error occurred: {str(e)}"
+        )
+
+    headers = {"ETag": etag, "Cache-Control": cache_control()}
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+
+    # The client already has this page, so only confirm it is still valid
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+# Responses of the endpoints returning a page of comments
+COMMENTS_PAGE_RESPONSES = {
+    200: {
+        "headers": {
+            "X-Next-Cursor": {
+                "description": "Cursor of the next page, absent on the last page.",
+                "schema": {"type": "string"},
+            },
+            "ETag": {
+                "description": "Entity tag of the page, to revalidate it with If-None-Match.",
+                "schema": {"type": "string"},
+            },
+        }
     },
-)
-@router.get("/comments", response_model=List[Comment])
+    304: {"description": "Not Modified (the page matches the If-None-Match header)"},
+    400: {
+        "model": ErrorResponse,
+        "description": "Bad Request (Invalid Parameters)",
+    },
+    404: {"model": ErrorResponse, "description": "Subfeddit Not Found"},
+    429: {"model": ErrorResponse, "description": "Too Many Requests (of the client waiting to be served)"},
+    500: {"model": ErrorResponse, "description": "Internal Server Error"},
+    503: {"model": ErrorResponse, "description": "Service Unavailable (overloaded)"},
+    504: {"model": ErrorResponse, "description": "Gateway Timeout (the deadline of the request passed)"},
+}
+
+
+@router.get("/comments", response_model=List[Comment], responses=COMMENTS_PAGE_RESPONSES)
+@timed_handler
 async def get_comments(
     subfeddit_name: str,
-    n_comments: Optional[int] = 25,
+    n_comments: Annotated[Optional[int], Query(ge=1, le=COMMENTS_MAX_PAGE_SIZE)] = 25,
     from_date: Optional[str] = None,
     to_date: Optional[str] = None,
     polarity_sorting: Optional[Literal["asc", "desc"]] = None,
     min_polarity: Optional[float] = -1,
     max_polarity: Optional[float] = 1,
+    cursor: Optional[str] = None,
+    q: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    request: Request = None,
 ):
     """
-    Fetches a list of comments for a given subfeddit with optional filters such as date range, polarity range, and sorting.
+    Fetches a list of comments for a given subfeddit with optional filters such as date range, polarity range, text search and sorting.
+    Identical requests are served from a short-lived cache, and pages can be revalidated with their ETag. The page is
+    returned as the JSON the cache holds, without being validated against the response model again.
 
     Args:\n
         subfeddit_name (str): The name of the subfeddit whose comments are to be fetched.
-        n_comments (Optional[int]): The number of comments to retrieve. Default is 25.
+        n_comments (Optional[int]): The number of comments to retrieve, at most COMMENTS_MAX_PAGE_SIZE. Default is 25.
         from_date (Optional[str]): The start date for filtering comments (optional). The date format must be DD-MM-YYYY.
         to_date (Optional[str]): The end date for filtering comments (optional). The date format must be DD-MM-YYYY.
         polarity_sorting (Optional[Literal["asc", "desc"]]): Sorting order for comments by polarity (optional). The value can be "asc" for ascending or "desc" for descending order.
         min_polarity (Optional[float]): Minimum polarity value for filtering comments (default is -1). The value must be between -1 and 1.
         max_polarity (Optional[float]): Maximum polarity value for filtering comments (default is 1). The value must be between -1 and 1.
+        cursor (Optional[str]): The cursor of the page to retrieve (optional), as returned in the X-Next-Cursor header of the previous page.
+        q (Optional[str]): Full-text search the comments must match (optional), e.g. `checkout "too slow" -paypal`.
+        if_none_match (Optional[str]): The If-None-Match header (optional), with the ETag of a previously retrieved page.
+        request (Request): The request, whose client is identified for the admission control.
 
     Returns:\n
-        List[Comment]: A list of comments that match the filtering criteria.
+        List[Comment]: A page of comments that match the filtering criteria. The cursor of the next page is returned in the X-Next-Cursor header.
+        An empty 304 response is returned instead when the page matches the If-None-Match header.
 
     Raises:\n
         HTTPException: If a wrong value is sent as parameter, a 400 error is raised.
+        HTTPException: If the subfeddit does not exist, a 404 error is raised.
+        HTTPException: If the client has too many requests waiting, a 429 error is raised.
+        HTTPException: If the API is overloaded, a 503 error is raised.
+        HTTPException: If the deadline of the request passes, a 504 error is raised.
         HTTPException: If an unexpected error occurs during the process, a 500 error is raised.
     """
-    logger.info(
-        f"Fetching comments for subfeddit: {subfeddit_name} with filters: "
-        f"n_comments={n_comments}, from_date={from_date}, to_date={to_date}, "
-        f"polarity_sorting={polarity_sorting}, min_polarity={min_polarity}, max_polarity={max_polarity}"
+    return await comments_page(
+        subfeddit_name,
+        n_comments,
+        from_date,
+        to_date,
+        polarity_sorting,
+        min_polarity,
+        max_polarity,
+        cursor,
+        q or None,
+        if_none_match,
+        client_of(request),
     )
 
-    # Ensure min_polarity and max_polarity are within the valid range
-    if min_polarity < -1 or min_polarity > 1:
-        raise HTTPException(
-            status_code=400, detail="min_polarity must be between -1 and 1"
-        )
 
-    if max_polarity < -1 or max_polarity > 1:
-        raise HTTPException(
-            status_code=400, detail="max_polarity must be between -1 and 1"
+@router.get("/comments/search", response_model=List[Comment], responses=COMMENTS_PAGE_RESPONSES)
+@timed_handler
+async def search_comments(
+    subfeddit_name: str,
+    q: Annotated[str, Query(min_length=1)],
+    n_comments: Annotated[Optional[int], Query(ge=1, le=COMMENTS_MAX_PAGE_SIZE)] = 25,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    polarity_sorting: Optional[Literal["asc", "desc"]] = None,
+    min_polarity: Optional[float] = -1,
+    max_polarity: Optional[float] = 1,
+    cursor: Optional[str] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    request: Request = None,
+):
+    """
+    Searches the comments of a given subfeddit matching a full-text query, with the filters, sorting and pagination of
+    `GET /comments`. The search uses the full-text index of the comments, so only the matching comments are read.
+
+    Args:\n
+        subfeddit_name (str): The name of the subfeddit whose comments are searched.
+        q (str): The query, in web search syntax: words the comments must contain (in any inflected form), "quoted phrases", `or` between alternatives, and `-word` to exclude a word.
+        n_comments (Optional[int]): The number of comments to retrieve, at most COMMENTS_MAX_PAGE_SIZE. Default is 25.
+        from_date (Optional[str]): The start date for filtering comments (optional). The date format must be DD-MM-YYYY.
+        to_date (Optional[str]): The end date for filtering comments (optional). The date format must be DD-MM-YYYY.
+        polarity_sorting (Optional[Literal["asc", "desc"]]): Sorting order for comments by polarity (optional). The value can be "asc" for ascending or "desc" for descending order.
+        min_polarity (Optional[float]): Minimum polarity value for filtering comments (default is -1). The value must be between -1 and 1.
+        max_polarity (Optional[float]): Maximum polarity value for filtering comments (default is 1). The value must be between -1 and 1.
+        cursor (Optional[str]): The cursor of the page to retrieve (optional), as returned in the X-Next-Cursor header of the previous page.
+        if_none_match (Optional[str]): The If-None-Match header (optional), with the ETag of a previously retrieved page.
+        request (Request): The request, whose client is identified for the admission control.
+
+    Returns:\n
+        List[Comment]: A page of the matching comments, from the most recent unless sorted by polarity. The cursor of the next page is returned in the X-Next-Cursor header.
+        An empty 304 response is returned instead when the page matches the If-None-Match header.
+
+    Raises:\n
+        HTTPException: If a wrong value is sent as parameter, a 400 error is raised.
+        HTTPException: If the subfeddit does not exist, a 404 error is raised.
+        HTTPException: If the client has too many requests waiting, a 429 error is raised.
+        HTTPException: If the API is overloaded, a 503 error is raised.
+        HTTPException: If the deadline of the request passes, a 504 error is raised.
+        HTTPException: If an unexpected error occurs during the process, a 500 error is raised.
+    """
+    return await comments_page(
+        subfeddit_name,
+        n_comments,
+        from_date,
+        to_date,
+        polarity_sorting,
+        min_polarity,
+        max_polarity,
+        cursor,
+        q,
+        if_none_match,
+        client_of(request),
+    )
+
+
+def batch_result(subfeddit_name: str, result) -> CommentsBatchResult:
+    """
+    Builds the result of one query of a batch, mapping its error, if any, to the status code `GET /comments` would return.
+    """
+    if isinstance(result, InvalidCursorError):
+        return CommentsBatchResult(subfeddit_name=subfeddit_name, status_code=400, detail=str(result))
+
+    if isinstance(result, SubfedditNotFoundError):
+        return CommentsBatchResult(subfeddit_name=subfeddit_name, status_code=404, detail=str(result))
+
+    if isinstance(result, TimeoutError):
+        return CommentsBatchResult(subfeddit_name=subfeddit_name, status_code=504, detail=DEADLINE_EXCEEDED_DETAIL)
+
+    if isinstance(result, BaseException):
+        logger.error(
+            "Error while fetching comments of %s: %s",
+            subfeddit_name,
+            result,
+            extra={"subfeddit_name": subfeddit_name},
         )
 
-    try:
-        # Call the CommentsHandler's get_comments method to fetch the comments with the specified filters
-        comments = await comments_handler.get_comments(
+        return CommentsBatchResult(
             subfeddit_name=subfeddit_name,
-            from_date=from_date,
-            to_date=to_date,
-            polarity_sorting=polarity_sorting,
-            n_comments=n_comments,
-            min_polarity=min_polarity,
-            max_polarity=max_polarity,
+            status_code=500,
+            detail=f"An unexpected error occurred: {str(result)}",
         )
-        logger.info(f"Successfully fetched {len(comments)} comments")
+
+    comments, next_cursor = result
+    return CommentsBatchResult(
+        subfeddit_name=subfeddit_name,
+        status_code=200,
+        comments=comments,
+        next_cursor=next_cursor,
+    )
+
+
+@router.post(
+    "/comments/batch",
+    response_model=CommentsBatchResponse,
+    responses={
+        422: {"description": "Validation Error (Invalid Parameters)"},
+        429: {"model": ErrorResponse, "description": "Too Many Requests (of the client waiting to be served)"},
+        500: {"model": ErrorResponse, "description": "Internal Server Error"},
+        503: {"model": ErrorResponse, "description": "Service Unavailable (overloaded)"},
+        504: {"model": ErrorResponse, "description": "Gateway Timeout (the deadline of the request passed)"},
+    },
+)
+@timed_handler
+async def get_comments_batch(request: CommentsBatchRequest, http_request: Request = None):
+    """
+    Fetches a page of comments for each of several queries in one request, with the same filters as `GET /comments`.
+    The queries are run concurrently, and the comments of all the pages are analyzed together. The batch is admitted
+    as one request asking for the comments of all its queries.
+
+    Args:\n
+        request (CommentsBatchRequest): The list of queries, each with the parameters of `GET /comments`.
+        http_request (Request): The HTTP request, whose client is identified for the admission control.
+
+    Returns:\n
+        CommentsBatchResponse: The result of each query, in order, with its status code and either its comments and
+        the cursor of their next page, or the detail of its error. A failing query does not fail the others.
+
+    Raises:\n
+        HTTPException: If the client has too many requests waiting, a 429 error is raised.
+        HTTPException: If the API is overloaded, a 503 error is raised.
+        HTTPException: If the deadline of the request passes, a 504 error is raised.
+        HTTPException: If an unexpected error occurs while analyzing the comments, a 500 error is raised.
+    """
+    logger.info(
+        "Fetching comments for a batch of %d queries",
+        len(request.queries),
+        extra={"queries": len(request.queries), "sampled": True},
+    )
+
+    cost = sum(query.n_comments for query in request.queries)
+    try:
+        async with admission_controller.admit(client_of(http_request), cost):
+            results = await comments_handler.get_comments_batch(
+                [query.model_dump() for query in request.queries]
+            )
+    except AdmissionRejectedError as e:
+        raise rejected(e)
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=DEADLINE_EXCEEDED_DETAIL)
     except Exception as e:
-        logger.error(f"Error while fetching comments: {str(e)}")
+        logger.error("Error while fetching a batch of comments: %s", e)
 
         raise HTTPException(
             status_code=500, detail=f"An unexpected error occurred: {str(e)}"
         )
 
-    return comments
+    return CommentsBatchResponse(
+        results=[
+            batch_result(query.subfeddit_name, result)
+            for query, result in zip(request.queries, results)
+        ]
+    )
+
+
+@router.get(
+    "/comments/stream",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {"application/x-ndjson": {}, "text/csv": {}},
+            "description": "All the comments that match the filtering criteria, one per line.",
+        },
+        400: {
+            "model": ErrorResponse,
+            "description": "Bad Request (Invalid Parameters)",
+        },
+        404: {"model": ErrorResponse, "description": "Subfeddit Not Found"},
+        429: {"model": ErrorResponse, "description": "Too Many Requests (of the client waiting to be served)"},
+        500: {"model": ErrorResponse, "description": "Internal Server Error"},
+        503: {"model": ErrorResponse, "description": "Service Unavailable (overloaded)"},
+        504: {"model": ErrorResponse, "description": "Gateway Timeout (the deadline of the request passed)"},
+    },
+)
+@timed_handler
+async def stream_comments(
+    subfeddit_name: str,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    polarity_sorting: Optional[Literal["asc", "desc"]] = None,
+    min_polarity: Optional[float] = -1,
+    max_polarity: Optional[float] = 1,
+    format: Optional[Literal["ndjson", "csv"]] = "ndjson",
+    request: Request = None,
+):
+    """
+    Streams all the comments of a given subfeddit with optional filters such as date range, polarity range, and sorting.
+    The comments are read from the database and scored in batches as the response is sent, so that exports of whole subfeddits
+    start quickly and use a constant amount of memory. The stream is admitted as a request asking for a batch of comments,
+    until it ends.
+
+    Args:\n
+        subfeddit_name (str): The name of the subfeddit whose comments are to be streamed.
+        from_date (Optional[str]): The start date for filtering comments (optional). The date format must be DD-MM-YYYY.
+        to_date (Optional[str]): The end date for filtering comments (optional). The date format must be DD-MM-YYYY.
+        polarity_sorting (Optional[Literal["asc", "desc"]]): Sorting order for comments by polarity (optional). The value can be "asc" for ascending or "desc" for descending order.
+        min_polarity (Optional[float]): Minimum polarity value for filtering comments (default is -1). The value must be between -1 and 1.
+        max_polarity (Optional[float]): Maximum polarity value for filtering comments (default is 1). The value must be between -1 and 1.
+        format (Optional[Literal["ndjson", "csv"]]): The format of the stream, newline-delimited JSON (default) or CSV with a header row.
+        request (Request): The request, whose client is identified for the admission control.
+
+    Returns:\n
+        StreamingResponse: The comments that match the filtering criteria, one per line.
+
+    Raises:\n
+        HTTPException: If a wrong value is sent as parameter, a 400 error is raised.
+        HTTPException: If the subfeddit does not exist, a 404 error is raised.
+        HTTPException: If the client has too many requests waiting, a 429 error is raised.
+        HTTPException: If the API is overloaded, a 503 error is raised.
+        HTTPException: If the deadline of the request passes before the stream starts, a 504 error is raised.
+        HTTPException: If an unexpected error occurs before the stream starts, a 500 error is raised.
+    """
+    filters = {
+        "subfeddit_name": subfeddit_name,
+        "from_date": from_date,
+        "to_date": to_date,
+        "polarity_sorting": polarity_sorting,
+        "min_polarity": min_polarity,
+        "max_polarity": max_polarity,
+        "format": format,
+    }
+    logger.info("Streaming comments for subfeddit %s", subfeddit_name, extra=filters)
+
+    # Ensure the dates are well-formed and the polarities within the valid range, as the stream cannot fail with a
+    # 400 error once started
+    validate_date("from_date", from_date)
+    validate_date("to_date", to_date)
+    validate_polarity_range(min_polarity, max_polarity)
+
+    # Holds the admission of the stream until the response is sent
+    admission = AsyncExitStack()
+    try:
+        try:
+            # Wait for the turn of the stream, its cost being the batch of comments it reads and scores at once
+            await admission.enter_async_context(admission_controller.admit(client_of(request), STREAM_BATCH_SIZE))
+
+            # Resolve the subfeddit now, so that errors are returned before the response starts
+            batches = await comments_handler.stream_comments(
+                subfeddit_name=subfeddit_name,
+                from_date=from_date,
+                to_date=to_date,
+                polarity_sorting=polarity_sorting,
+                min_polarity=min_polarity,
+                max_polarity=max_polarity,
+            )
+        except AdmissionRejectedError as e:
+            raise rejected(e)
+        except SubfedditNotFoundError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except TimeoutError:
+            raise HTTPException(status_code=504, detail=DEADLINE_EXCEEDED_DETAIL)
+        except Exception as e:
+            logger.error("Error while streaming comments: %s", e, extra=filters)
+
+            raise HTTPException(
+                status_code=500, detail=f"An unexpected error occurred: {str(e)}"
+            )
+    except BaseException:
+        # Give the admission back on every failure, the cancellation of the request included, until the response
+        # holds it
+        await admission.aclose()
+        raise
+
+    async def body() -> AsyncIterator[bytes]:
+        # Each batch is only read from the database once the previous one has been sent
+        count = 0
+        if format == "csv":
+            yield (",".join(STREAM_FIELDS) + "\r\n").encode("utf-8")
+
+        async for comments in batches:
+            count += len(comments)
+            yield format_csv(comments) if format == "csv" else format_ndjson(comments)
+
+        logger.info("Successfully streamed %d comments", count, extra={**filters, "count": count})
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return AdmittedStreamingResponse(body(), admission, media_type=media_type)
@@ -0,0 +1,219 @@
+import json
+import logging
+from contextlib import asynccontextmanager
+from typing import Annotated, AsyncIterator, List, Literal, Optional
+
+from fastapi import APIRouter, FastAPI, Header, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.database.postgre import SubfedditNotFoundError
+from app.deadline import DEADLINE_EXCEEDED_DETAIL
+from app.endpoints.comments import STREAM_FIELDS, comments_handler, validate_date, validate_polarity_range
+from app.handlers.live_feed import LiveFeedOverflowError
+from app.handlers.subfeddits_handler import SubfedditsHandler
+from app.metrics import timed_handler
+from app.schemas.comment_schema import ErrorResponse, SubfedditSentiment
+
+logger = logging.getLogger(__name__)
+
+# Creating an instance of SubfedditsHandler sharing the database client and subfeddit cache of the comments
+subfeddits_handler = SubfedditsHandler(
+    comments_handler.db_client, comments_handler.subfeddit_cache
+)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup: wake the live feeds up on the notifications of new scored comments, if any. It runs once the database
+    # is connected by the lifespan of the 'comments' router
+    await subfeddits_handler.live_feeds.start()
+
+    yield
+
+    # Shutdown: stop the pollers of the live feeds, before the database connections are closed
+    await subfeddits_handler.live_feeds.stop()
+
+
+# Creating an instance of APIRouter to define routes in the application
+router = APIRouter(lifespan=lifespan)
+
+
+def format_sse(comments: List[dict]) -> bytes:
+    """
+    Serializes a batch of comments as Server-Sent Events, one 'comment' event per comment with its change sequence
+    number as event ID, so that a reconnecting client sends the position of the last comment it received in the
+    Last-Event-ID header.
+    """
+    return "".join(
+        f"id: {comment['change_seq']}\nevent: comment\ndata: "
+        + json.dumps({field: comment[field] for field in STREAM_FIELDS})
+        + "\n\n"
+        for comment in comments
+    ).encode("utf-8")
+
+
+@router.get(
+    "/subfeddits/{subfeddit_name}/sentiment",
+    response_model=SubfedditSentiment,
+    responses={
+        400: {
+            "model": ErrorResponse,
+            "description": "Bad Request (Invalid Parameters)",
+        },
+        404: {"model": ErrorResponse, "description": "Subfeddit Not Found"},
+        500: {"model": ErrorResponse, "description": "Internal Server Error"},
+        504: {"model": ErrorResponse, "description": "Gateway Timeout (the deadline of the request passed)"},
+    },
+)
+@timed_handler
+async def get_sentiment(
+    subfeddit_name: str,
+    from_date: Optional[str] = None,
+    to_date: Optional[str] = None,
+    bucket: Optional[Literal["day", "week", "month"]] = "day",
+):
+    """
+    Fetches the sentiment distribution of the comments of a subfeddit over time: the number of positive, neutral and
+    negative comments and their mean polarity, per day, week or month. It is read from daily counts maintained by the
+    database as comments are scored, so it does not depend on the number of comments.
+
+    Args:\n
+        subfeddit_name (str): The name of the subfeddit.
+        from_date (Optional[str]): The first day to include (optional). The date format must be DD-MM-YYYY.
+        to_date (Optional[str]): The last day to include (optional). The date format must be DD-MM-YYYY.
+        bucket (Optional[Literal["day", "week", "month"]]): The size of the time buckets (default is "day").
+
+    Returns:\n
+        SubfedditSentiment: The sentiment distribution over the whole period and per bucket, in chronological order.
+
+    Raises:\n
+        HTTPException: If a wrong value is sent as parameter, a 400 error is raised.
+        HTTPException: If the subfeddit does not exist, a 404 error is raised.
+        HTTPException: If the deadline of the request passes, a 504 error is raised.
+        HTTPException: If an unexpected error occurs during the process, a 500 error is raised.
+    """
+    filters = {
+        "subfeddit_name": subfeddit_name,
+        "from_date": from_date,
+        "to_date": to_date,
+        "bucket": bucket,
+    }
+    logger.info(
+        "Fetching the sentiment of subfeddit %s", subfeddit_name, extra={**filters, "sampled": True}
+    )
+
+    # Ensure the dates are well formed
+    validate_date("from_date", from_date)
+    validate_date("to_date", to_date)
+
+    try:
+        return await subfeddits_handler.get_sentiment(
+            subfeddit_name=subfeddit_name, from_date=from_date, to_date=to_date, bucket=bucket
+        )
+    except SubfedditNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=DEADLINE_EXCEEDED_DETAIL)
+    except Exception as e:
+        logger.error("Error while fetching the sentiment: %s", e, extra=filters)
+
+        raise HTTPException(
+            status_code=500, detail=f"An unexpected error occurred: {str(e)}"
+        )
+
+
+@router.get(
+    "/subfeddits/{subfeddit_name}/live",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {"text/event-stream": {}},
+            "description": "The comments of the subfeddit as they are scored, as Server-Sent Events.",
+        },
+        400: {
+            "model": ErrorResponse,
+            "description": "Bad Request (Invalid Parameters)",
+        },
+        404: {"model": ErrorResponse, "description": "Subfeddit Not Found"},
+        500: {"model": ErrorResponse, "description": "Internal Server Error"},
+        504: {"model": ErrorResponse, "description": "Gateway Timeout (the deadline of the request passed)"},
+    },
+)
+@timed_handler
+async def get_live_comments(
+    subfeddit_name: str,
+    min_polarity: Optional[float] = -1,
+    max_polarity: Optional[float] = 1,
+    last_event_id: Annotated[Optional[int], Header()] = None,
+):
+    """
+    Streams the comments of a subfeddit with their sentiment as they are scored, as Server-Sent Events, e.g. to be
+    told of new negative comments without polling `/comments`. All the clients following a subfeddit are fed by a
+    single poll of the database, and filtered by polarity on the server. An SSE comment line is sent when no comment
+    came for a while, to keep the connection alive.
+
+    A client reading slower than the comments are scored gets an 'overflow' event and its stream ends; like any
+    client reconnecting, it then sends the event ID of the last comment it received in the Last-Event-ID header, and
+    gets the comments it missed first. The event IDs follow the order the comments are scored in, not their IDs, so
+    that the comments scored again are sent too.
+
+    Args:\n
+        subfeddit_name (str): The name of the subfeddit whose comments are to be followed.
+        min_polarity (Optional[float]): Minimum polarity value for filtering comments (default is -1). The value must be between -1 and 1.
+        max_polarity (Optional[float]): Maximum polarity value for filtering comments (default is 1). The value must be between -1 and 1.
+        last_event_id (Optional[int]): The Last-Event-ID header (optional), with the event ID of the last comment received, to resume a stream.
+
+    Returns:\n
+        StreamingResponse: A 'comment' event per new comment matching the filtering criteria.
+
+    Raises:\n
+        HTTPException: If a wrong value is sent as parameter, a 400 error is raised.
+        HTTPException: If the subfeddit does not exist, a 404 error is raised.
+        HTTPException: If the deadline of the request passes before the stream starts, a 504 error is raised.
+        HTTPException: If an unexpected error occurs before the stream starts, a 500 error is raised.
+    """
+    filters = {
+        "subfeddit_name": subfeddit_name,
+        "min_polarity": min_polarity,
+        "max_polarity": max_polarity,
+        "last_event_id": last_event_id,
+    }
+    logger.info("Following the comments of subfeddit %s", subfeddit_name, extra=filters)
+
+    # Ensure min_polarity and max_polarity are within the valid range
+    validate_polarity_range(min_polarity, max_polarity)
+
+    try:
+        # Resolve the subfeddit now, so that errors are returned before the response starts
+        batches = await subfeddits_handler.live_comments(
+            subfeddit_name=subfeddit_name,
+            min_polarity=min_polarity,
+            max_polarity=max_polarity,
+            last_event_id=last_event_id,
+        )
+    except SubfedditNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TimeoutError:
+        raise HTTPException(status_code=504, detail=DEADLINE_EXCEEDED_DETAIL)
+    except Exception as e:
+        logger.error("Error while following comments: %s", e, extra=filters)
+
+        raise HTTPException(
+            status_code=500, detail=f"An unexpected error occurred: {str(e)}"
+        )
+
+    async def body() -> AsyncIterator[bytes]:
+        count = 0
+        try:
+            async for comments in batches:
+                count += len(comments)
+                yield format_sse(comments) if comments else b": keep-alive\n\n"
+        except LiveFeedOverflowError as e:
+            logger.warning("Ended a live feed whose client fell behind: %s", e, extra={**filters, "count": count})
+            yield b"event: overflow\ndata: " + json.dumps({"detail": str(e)}).encode("utf-8") + b"\n\n"
+        finally:
+            logger.info("Sent %d live comments", count, extra={**filters, "count": count})
+
+    # Ask proxies not to buffer the events
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(body(), media_type="text/event-stream", headers=headers)
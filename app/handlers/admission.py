@@ -0,0 +1,298 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque
+
+from app import metrics
+
+# Number of comments the requests admitted at once may ask for in total, 0 to admit every request
+ADMISSION_CAPACITY = int(os.getenv("ADMISSION_CAPACITY", 1000))
+ADMISSION_MAX_QUEUE_WAIT = float(os.getenv("ADMISSION_MAX_QUEUE_WAIT", 2))
+ADMISSION_MAX_QUEUE_SIZE = int(os.getenv("ADMISSION_MAX_QUEUE_SIZE", 200))
+ADMISSION_MAX_CLIENT_QUEUE = int(os.getenv("ADMISSION_MAX_CLIENT_QUEUE", 20))
+
+# Header identifying the client of a request, e.g. set by a gateway, the client's address is used when unset
+ADMISSION_CLIENT_HEADER = os.getenv("ADMISSION_CLIENT_HEADER", "")
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejectedError(Exception):
+    """
+    Raised when a request is not admitted, with the number of seconds after which it can be retried.
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OverloadedError(AdmissionRejectedError):
+    """
+    Raised when the API is too busy to admit a request in time.
+    """
+
+
+class ClientQueueFullError(AdmissionRejectedError):
+    """
+    Raised when a client already has too many requests waiting to be admitted.
+    """
+
+
+class Waiter:
+    """
+    A request waiting to be admitted.
+    """
+
+    def __init__(self, client: str, cost: int):
+        self.client = client
+        self.cost = cost
+        self.future: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class AdmissionController:
+    """
+    Bounds the cost of the requests served at once, the cost of a request being the number of comments it asks for,
+    so that a few large requests cannot take all the database connections and scoring workers.
+
+    A request is admitted right away while the capacity allows it and no request is waiting. Otherwise it waits in
+    the queue of its client, and the clients are served in turn, one request each, so that a client sending many
+    requests does not delay the others more than its own. A request is rejected when it would wait for longer than
+    `max_queue_wait` seconds, when `max_queue_size` requests are already waiting, or when its client already has
+    `max_client_queue` requests waiting.
+    """
+
+    def __init__(
+        self,
+        capacity: int = ADMISSION_CAPACITY,
+        max_queue_wait: float = ADMISSION_MAX_QUEUE_WAIT,
+        max_queue_size: int = ADMISSION_MAX_QUEUE_SIZE,
+        max_client_queue: int = ADMISSION_MAX_CLIENT_QUEUE,
+    ):
+        """
+        Initializes the AdmissionController instance.
+
+        Args:
+            capacity (int): The total cost of the requests served at once, 0 to admit every request. Defaults to
+                ADMISSION_CAPACITY.
+            max_queue_wait (float): Seconds a request may wait to be admitted. Defaults to ADMISSION_MAX_QUEUE_WAIT.
+            max_queue_size (int): Number of requests that may wait at once. Defaults to ADMISSION_MAX_QUEUE_SIZE.
+            max_client_queue (int): Number of requests of a client that may wait at once. Defaults to
+                ADMISSION_MAX_CLIENT_QUEUE.
+        """
+        self.capacity = capacity
+        self.max_queue_wait = max_queue_wait
+        self.max_queue_size = max_queue_size
+        self.max_client_queue = max_client_queue
+        self.in_use = 0
+        self.in_flight = 0
+        # client -> its waiting requests, in the order the clients are served
+        self.queues: "OrderedDict[str, Deque[Waiter]]" = OrderedDict()
+        self.queued = 0
+
+        # Counters used to size the capacity and the queue
+        self.admitted = 0
+        self.waited = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.rejected_overloaded = 0
+        self.rejected_client = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    @property
+    def retry_after(self) -> int:
+        """
+        The seconds a rejected request is asked to wait before being retried, the time the queue takes to move.
+        """
+        return max(1, math.ceil(self.max_queue_wait))
+
+    def stats(self) -> dict:
+        """
+        Returns the state and the counters of the admission control.
+
+        Returns:
+            dict: The capacity and the part of it in use, the requests in flight and waiting, the number of clients
+            waiting, the requests admitted, the ones that waited and how long, and the rejected ones.
+        """
+        return {
+            "capacity": self.capacity,
+            "in_use": self.in_use,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "queued_clients": len(self.queues),
+            "admitted": self.admitted,
+            "waited": self.waited,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+            "rejected_overloaded": self.rejected_overloaded,
+            "rejected_client": self.rejected_client,
+        }
+
+    @asynccontextmanager
+    async def admit(self, client: str, cost: int):
+        """
+        Admits a request for the time of the context, waiting for its turn if the capacity is used.
+
+        Args:
+            client (str): The client sending the request.
+            cost (int): The number of comments the request asks for. A request costing more than the capacity is
+                admitted alone.
+
+        Raises:
+            ClientQueueFullError: If the client already has `max_client_queue` requests waiting.
+            OverloadedError: If `max_queue_size` requests are waiting, or the request waited for `max_queue_wait`
+                seconds without being admitted.
+        """
+        if not self.enabled:
+            yield
+            return
+
+        cost = min(max(cost, 1), self.capacity)
+
+        # Admit the request right away only when no earlier request is waiting, so that none is overtaken
+        if not self.queues and self.in_use + cost <= self.capacity:
+            self.in_use += cost
+        else:
+            await self.wait(client, cost)
+
+        self.admitted += 1
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self.release(cost)
+
+    async def wait(self, client: str, cost: int):
+        """
+        Queues a request until it is admitted, its cost being then counted as in use.
+
+        Args:
+            client (str): The client sending the request.
+            cost (int): The cost of the request, at most the capacity.
+
+        Raises:
+            ClientQueueFullError: If the client already has `max_client_queue` requests waiting.
+            OverloadedError: If the queue is full, or the request waited for `max_queue_wait` seconds.
+        """
+        queue = self.queues.get(client)
+        if queue is not None and len(queue) >= self.max_client_queue:
+            self.rejected_client += 1
+            raise ClientQueueFullError(
+                f"Too many requests of client {client} are waiting, retry later.", self.retry_after
+            )
+
+        if self.queued >= self.max_queue_size:
+            self.rejected_overloaded += 1
+            raise OverloadedError("The API is overloaded, retry later.", self.retry_after)
+
+        waiter = Waiter(client, cost)
+        self.queues.setdefault(client, deque()).append(waiter)
+        self.queued += 1
+
+        start = time.perf_counter()
+        try:
+            with metrics.stage("admission"):
+                done, _ = await asyncio.wait({waiter.future}, timeout=self.max_queue_wait)
+        except asyncio.CancelledError:
+            # The client went away while waiting
+            self.abandon(waiter)
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            self.waited += 1
+            self.wait_seconds_total += elapsed
+            self.wait_seconds_max = max(self.wait_seconds_max, elapsed)
+
+        if not done:
+            self.abandon(waiter)
+            self.rejected_overloaded += 1
+            logger.warning(
+                "Rejected a request of client %s after waiting %.1fs to be admitted",
+                client,
+                self.max_queue_wait,
+                extra={"client": client, "cost": cost},
+            )
+            raise OverloadedError("The API is overloaded, retry later.", self.retry_after)
+
+    def abandon(self, waiter: Waiter):
+        """
+        Removes a request that stopped waiting from the queue, or gives its capacity back if it was admitted
+        in the meantime.
+
+        Args:
+            waiter (Waiter): The request.
+        """
+        if waiter.future.done():
+            self.release(waiter.cost)
+            return
+
+        waiter.future.cancel()
+        queue = self.queues[waiter.client]
+        queue.remove(waiter)
+        self.queued -= 1
+        if not queue:
+            del self.queues[waiter.client]
+
+        # The request may have been holding back the smaller ones behind it
+        self.dispatch()
+
+    def release(self, cost: int):
+        """
+        Gives the capacity of a request back, and admits the waiting requests it makes room for.
+
+        Args:
+            cost (int): The cost of the request.
+        """
+        self.in_use -= cost
+        self.dispatch()
+
+    def dispatch(self):
+        """
+        Admits the waiting requests while the capacity allows it, taking the next request of each client in turn.
+        The next request is never skipped for a cheaper one, so that expensive requests are not starved.
+        """
+        while self.queues:
+            client, queue = next(iter(self.queues.items()))
+            waiter = queue[0]
+            if self.in_use + waiter.cost > self.capacity:
+                break
+
+            queue.popleft()
+            self.queued -= 1
+            if queue:
+                # The client's next request waits for the other clients' turn
+                self.queues.move_to_end(client)
+            else:
+                del self.queues[client]
+
+            self.in_use += waiter.cost
+            waiter.future.set_result(None)
+
+
+def client_of(request) -> str:
+    """
+    Identifies the client of a request, by the ADMISSION_CLIENT_HEADER header if set and sent, by its address
+    otherwise.
+
+    Args:
+        request (Optional[Request]): The request.
+
+    Returns:
+        str: The identifier of the client.
+    """
+    if request is None:
+        return "unknown"
+
+    if ADMISSION_CLIENT_HEADER and request.headers.get(ADMISSION_CLIENT_HEADER):
+        # A list of forwarded addresses starts with the client's
+        return request.headers[ADMISSION_CLIENT_HEADER].split(",")[0].strip()
+
+    return request.client.host if request.client else "unknown"
@@ -1,8 +1,23 @@
-from typing import List, Optional, Tuple
+import asyncio
+import itertools
+import os
+import time
+from typing import AsyncIterator, List, Mapping, Optional, Tuple, Union
 
-from textblob import TextBlob
+import orjson
 
-from app.database.postgre import PostgreClient
+from app import metrics
+from app.database.postgre import PostgreClient, SubfedditNotFoundError
+from app.database.subfeddit_cache import SubfedditCache
+from app.handlers.cursor import decode_cursor, encode_cursor
+from app.handlers.response_cache import ResponseCache, compute_etag
+from app.scoring.backfill import PolarityBackfill
+from app.scoring.cache import POLARITY_CACHE_BACKEND, PolarityCache, build_backend
+from app.scoring.engine import ScoringEngine
+from app.scoring.polarity import get_polarity
+
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", 500))
+COMMENTS_BATCH_CONCURRENCY = int(os.getenv("COMMENTS_BATCH_CONCURRENCY", 8))
 
 
 class CommentsHandler:
@@ -14,13 +29,23 @@ class CommentsHandler:
     def __init__(self):
         """
         Initializes the CommentsHandler instance and establishes a database client connection
-        using PostgreClient for querying data.
+        using PostgreClient for querying data, with a SubfedditCache to resolve subfeddit names,
+        and a ScoringEngine to analyze comments off the event loop.
+        Already analyzed comments are served from a PolarityCache, and a PolarityBackfill precomputes
+        the sentiment of the comments in the database. Identical requests are served from a ResponseCache.
         """
 
         self.db_client = PostgreClient()
+        self.subfeddit_cache = SubfedditCache(self.db_client)
+        self.scoring_engine = ScoringEngine()
+        self.polarity_cache = PolarityCache(
+            backend=build_backend(POLARITY_CACHE_BACKEND, self.db_client)
+        )
+        self.polarity_backfill = PolarityBackfill(self.db_client, self.scoring_engine)
+        self.response_cache = ResponseCache()
 
     @staticmethod
-    def get_polarity(text: str) -> Tuple[str, str]:
+    def get_polarity(text: str) -> Tuple[float, str]:
         """
         Analyzes the sentiment of the given text using TextBlob and returns its polarity score
         and classification ('positive', 'negative', or 'neutral') based on the polarity score.
@@ -29,20 +54,118 @@ class CommentsHandler:
             text (str): The text whose sentiment is to be analyzed.
 
         Returns:
-            Tuple[str, str]: A tuple containing the polarity score (float) and the sentiment classification (str).
+            Tuple[float, str]: A tuple containing the polarity score (float) and the sentiment classification (str).
+        """
+        return get_polarity(text)
+
+    async def score_comments(self, comments: List[dict]) -> List[Tuple[float, str]]:
+        """
+        Scores the given comments, reusing the cached scores of the comments whose text did not change
+        and scoring the others in one batch on the scoring engine.
+
+        Args:
+            comments (List[dict]): The comments to be scored, with their 'id' and 'text'.
+
+        Returns:
+            List[Tuple[float, str]]: The polarity score and classification of each comment, in order.
+        """
+        with metrics.stage("polarity_cache"):
+            cached_scores = await self.polarity_cache.get_many(comments)
+        missing = [comment for comment in comments if comment["id"] not in cached_scores]
+
+        # Score the comments missing from the cache in one batch, and cache their scores
+        if missing:
+            start = time.perf_counter()
+            scores = await self.scoring_engine.score_batch(
+                [comment["text"] for comment in missing]
+            )
+            metrics.record_scoring(time.perf_counter() - start, len(missing))
+            await self.polarity_cache.set_many(zip(missing, scores))
+            cached_scores.update(
+                (comment["id"], score) for comment, score in zip(missing, scores)
+            )
+
+        return [cached_scores[comment["id"]] for comment in comments]
+
+    async def get_polarities(self, comments: List[Mapping]) -> List[Tuple[float, str]]:
+        """
+        Returns the polarity score and classification of the comments retrieved from the database: the precomputed
+        ones, and for the comments without one, their scores computed on the fly, reusing the cached scores.
+
+        Args:
+            comments (List[Mapping]): The comments retrieved from the database.
+
+        Returns:
+            List[Tuple[float, str]]: The polarity score and classification of each comment, in order.
+        """
+        unscored_comments = [
+            comment for comment in comments if comment["polarity_score"] is None
+        ]
+        scores = iter(await self.score_comments(unscored_comments))
+
+        return [
+            next(scores)
+            if comment["polarity_score"] is None
+            else (comment["polarity_score"], comment["polarity_classification"])
+            for comment in comments
+        ]
+
+    async def with_polarities(self, comments: List[Mapping]) -> List[dict]:
+        """
+        Builds the comments retrieved from the database as `Comment` dictionaries, with their polarity score and
+        classification, scoring the comments retrieved without a precomputed score.
+
+        Args:
+            comments (List[Mapping]): The comments retrieved from the database.
+
+        Returns:
+            List[dict]: The comments, with only the fields of `Comment`.
+        """
+        return [
+            {
+                "id": comment["id"],
+                "text": comment["text"],
+                "polarity_score": polarity_score,
+                "polarity_classification": polarity_classification,
+            }
+            for comment, (polarity_score, polarity_classification) in zip(
+                comments, await self.get_polarities(comments)
+            )
+        ]
+
+    async def fetch_comments(self, subfeddit_name: str, **filters) -> List[Mapping]:
+        """
+        Retrieves a page of comments of a subfeddit from the database in a single round trip. Subfeddits
+        found in the cache are queried by ID; the others are resolved by name within the comments query,
+        and the result is recorded in the cache.
+
+        Args:
+            subfeddit_name (str): The name of the subfeddit from which to fetch comments.
+            **filters: The filters of `PostgreClient.get_comments`.
+
+        Returns:
+            List[Mapping]: The comments, as returned by `PostgreClient.get_comments`.
+
+        Raises:
+            SubfedditNotFoundError: If no subfeddit is found with the given name.
         """
-        blob = TextBlob(text)
-        polarity = blob.sentiment.polarity
+        subfeddit_id = self.subfeddit_cache.lookup(subfeddit_name)
+        if subfeddit_id is not None:
+            return await self.db_client.get_comments(subfeddit_id=subfeddit_id, **filters)
+
+        if self.subfeddit_cache.is_unknown(subfeddit_name):
+            raise SubfedditNotFoundError(f"Subfeddit '{subfeddit_name}' not found.")
 
-        # Classifying sentiment based on the polarity score
-        if polarity > 0.1:
-            polarity_classification = "positive"
-        elif polarity < -0.1:
-            polarity_classification = "negative"
-        else:
-            polarity_classification = "neutral"
+        try:
+            subfeddit_id, comments = await self.db_client.get_comments_by_title(
+                subfeddit_name=subfeddit_name, **filters
+            )
+        except SubfedditNotFoundError:
+            self.subfeddit_cache.add_unknown(subfeddit_name)
+            raise
 
-        return polarity, polarity_classification
+        self.subfeddit_cache.add(subfeddit_name, subfeddit_id)
+        return comments
 
     async def get_comments(
         self,
@@ -53,10 +176,14 @@ class CommentsHandler:
         n_comments: int = 25,
         min_polarity: str = -1,
         max_polarity: str = 1,
-    ) -> List[dict]:
+        cursor: Optional[str] = None,
+        search: Optional[str] = None,
+    ) -> Tuple[List[dict], Optional[str]]:
         """
-        Fetches comments from a specific subfeddit, analyzes their sentiment, and applies filters
-        such as date range, polarity range, and sorting by polarity.
+        Fetches a page of comments from a specific subfeddit with their sentiment, and applies filters
+        such as date range, polarity range, and sorting by polarity. Comments whose sentiment
+        has not been precomputed yet are analyzed on the fly; they can only be returned when
+        the comments are neither filtered nor sorted by polarity.
 
         Args:
             subfeddit_name (str): The name of the subfeddit from which to fetch comments.
@@ -66,40 +193,238 @@ class CommentsHandler:
             n_comments (int): Number of comments to fetch. Defaults to 25.
             min_polarity (str): Minimum polarity value to filter comments. Defaults to -1 (allow all).
             max_polarity (str): Maximum polarity value to filter comments. Defaults to 1 (allow all).
+            cursor (Optional[str]): Cursor returned with the previous page, to fetch the next one. Defaults to None.
+            search (Optional[str]): Web search style query the comments must match. Defaults to None.
 
         Returns:
-            List[dict]: A list of comments with sentiment analysis results and optional filters applied.
+            Tuple[List[dict], Optional[str]]: A list of comments with sentiment analysis results and optional
+            filters applied, and the cursor of the next page (None when this page is the last one).
+
+        Raises:
+            InvalidCursorError: If the cursor is malformed or was issued for another sort order.
+            SubfedditNotFoundError: If no subfeddit is found with the given name.
         """
-        # Retrieve the ID of the subfeddit from the database
-        subfeddit_id = await self.db_client.get_subfeddit_id(
-            subfeddit_name=subfeddit_name
+        comments = await self.fetch_page(
+            subfeddit_name=subfeddit_name,
+            from_date=from_date,
+            to_date=to_date,
+            polarity_sorting=polarity_sorting,
+            n_comments=n_comments,
+            min_polarity=min_polarity,
+            max_polarity=max_polarity,
+            cursor=cursor,
+            search=search,
         )
 
-        # Retrieve the comments from the database for the given subfeddit, with optional filters
-        retrieved_comments = await self.db_client.get_comments(
-            subfeddit_id=subfeddit_id,
+        # Score the comments that have no precomputed score yet. The cursor is taken from the records, which also hold
+        # the sort key of the comments
+        return (
+            await self.with_polarities(comments),
+            self.next_cursor(comments, n_comments, polarity_sorting),
+        )
+
+    async def get_comments_cached(
+        self,
+        subfeddit_name: str,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        polarity_sorting: str = None,
+        n_comments: int = 25,
+        min_polarity: str = -1,
+        max_polarity: str = 1,
+        cursor: Optional[str] = None,
+        search: Optional[str] = None,
+    ) -> Tuple[bytes, Optional[str], str]:
+        """
+        Fetches a page of comments like `get_comments`, already serialized as JSON, from the response cache when the
+        same page was requested recently. Concurrent identical requests missing the cache share a single `get_comments`
+        call, and the serialized page is cached so that cache hits are not serialized again.
+
+        Returns:
+            Tuple[bytes, Optional[str], str]: The JSON array of the comments, the cursor of the next page and the
+            entity tag of both.
+
+        Raises:
+            InvalidCursorError: If the cursor is malformed or was issued for another sort order.
+            SubfedditNotFoundError: If no subfeddit is found with the given name.
+        """
+        key = (
+            subfeddit_name,
+            from_date,
+            to_date,
+            polarity_sorting,
+            int(n_comments),
+            float(min_polarity),
+            float(max_polarity),
+            cursor,
+            search,
+        )
+
+        async def get_page() -> Tuple[bytes, Optional[str]]:
+            comments, next_cursor = await self.get_comments(
+                subfeddit_name=subfeddit_name,
+                from_date=from_date,
+                to_date=to_date,
+                polarity_sorting=polarity_sorting,
+                n_comments=n_comments,
+                min_polarity=min_polarity,
+                max_polarity=max_polarity,
+                cursor=cursor,
+                search=search,
+            )
+            # The comments already have the types of `Comment`, so they are serialized without validating each of them
+            with metrics.stage("json_encoding"):
+                return orjson.dumps(comments), next_cursor
+
+        # The cursor follows from the comments, so the entity tag only covers the serialized comments
+        (body, next_cursor), etag = await self.response_cache.get(
+            key, get_page, etag_of=lambda page: compute_etag(page[0])
+        )
+
+        return body, next_cursor, etag
+
+    async def get_comments_batch(
+        self, queries: List[dict], concurrency: int = COMMENTS_BATCH_CONCURRENCY
+    ) -> List[Union[Tuple[List[dict], Optional[str]], Exception]]:
+        """
+        Fetches a page of comments for each of the given queries, like `get_comments`. The pages are fetched
+        concurrently, with at most `concurrency` queries holding a database connection at once, and the comments
+        of all the pages are then scored in a single batch. A failing query does not fail the others.
+
+        Args:
+            queries (List[dict]): The keyword arguments of `get_comments` of each query.
+            concurrency (int): The maximum number of queries run at once. Defaults to COMMENTS_BATCH_CONCURRENCY.
+
+        Returns:
+            List[Union[Tuple[List[dict], Optional[str]], Exception]]: For each query, in order, the page of comments
+            and the cursor of the next page as returned by `get_comments`, or the exception raised by the query.
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def fetch(query: dict) -> List[Mapping]:
+            async with semaphore:
+                return await self.fetch_page(**query)
+
+        pages = await asyncio.gather(
+            *(fetch(query) for query in queries), return_exceptions=True
+        )
+
+        # Score the comments of all the pages that have no precomputed score yet at once
+        comments = iter(
+            await self.with_polarities(
+                [
+                    comment
+                    for page in pages
+                    if not isinstance(page, BaseException)
+                    for comment in page
+                ]
+            )
+        )
+
+        return [
+            page
+            if isinstance(page, BaseException)
+            else (
+                list(itertools.islice(comments, len(page))),
+                self.next_cursor(
+                    page, query.get("n_comments", 25), query.get("polarity_sorting")
+                ),
+            )
+            for query, page in zip(queries, pages)
+        ]
+
+    async def fetch_page(
+        self,
+        subfeddit_name: str,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        polarity_sorting: str = None,
+        n_comments: int = 25,
+        min_polarity: str = -1,
+        max_polarity: str = 1,
+        cursor: Optional[str] = None,
+        search: Optional[str] = None,
+    ) -> List[Mapping]:
+        """
+        Retrieves a page of comments of a subfeddit from the database, with the arguments of `get_comments`,
+        without scoring the comments that have no precomputed score yet.
+
+        Returns:
+            List[Mapping]: The comments, as returned by `PostgreClient.get_comments`.
+
+        Raises:
+            InvalidCursorError: If the cursor is malformed or was issued for another sort order.
+            SubfedditNotFoundError: If no subfeddit is found with the given name.
+        """
+        # Decode the cursor first, so that an invalid one fails before querying the database
+        after = decode_cursor(cursor, polarity_sorting) if cursor else None
+
+        # Retrieve the comments from the database for the given subfeddit, with optional filters.
+        # Filtering and sorting by polarity are done by the database on the precomputed scores.
+        return await self.fetch_comments(
+            subfeddit_name=subfeddit_name,
             from_date=from_date,
             to_date=to_date,
             n_comments=n_comments,
+            min_polarity=min_polarity,
+            max_polarity=max_polarity,
+            polarity_sorting=polarity_sorting,
+            after=after,
+            search=search,
         )
-        comments = []
 
-        # Process each retrieved comment
-        for comment in retrieved_comments:
-            # Get the polarity score and classification for the comment text
-            polarity_score, polarity_classification = self.get_polarity(comment["text"])
+    @staticmethod
+    def next_cursor(
+        comments: List[dict], n_comments: int, polarity_sorting: Optional[str]
+    ) -> Optional[str]:
+        """
+        Returns the cursor of the page following the given one, or None when it is the last one.
+        A full page may be followed by more comments, so the next page starts after its last comment.
+        """
+        if comments and len(comments) == n_comments:
+            return encode_cursor(polarity_sorting, comments[-1])
+
+        return None
+
+    async def stream_comments(
+        self,
+        subfeddit_name: str,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        polarity_sorting: str = None,
+        min_polarity: float = -1,
+        max_polarity: float = 1,
+        batch_size: int = STREAM_BATCH_SIZE,
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Prepares a stream of all the comments of a specific subfeddit with their sentiment, with the same
+        filters as `get_comments`. The subfeddit is resolved right away, so that an unknown subfeddit fails
+        before anything is streamed; the comments are then read and scored batch by batch as the stream is consumed.
 
-            # Add polarity score and classification to the comment
-            comment["polarity_score"] = polarity_score
-            comment["polarity_classification"] = polarity_classification
+        Args:
+            subfeddit_name (str): The name of the subfeddit from which to stream comments.
+            from_date (Optional[str]): Start date for filtering comments (inclusive). Defaults to None.
+            to_date (Optional[str]): End date for filtering comments (inclusive). Defaults to None.
+            polarity_sorting (str): 'asc' or 'desc' to sort comments by polarity score. Defaults to None.
+            min_polarity (float): Minimum polarity value to filter comments. Defaults to -1 (allow all).
+            max_polarity (float): Maximum polarity value to filter comments. Defaults to 1 (allow all).
+            batch_size (int): Number of comments read and scored at once. Defaults to STREAM_BATCH_SIZE.
 
-            # Filter comments based on the given polarity range (min_polarity to max_polarity)
-            if polarity_score >= min_polarity and polarity_score <= max_polarity:
-                comments.append(comment)
+        Returns:
+            AsyncIterator[List[dict]]: The batches of comments with sentiment analysis results.
+        """
+        subfeddit_id = await self.subfeddit_cache.get_id(subfeddit_name)
 
-        # If polarity sorting is requested, sort comments by their polarity score
-        if polarity_sorting:
-            reverse = True if polarity_sorting == "desc" else False
-            comments.sort(key=lambda x: x["polarity_score"], reverse=reverse)
+        async def scored_batches():
+            async for comments in self.db_client.stream_comments(
+                subfeddit_id=subfeddit_id,
+                from_date=from_date,
+                to_date=to_date,
+                min_polarity=min_polarity,
+                max_polarity=max_polarity,
+                polarity_sorting=polarity_sorting,
+                batch_size=batch_size,
+            ):
+                yield await self.with_polarities(comments)
 
-        return comments
+        return scored_batches()
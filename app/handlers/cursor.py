@@ -0,0 +1,85 @@
+import base64
+import binascii
+import json
+import math
+from typing import Any, List, Optional
+
+# Range of the BIGINT columns the integer keys of a cursor are compared to
+BIGINT_MIN, BIGINT_MAX = -(2**63), 2**63 - 1
+
+
+class InvalidCursorError(ValueError):
+    """
+    Raised when a pagination cursor cannot be decoded, or was issued for another sort order.
+    """
+
+
+def sort_key(polarity_sorting: Optional[str]) -> str:
+    """
+    Returns the name of the sort order a cursor is bound to.
+
+    Args:
+        polarity_sorting (Optional[str]): 'asc' or 'desc' when comments are sorted by polarity, None otherwise.
+
+    Returns:
+        str: 'polarity_asc', 'polarity_desc' or 'created_at'.
+    """
+    return f"polarity_{polarity_sorting}" if polarity_sorting else "created_at"
+
+
+def is_bigint(value: Any) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool) and BIGINT_MIN <= value <= BIGINT_MAX
+
+
+def is_score(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def encode_cursor(polarity_sorting: Optional[str], comment: dict) -> str:
+    """
+    Builds the opaque cursor pointing after the given comment, i.e. the last comment of a page.
+
+    Args:
+        polarity_sorting (Optional[str]): The sort order of the page.
+        comment (dict): The last comment of the page.
+
+    Returns:
+        str: The URL-safe cursor.
+    """
+    sort = sort_key(polarity_sorting)
+    value = comment["created_at"] if sort == "created_at" else comment["polarity_score"]
+    payload = json.dumps({"s": sort, "k": [value, comment["id"]]}, separators=(",", ":"))
+
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str, polarity_sorting: Optional[str]) -> List:
+    """
+    Decodes a cursor into the keyset values of the last comment of the previous page.
+
+    Args:
+        cursor (str): The cursor returned with the previous page.
+        polarity_sorting (Optional[str]): The sort order of the requested page.
+
+    Returns:
+        List: The (created_at or polarity_score, id) values of the last comment of the previous page.
+
+    Raises:
+        InvalidCursorError: If the cursor is malformed, its keys are not of the types of the sort order, or it was
+            issued for another sort order.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        sort, (value, comment_id) = payload["s"], payload["k"]
+    except (binascii.Error, UnicodeError, ValueError, KeyError, TypeError):
+        raise InvalidCursorError("Invalid cursor.")
+
+    if sort != sort_key(polarity_sorting):
+        raise InvalidCursorError("The cursor was issued for another polarity_sorting.")
+
+    # Check the keys against the columns they are compared to, so that a tampered cursor does not reach the database
+    value_is_valid = is_bigint(value) if sort == "created_at" else is_score(value)
+    if not value_is_valid or not is_bigint(comment_id):
+        raise InvalidCursorError("Invalid cursor.")
+
+    return [value, comment_id]
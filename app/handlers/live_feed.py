@@ -0,0 +1,452 @@
+import asyncio
+import contextvars
+import logging
+import os
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set
+
+LIVE_POLL_INTERVAL = float(os.getenv("LIVE_POLL_INTERVAL", 1))
+LIVE_BATCH_SIZE = int(os.getenv("LIVE_BATCH_SIZE", 500))
+# Number of comments buffered for a subscriber that reads slower than they are scored, before its stream is ended
+LIVE_BUFFER_SIZE = int(os.getenv("LIVE_BUFFER_SIZE", 1000))
+LIVE_HEARTBEAT_INTERVAL = float(os.getenv("LIVE_HEARTBEAT_INTERVAL", 15))
+LIVE_NOTIFY_CHANNEL = os.getenv("LIVE_NOTIFY_CHANNEL", "")
+# Number of change sequence numbers below the watermark of a feed read again at each poll, for the scores committed
+# after later ones were already read, e.g. when several workers write at once
+LIVE_REREAD_WINDOW = int(os.getenv("LIVE_REREAD_WINDOW", 2000))
+
+logger = logging.getLogger(__name__)
+
+
+class LiveFeedOverflowError(Exception):
+    """
+    Raised when a subscriber did not read its comments fast enough and its buffer is full.
+    """
+
+
+class Subscriber:
+    """
+    A client of a live feed, with its polarity filters and the buffer of the comments still to be sent to it.
+    """
+
+    def __init__(
+        self,
+        min_polarity: float = -1,
+        max_polarity: float = 1,
+        after_seq: int = 0,
+        buffer_size: int = LIVE_BUFFER_SIZE,
+    ):
+        """
+        Initializes the Subscriber instance.
+
+        Args:
+            min_polarity (float): The minimum polarity score of the comments sent. Defaults to -1.
+            max_polarity (float): The maximum polarity score of the comments sent. Defaults to 1.
+            after_seq (int): The change sequence number of the last comment the client already has, when it resumes
+                its stream. Defaults to 0.
+            buffer_size (int): The number of comments buffered at most. Defaults to LIVE_BUFFER_SIZE.
+        """
+        self.min_polarity = min_polarity
+        self.max_polarity = max_polarity
+        self.after_seq = after_seq
+        # Change sequence numbers of the comments sent from the backlog within the re-read window of the feed, which
+        # the feed hands over too when they were committed late
+        self.sent: Set[int] = set()
+        self.buffer_size = buffer_size
+        self.buffer: Deque[dict] = deque()
+        self.ready = asyncio.Event()
+        self.overflowed = False
+
+    def matches(self, comment: dict) -> bool:
+        """
+        Tells whether a comment is to be sent to the subscriber: it is not sent yet and matches its filters.
+        """
+        return (
+            comment["change_seq"] > self.after_seq
+            and comment["change_seq"] not in self.sent
+            and self.min_polarity <= comment["polarity_score"] <= self.max_polarity
+        )
+
+    def offer(self, comments: List[dict]) -> int:
+        """
+        Buffers the comments matching the filters of the subscriber. Once its buffer is full, the subscriber
+        overflows: no comment is buffered anymore, and its stream ends once the buffer is sent, so that a slow client
+        cannot make the feed hold an unbounded number of comments.
+
+        Args:
+            comments (List[dict]): The new comments of the feed, in the order they were read.
+
+        Returns:
+            int: The number of comments buffered.
+        """
+        if self.overflowed:
+            return 0
+
+        count = 0
+        for comment in comments:
+            if not self.matches(comment):
+                continue
+            if len(self.buffer) >= self.buffer_size:
+                self.overflowed = True
+                break
+            self.buffer.append(comment)
+            count += 1
+
+        if count or self.overflowed:
+            self.ready.set()
+        return count
+
+    async def next_batch(self, timeout: Optional[float] = None) -> List[dict]:
+        """
+        Waits for comments to be buffered, then takes all of them.
+
+        Args:
+            timeout (Optional[float]): Seconds to wait at most, None to wait until comments come. Defaults to None.
+
+        Returns:
+            List[dict]: The buffered comments, in the order they were read, empty when none came within the timeout.
+
+        Raises:
+            LiveFeedOverflowError: If the subscriber overflowed and its buffer was sent.
+        """
+        if not self.buffer and not self.overflowed:
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.ready.clear()
+
+        if not self.buffer and self.overflowed:
+            raise LiveFeedOverflowError(
+                f"More than {self.buffer_size} comments were waiting to be sent, resume from the last one received."
+            )
+
+        # The comments buffered before the backlog sent them are not sent twice
+        batch = [comment for comment in self.buffer if comment["change_seq"] not in self.sent]
+        self.buffer.clear()
+        return batch
+
+
+class SubfedditFeed:
+    """
+    The live feed of a subfeddit: its subscribers, the watermark of its poller, i.e. the greatest change sequence number
+    read, and the comments read within the re-read window below it.
+    """
+
+    def __init__(self, subfeddit_id: int, watermark: int):
+        self.subfeddit_id = subfeddit_id
+        self.watermark = watermark
+        self.seen: Set[int] = set()
+        self.subscribers: Set[Subscriber] = set()
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+class LiveFeeds:
+    """
+    Feeds the subscribers of each subfeddit with its comments as they are scored. A single poller per subfeddit with
+    subscribers reads the comments scored after its watermark, every `poll_interval` seconds or as soon as a
+    notification is received on `notify_channel`, and fans them out to all the subscribers, which filter them by
+    polarity. The database load thus depends on the number of subfeddits followed, not on the number of subscribers.
+
+    Comments are read in the order their scores were written, by the change sequence number each write takes, so the
+    comments scored out of ID order, e.g. by several scoring workers, and the comments scored again are sent as well.
+    As a score is committed after it takes its number, one committed after later ones were already read, e.g. when two
+    workers write at once, is below the watermark: each poll reads the `reread_window` numbers below the watermark
+    again, and hands over the comments it did not read yet, once. Only the scores committed after `reread_window`
+    later ones are missed.
+    """
+
+    def __init__(
+        self,
+        db_client,
+        poll_interval: float = LIVE_POLL_INTERVAL,
+        batch_size: int = LIVE_BATCH_SIZE,
+        buffer_size: int = LIVE_BUFFER_SIZE,
+        notify_channel: str = LIVE_NOTIFY_CHANNEL,
+        reread_window: int = LIVE_REREAD_WINDOW,
+    ):
+        """
+        Initializes the LiveFeeds instance, without any feed.
+
+        Args:
+            db_client (PostgreClient): The client used to read the scored comments.
+            poll_interval (float): Seconds between two polls of a feed. Defaults to LIVE_POLL_INTERVAL.
+            batch_size (int): Number of comments read at once. Defaults to LIVE_BATCH_SIZE.
+            buffer_size (int): Number of comments buffered at most per subscriber. Defaults to LIVE_BUFFER_SIZE.
+            notify_channel (str): Channel whose notifications trigger a poll right away, '' to disable. Defaults to
+                LIVE_NOTIFY_CHANNEL.
+            reread_window (int): Number of change sequence numbers below the watermark read again at each poll.
+                Defaults to LIVE_REREAD_WINDOW.
+        """
+        self.db_client = db_client
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self.notify_channel = notify_channel
+        self.reread_window = reread_window
+        self.feeds: Dict[int, SubfedditFeed] = {}
+        self.listen_conn = None
+
+        # Counters showing how many polls the feeds save
+        self.polls = 0
+        self.comments_read = 0
+        self.comments_sent = 0
+        self.comments_late = 0
+        self.overflows = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the state and the counters of the live feeds.
+
+        Returns:
+            dict: The number of feeds and subscribers, the polls run, the comments read and sent, the comments read
+            below the watermark as they were committed late, and the subscribers whose stream was ended because their
+            buffer was full.
+        """
+        return {
+            "feeds": len(self.feeds),
+            "subscribers": sum(len(feed.subscribers) for feed in self.feeds.values()),
+            "polls": self.polls,
+            "comments_read": self.comments_read,
+            "comments_sent": self.comments_sent,
+            "comments_late": self.comments_late,
+            "overflows": self.overflows,
+        }
+
+    async def poll(self, feed: SubfedditFeed) -> int:
+        """
+        Reads the comments of a feed scored after its watermark, advancing it, and the ones committed late within the
+        re-read window below it, and hands the comments it did not read yet to its subscribers.
+
+        Args:
+            feed (SubfedditFeed): The feed.
+
+        Returns:
+            int: The number of comments read for the first time.
+        """
+        count = 0
+        after_seq = max(feed.watermark - self.reread_window, 0)
+        while True:
+            self.polls += 1
+            rows = await self.db_client.get_live_comments(feed.subfeddit_id, after_seq, self.batch_size)
+            if not rows:
+                break
+
+            after_seq = rows[-1]["change_seq"]
+            comments = [dict(row) for row in rows if row["change_seq"] not in feed.seen]
+            if comments:
+                # The comments below the watermark were committed after later ones were read
+                self.comments_late += sum(1 for comment in comments if comment["change_seq"] <= feed.watermark)
+                feed.seen.update(comment["change_seq"] for comment in comments)
+                count += len(comments)
+                self.comments_read += len(comments)
+                for subscriber in feed.subscribers:
+                    subscriber.offer(comments)
+            feed.watermark = max(feed.watermark, after_seq)
+
+            if len(rows) < self.batch_size:
+                break
+
+        # Forget the comments below the re-read window, which are not read again
+        floor = feed.watermark - self.reread_window
+        feed.seen = {seq for seq in feed.seen if seq > floor}
+        return count
+
+    async def prime(self, feed: SubfedditFeed):
+        """
+        Reads the comments of the re-read window below the watermark of a new feed, which were scored before it
+        started, so that they are not taken for comments committed late.
+
+        Args:
+            feed (SubfedditFeed): The feed, without subscribers yet.
+        """
+        after_seq = max(feed.watermark - self.reread_window, 0)
+        while after_seq < feed.watermark:
+            rows = await self.db_client.get_live_comments(feed.subfeddit_id, after_seq, self.batch_size)
+            if not rows:
+                return
+
+            after_seq = rows[-1]["change_seq"]
+            feed.seen.update(row["change_seq"] for row in rows if row["change_seq"] <= feed.watermark)
+
+            if len(rows) < self.batch_size:
+                return
+
+    async def poll_forever(self, feed: SubfedditFeed):
+        """
+        Polls a feed every `poll_interval` seconds, or as soon as it is woken up, until cancelled. Failed polls are
+        logged and retried at the next one.
+        """
+        while True:
+            feed.wakeup.clear()
+            try:
+                await self.poll(feed)
+            except Exception as e:
+                logger.error("Error while polling the live feed of subfeddit %s: %s", feed.subfeddit_id, e)
+
+            try:
+                await asyncio.wait_for(feed.wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    @asynccontextmanager
+    async def subscribe(self, subfeddit_id: int, min_polarity: float = -1, max_polarity: float = 1, after_seq: int = 0):
+        """
+        Subscribes to the feed of a subfeddit for the time of the context, starting its poller if it has none.
+        The poller stops with its last subscriber.
+
+        Args:
+            subfeddit_id (int): The ID of the subfeddit.
+            min_polarity (float): The minimum polarity score of the comments. Defaults to -1.
+            max_polarity (float): The maximum polarity score of the comments. Defaults to 1.
+            after_seq (int): The change sequence number of the last comment the subscriber already has. Defaults to 0.
+
+        Yields:
+            Tuple[Subscriber, int]: The subscriber, and the watermark of the feed when it subscribed, from which
+            the comments are buffered.
+        """
+        feed = self.feeds.get(subfeddit_id)
+        if feed is None:
+            new_feed = SubfedditFeed(subfeddit_id, await self.db_client.get_live_watermark(subfeddit_id))
+            await self.prime(new_feed)
+            # Another subscriber may have started the feed meanwhile
+            feed = self.feeds.get(subfeddit_id)
+            if feed is None:
+                feed = self.feeds[subfeddit_id] = new_feed
+                # The poller outlives the request of its first subscriber, so it runs in an empty context rather than
+                # with the timings and the deadline of that request
+                feed.task = asyncio.create_task(self.poll_forever(feed), context=contextvars.Context())
+
+        subscriber = Subscriber(min_polarity, max_polarity, after_seq, self.buffer_size)
+        feed.subscribers.add(subscriber)
+        try:
+            yield subscriber, feed.watermark
+        finally:
+            feed.subscribers.discard(subscriber)
+            if not feed.subscribers and self.feeds.get(subfeddit_id) is feed:
+                del self.feeds[subfeddit_id]
+                await self.stop_feed(feed)
+
+    async def backlog(
+        self, subfeddit_id: int, subscriber: Subscriber, after_seq: int, until_seq: int
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Reads the comments of a subfeddit a subscriber missed, e.g. while it was reconnecting, page by page as they
+        are consumed: the ones scored after the last comment it has and up to the watermark of the feed it joined.
+
+        Args:
+            subfeddit_id (int): The ID of the subfeddit.
+            subscriber (Subscriber): The subscriber, whose filters are applied.
+            after_seq (int): The change sequence number of the last comment the subscriber has.
+            until_seq (int): The watermark of the feed when it subscribed.
+
+        Yields:
+            List[dict]: The next comments missed, in the order they were scored.
+        """
+        while after_seq < until_seq:
+            rows = await self.db_client.get_live_comments(subfeddit_id, after_seq, self.batch_size)
+            if not rows:
+                return
+
+            after_seq = rows[-1]["change_seq"]
+            comments = [dict(row) for row in rows if row["change_seq"] <= until_seq]
+            comments = [comment for comment in comments if subscriber.matches(comment)]
+            # The feed reads the comments of its re-read window again, and hands over the ones committed late
+            subscriber.sent.update(
+                comment["change_seq"] for comment in comments if comment["change_seq"] > until_seq - self.reread_window
+            )
+            if comments:
+                yield comments
+
+            if len(rows) < self.batch_size:
+                return
+
+    async def stream(
+        self,
+        subfeddit_id: int,
+        min_polarity: float = -1,
+        max_polarity: float = 1,
+        last_event_id: Optional[int] = None,
+        heartbeat_interval: float = LIVE_HEARTBEAT_INTERVAL,
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Streams the comments of a subfeddit as they are scored, starting with the ones missed since `last_event_id`
+        when it is given, until the stream is closed or the subscriber overflows.
+
+        Args:
+            subfeddit_id (int): The ID of the subfeddit.
+            min_polarity (float): The minimum polarity score of the comments. Defaults to -1.
+            max_polarity (float): The maximum polarity score of the comments. Defaults to 1.
+            last_event_id (Optional[int]): The event ID of the last comment received by the client, i.e. its change
+                sequence number, to resume its stream. Defaults to None, for the comments scored from now on only.
+            heartbeat_interval (float): Seconds after which an empty batch is yielded when no comment came, to keep
+                the connection alive. Defaults to LIVE_HEARTBEAT_INTERVAL.
+
+        Yields:
+            List[dict]: The next comments, in the order they were scored, or an empty list after `heartbeat_interval`
+            seconds without any.
+
+        Raises:
+            LiveFeedOverflowError: If the client did not read the comments as fast as they were scored.
+        """
+        after_seq = last_event_id or 0
+        async with self.subscribe(subfeddit_id, min_polarity, max_polarity, after_seq) as (subscriber, watermark):
+            try:
+                if last_event_id is not None:
+                    async for comments in self.backlog(subfeddit_id, subscriber, after_seq, watermark):
+                        self.comments_sent += len(comments)
+                        yield comments
+
+                while True:
+                    comments = await subscriber.next_batch(heartbeat_interval)
+                    self.comments_sent += len(comments)
+                    yield comments
+            except LiveFeedOverflowError:
+                self.overflows += 1
+                raise
+
+    def on_notification(self, conn, pid, channel, payload):
+        """
+        Wakes the feed of the subfeddit whose ID is the payload of a notification up, or all the feeds when the
+        payload is not the ID of a subfeddit with a feed.
+        """
+        try:
+            feeds = [self.feeds[int(payload)]]
+        except (KeyError, ValueError):
+            feeds = list(self.feeds.values())
+
+        for feed in feeds:
+            feed.wakeup.set()
+
+    async def start(self):
+        """
+        Starts listening to the notifications of new scored comments, if a channel is set.
+        """
+        if self.notify_channel and self.listen_conn is None:
+            self.listen_conn = await self.db_client.listen(self.notify_channel, self.on_notification)
+
+    async def stop_feed(self, feed: SubfedditFeed):
+        """
+        Stops the poller of a feed.
+        """
+        if feed.task is not None:
+            task, feed.task = feed.task, None
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def stop(self):
+        """
+        Stops listening to the notifications and stops the pollers of all the feeds.
+        """
+        if self.listen_conn is not None:
+            await self.listen_conn.close()
+            self.listen_conn = None
+
+        feeds, self.feeds = list(self.feeds.values()), {}
+        for feed in feeds:
+            await self.stop_feed(feed)
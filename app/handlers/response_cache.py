@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from app import deadline
+
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 5))
+RESPONSE_CACHE_STALE_TTL = float(os.getenv("RESPONSE_CACHE_STALE_TTL", 30))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1000))
+
+logger = logging.getLogger(__name__)
+
+
+def compute_etag(value: Any) -> str:
+    """
+    Computes the entity tag of a response, as the hash of its JSON serialization.
+
+    Args:
+        value (Any): The JSON serializable content of the response, or its serialization as bytes.
+
+    Returns:
+        str: The quoted, strong entity tag.
+    """
+    if isinstance(value, bytes):
+        payload = value
+    else:
+        payload = json.dumps(value, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+
+    return '"' + hashlib.md5(payload).hexdigest() + '"'
+
+
+class ResponseCache:
+    """
+    Caches the result of identical requests for a short time. Once an entry is older than `ttl`, it is still served for
+    `stale_ttl` more seconds while it is refreshed in the background (stale-while-revalidate). Concurrent misses for the
+    same key share a single computation (single-flight), which each caller waits for until its own deadline, and which is
+    cancelled once all its callers are gone. Errors are never cached.
+    """
+
+    def __init__(
+        self,
+        ttl: float = RESPONSE_CACHE_TTL,
+        stale_ttl: float = RESPONSE_CACHE_STALE_TTL,
+        max_size: int = RESPONSE_CACHE_SIZE,
+    ):
+        """
+        Initializes the ResponseCache instance.
+
+        Args:
+            ttl (float): Number of seconds an entry is fresh, 0 to disable the cache. Defaults to RESPONSE_CACHE_TTL.
+            stale_ttl (float): Number of seconds a stale entry is served while refreshed. Defaults to RESPONSE_CACHE_STALE_TTL.
+            max_size (int): Maximum number of entries. Defaults to RESPONSE_CACHE_SIZE.
+        """
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_size = max_size
+        # key -> (time the entry was stored, value, entity tag)
+        self.entries: "OrderedDict[Hashable, Tuple[float, Any, str]]" = OrderedDict()
+        self.in_flight: Dict[Hashable, asyncio.Task] = {}
+        # key -> number of callers waiting for its computation
+        self.waiting: Dict[Hashable, int] = {}
+
+        # Counters used to size the cache
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_size > 0
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            dict: The number of fresh and stale hits, misses and requests coalesced with a pending one, and the current size.
+        """
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "size": len(self.entries),
+        }
+
+    def clear(self):
+        """
+        Drops all the entries.
+        """
+        self.entries.clear()
+
+    async def close(self):
+        """
+        Cancels the computations in progress, e.g. the background refreshes, and waits for them to stop.
+        """
+        tasks = list(self.in_flight.values())
+        for task in tasks:
+            task.cancel()
+
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def get(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        etag_of: Callable[[Any], str] = compute_etag,
+    ) -> Tuple[Any, str]:
+        """
+        Returns the cached value of a key, computing it on a miss.
+
+        Args:
+            key (Hashable): The normalized request.
+            compute (Callable[[], Awaitable[Any]]): Computes the value of the key.
+            etag_of (Callable[[Any], str]): Computes the entity tag of a value. Defaults to compute_etag, which requires
+                a JSON serializable value.
+
+        Returns:
+            Tuple[Any, str]: The value and its entity tag.
+
+        Raises:
+            Exception: Any exception raised by `compute`, to every caller waiting for it.
+            TimeoutError: If the deadline of the request of the caller passes before the value is computed.
+        """
+        if not self.enabled:
+            value = await compute()
+            return value, etag_of(value)
+
+        entry = self.entries.get(key)
+        if entry is not None:
+            stored_at, value, etag = entry
+            age = time.monotonic() - stored_at
+
+            if age < self.ttl:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return value, etag
+
+            if age < self.ttl + self.stale_ttl:
+                # Serve the stale value right away, and refresh it once in the background
+                self.stale_hits += 1
+                self.entries.move_to_end(key)
+                if key not in self.in_flight:
+                    self._start(key, compute, etag_of, background=True)
+                return value, etag
+
+            del self.entries[key]
+
+        # Each caller waits for the computation until its own deadline
+        timeout = deadline.remaining()
+
+        # Join the computation of the same key already in progress, if any
+        task = self.in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = self._start(key, compute, etag_of)
+
+        # The computation runs in its own task, so that a cancelled caller does not cancel it for the others
+        self.waiting[key] = self.waiting.get(key, 0) + 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        finally:
+            self.waiting[key] -= 1
+            if not self.waiting[key]:
+                del self.waiting[key]
+                # All its callers were cancelled or timed out, e.g. their clients disconnected: stop the computation rather than
+                # let it hold a database connection and the scoring workers
+                if not task.done():
+                    task.cancel()
+
+    def _start(
+        self,
+        key: Hashable,
+        compute: Callable[[], Awaitable[Any]],
+        etag_of: Callable[[Any], str],
+        background: bool = False,
+    ) -> asyncio.Task:
+        # The computation is shared by the callers of the key, so it runs without the deadline of the one starting it
+        task = asyncio.create_task(self._compute(key, compute, etag_of), context=deadline.context_without_deadline())
+        self.in_flight[key] = task
+        task.add_done_callback(
+            self._log_refresh_error if background else self._retrieve_error
+        )
+        return task
+
+    async def _compute(
+        self, key: Hashable, compute: Callable[[], Awaitable[Any]], etag_of: Callable[[Any], str]
+    ) -> Tuple[Any, str]:
+        try:
+            value = await compute()
+        finally:
+            del self.in_flight[key]
+
+        result = value, etag_of(value)
+        self._set(key, *result)
+        return result
+
+    @staticmethod
+    def _retrieve_error(task: asyncio.Task):
+        # The error is raised to the callers, mark it as retrieved in case they were all cancelled
+        if not task.cancelled():
+            task.exception()
+
+    @staticmethod
+    def _log_refresh_error(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Error while refreshing a cached response: %s", task.exception())
+
+    def _set(self, key: Hashable, value: Any, etag: str):
+        self.entries[key] = (time.monotonic(), value, etag)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Tells whether an If-None-Match request header matches the entity tag of the response, using weak comparison.
+
+    Args:
+        if_none_match (Optional[str]): The If-None-Match header of the request.
+        etag (str): The entity tag of the response.
+
+    Returns:
+        bool: True if the client already has the response.
+    """
+    if not if_none_match:
+        return False
+
+    if if_none_match.strip() == "*":
+        return True
+
+    return any(
+        candidate.strip().removeprefix("W/") == etag
+        for candidate in if_none_match.split(",")
+    )
@@ -0,0 +1,116 @@
+from typing import AsyncIterator, List, Optional
+
+from app.database.postgre import PostgreClient
+from app.database.subfeddit_cache import SubfedditCache
+from app.handlers.live_feed import LiveFeeds
+
+
+class SubfedditsHandler:
+    """
+    A class to handle operations related to subfeddits as a whole, such as the distribution of their sentiment over time
+    and the live feed of their comments.
+    """
+
+    def __init__(self, db_client: PostgreClient, subfeddit_cache: SubfedditCache):
+        """
+        Initializes the SubfedditsHandler instance with the database client and subfeddit cache it shares with
+        the CommentsHandler.
+
+        Args:
+            db_client (PostgreClient): The client used to query the database.
+            subfeddit_cache (SubfedditCache): The cache used to resolve subfeddit names.
+        """
+        self.db_client = db_client
+        self.subfeddit_cache = subfeddit_cache
+        self.live_feeds = LiveFeeds(db_client)
+
+    async def get_sentiment(
+        self,
+        subfeddit_name: str,
+        from_date: Optional[str] = None,
+        to_date: Optional[str] = None,
+        bucket: str = "day",
+    ) -> dict:
+        """
+        Fetches the sentiment distribution of the comments of a subfeddit over time, from the precomputed daily rollup,
+        without reading or scoring the comments themselves. Only the comments already scored are counted.
+
+        Args:
+            subfeddit_name (str): The name of the subfeddit.
+            from_date (Optional[str]): First day to include (inclusive), formatted as DD-MM-YYYY. Defaults to None.
+            to_date (Optional[str]): Last day to include (inclusive), formatted as DD-MM-YYYY. Defaults to None.
+            bucket (str): 'day', 'week' or 'month', the size of the time buckets. Defaults to 'day'.
+
+        Returns:
+            dict: The number of positive, neutral and negative comments and their mean polarity, per bucket
+            and over the whole period.
+
+        Raises:
+            SubfedditNotFoundError: If no subfeddit is found with the given name.
+        """
+        subfeddit_id = await self.subfeddit_cache.get_id(subfeddit_name)
+
+        rows = await self.db_client.get_sentiment(
+            subfeddit_id=subfeddit_id, from_date=from_date, to_date=to_date, bucket=bucket
+        )
+
+        # Days whose comments were all unscored again are left with no comment, skip them
+        buckets = [
+            self.distribution(row, start=row["bucket"])
+            for row in rows
+            if row["positive"] + row["neutral"] + row["negative"] > 0
+        ]
+        total = self.distribution(
+            {
+                field: sum(row[field] for row in rows)
+                for field in ("positive", "neutral", "negative", "polarity_sum")
+            }
+        )
+
+        return {"subfeddit_name": subfeddit_name, "bucket": bucket, "total": total, "buckets": buckets}
+
+    async def live_comments(
+        self,
+        subfeddit_name: str,
+        min_polarity: float = -1,
+        max_polarity: float = 1,
+        last_event_id: Optional[int] = None,
+    ) -> AsyncIterator[List[dict]]:
+        """
+        Prepares the live feed of the comments of a subfeddit, sent as they are scored. The subfeddit is resolved
+        right away, so that an unknown subfeddit fails before anything is streamed.
+
+        Args:
+            subfeddit_name (str): The name of the subfeddit.
+            min_polarity (float): Minimum polarity value to filter comments. Defaults to -1 (allow all).
+            max_polarity (float): Maximum polarity value to filter comments. Defaults to 1 (allow all).
+            last_event_id (Optional[int]): The event ID of the last comment received, to first send the ones scored
+                since. Defaults to None.
+
+        Returns:
+            AsyncIterator[List[dict]]: The batches of new comments, empty when none came for a while.
+
+        Raises:
+            SubfedditNotFoundError: If no subfeddit is found with the given name.
+        """
+        subfeddit_id = await self.subfeddit_cache.get_id(subfeddit_name)
+
+        return self.live_feeds.stream(
+            subfeddit_id, min_polarity=min_polarity, max_polarity=max_polarity, last_event_id=last_event_id
+        )
+
+    @staticmethod
+    def distribution(counts: dict, **extra) -> dict:
+        """
+        Turns the counts of a rollup row into a sentiment distribution, with the number of comments and their mean polarity.
+        """
+        count = counts["positive"] + counts["neutral"] + counts["negative"]
+
+        return {
+            **extra,
+            "positive": counts["positive"],
+            "neutral": counts["neutral"],
+            "negative": counts["negative"],
+            "count": count,
+            "mean_polarity": counts["polarity_sum"] / count if count else None,
+        }
@@ -0,0 +1,199 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+from typing import List, Optional
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_FILE_MAX_BYTES = int(os.getenv("LOG_FILE_MAX_BYTES", 10 * 1024 * 1024))
+LOG_FILE_BACKUP_COUNT = int(os.getenv("LOG_FILE_BACKUP_COUNT", 5))
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", 10000))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", 1))
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+
+# Attributes every LogRecord has, and the ANSI colored copy of the message uvicorn attaches to its records; the others
+# were passed with `extra` and are added to the JSON records
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName", "color_message"}
+
+# The listener writing the records of the queue, once the logging is set up
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats the records as one JSON object per line, with the fields passed in `extra` next to the message.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(
+            (key, value)
+            for key, value in vars(record).items()
+            if key not in RECORD_ATTRIBUTES
+        )
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps only a fraction of the high-volume records, i.e. the ones logged with `extra={"sampled": True}` such as the
+    success of each request. The other records, and all warnings and errors, are always kept.
+    """
+
+    def __init__(self, rate: float = LOG_SAMPLE_RATE):
+        """
+        Initializes the SamplingFilter instance.
+
+        Args:
+            rate (float): The fraction of the sampled records kept, from 0 to 1. Defaults to LOG_SAMPLE_RATE.
+        """
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not getattr(record, "sampled", False):
+            return True
+
+        return self.rate >= 1 or random.random() < self.rate
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands the records over to the listener thread without formatting them, so that logging from the event loop only
+    costs a queue insertion. When the queue is full, the records are dropped rather than blocking the caller.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The message is formatted by the listener thread, the arguments of the records must not be mutated afterwards
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def build_handlers(
+    log_format: str = LOG_FORMAT,
+    log_file: str = LOG_FILE,
+    max_bytes: int = LOG_FILE_MAX_BYTES,
+    backup_count: int = LOG_FILE_BACKUP_COUNT,
+    console: bool = True,
+) -> List[logging.Handler]:
+    """
+    Builds the handlers writing the records, run by the listener thread.
+
+    Args:
+        log_format (str): 'json' for one JSON object per line, or 'text'. Defaults to LOG_FORMAT.
+        log_file (str): The file the records are written to, '' to disable it. Defaults to LOG_FILE.
+        max_bytes (int): The size at which the file is rotated. Defaults to LOG_FILE_MAX_BYTES.
+        backup_count (int): The number of rotated files kept. Defaults to LOG_FILE_BACKUP_COUNT.
+        console (bool): Whether the records are also written to stderr. Defaults to True.
+
+    Returns:
+        List[logging.Handler]: The handlers.
+    """
+    formatter = JsonFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT)
+
+    handlers = []
+    if console:
+        handlers.append(logging.StreamHandler(sys.stderr))
+    if log_file:
+        handlers.append(
+            logging.handlers.RotatingFileHandler(
+                log_file, mode="a", maxBytes=max_bytes, backupCount=backup_count
+            )
+        )
+
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    return handlers
+
+
+def setup_logging(
+    level: str = LOG_LEVEL,
+    sample_rate: float = LOG_SAMPLE_RATE,
+    queue_size: int = LOG_QUEUE_SIZE,
+    **handler_options,
+) -> logging.handlers.QueueListener:
+    """
+    Routes the records of the root logger through a queue to a listener thread, which formats and writes them, so that
+    no disk write happens on the event loop. Calling it again replaces the previous setup.
+
+    Args:
+        level (str): The minimum level of the records. Defaults to LOG_LEVEL.
+        sample_rate (float): The fraction of the high-volume records kept. Defaults to LOG_SAMPLE_RATE.
+        queue_size (int): The number of records buffered before new ones are dropped. Defaults to LOG_QUEUE_SIZE.
+        **handler_options: The options of `build_handlers`.
+
+    Returns:
+        logging.handlers.QueueListener: The started listener.
+    """
+    global _listener
+
+    shutdown_logging()
+
+    log_queue = queue.Queue(queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    # Drop the sampled out records before they are queued
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *build_handlers(**handler_options))
+    _listener.start()
+
+    return _listener
+
+
+def logging_is_set_up() -> bool:
+    """
+    Tells whether `setup_logging` was called, and the logging was not shut down since.
+    """
+    return _listener is not None
+
+
+def shutdown_logging():
+    """
+    Writes the records still queued and stops the listener thread, if any.
+    """
+    global _listener
+
+    if _listener is None:
+        return
+
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = None
+
+
+# Flush the queued records when the process exits
+atexit.register(shutdown_logging)
@@ -0,0 +1,472 @@
+import functools
+import math
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+# Upper bounds of the per comment scoring time buckets, in seconds
+SCORING_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_labels(labels: Dict[str, str]) -> str:
+    """
+    Formats labels the way the Prometheus text format expects them, e.g. `{endpoint="/comments"}`.
+    """
+    if not labels:
+        return ""
+
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in labels.items()
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_metric(
+    name: str, kind: str, documentation: str, samples: Iterable[Tuple[str, Dict[str, str], float]]
+) -> List[str]:
+    """
+    Renders one metric in the Prometheus text format.
+
+    Args:
+        name (str): The name of the metric.
+        kind (str): Its type: 'counter', 'gauge' or 'histogram'.
+        documentation (str): Its description.
+        samples (Iterable[Tuple[str, Dict[str, str], float]]): The name suffix, labels and value of each sample.
+
+    Returns:
+        List[str]: The lines of the metric.
+    """
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+    lines.extend(
+        f"{name}{suffix}{format_labels(labels)} {format_value(value)}"
+        for suffix, labels, value in samples
+    )
+    return lines
+
+
+class Histogram:
+    """
+    Counts observations into cumulative buckets, per combination of label values. Observations are only made from
+    the event loop, so no lock is needed.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS,
+    ):
+        """
+        Initializes the Histogram instance.
+
+        Args:
+            name (str): The name of the metric.
+            documentation (str): Its description.
+            label_names (Sequence[str]): The names of its labels. Defaults to none.
+            buckets (Sequence[float]): The upper bounds of the buckets, in increasing order. Defaults to LATENCY_BUCKETS.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # label values -> [count per bucket, sum of the observations]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str, count: int = 1):
+        """
+        Records an observation.
+
+        Args:
+            value (float): The observed value.
+            *label_values (str): The value of each label, in order.
+            count (int): The number of identical observations recorded at once. Defaults to 1.
+        """
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * len(self.buckets), 0.0]
+
+        bucket_counts = series[0]
+        for i, upper_bound in enumerate(self.buckets):
+            if value <= upper_bound:
+                bucket_counts[i] += count
+                break
+
+        series[1] += value * count
+
+    def clear(self):
+        self.series.clear()
+
+    def render(self) -> List[str]:
+        """
+        Renders the histogram in the Prometheus text format.
+
+        Returns:
+            List[str]: The lines of the metric.
+        """
+        samples = []
+        for label_values, (bucket_counts, total) in sorted(self.series.items()):
+            labels = dict(zip(self.label_names, label_values))
+
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets, bucket_counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", {**labels, "le": format_value(float(upper_bound))}, cumulative))
+
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, cumulative))
+
+        return render_metric(self.name, "histogram", self.documentation, samples)
+
+
+REQUEST_SECONDS = Histogram(
+    "feddit_request_duration_seconds",
+    "Time to serve a request, by endpoint and outcome.",
+    ("endpoint", "outcome"),
+)
+STAGE_SECONDS = Histogram(
+    "feddit_stage_duration_seconds",
+    "Time spent in each stage of a request, by endpoint and outcome of the request.",
+    ("endpoint", "stage", "outcome"),
+)
+SCORING_SECONDS_PER_COMMENT = Histogram(
+    "feddit_scoring_duration_seconds_per_comment",
+    "Time to score the sentiment of one comment, averaged over its batch.",
+    buckets=SCORING_BUCKETS,
+)
+HISTOGRAMS = [REQUEST_SECONDS, STAGE_SECONDS, SCORING_SECONDS_PER_COMMENT]
+
+
+class RequestTimings:
+    """
+    Collects the time spent in each stage of a request, until its endpoint and outcome are known.
+    """
+
+    __slots__ = ("stages", "handler_end", "endpoint", "done", "disconnected")
+
+    def __init__(self):
+        self.stages: List[Tuple[str, float]] = []
+        self.handler_end: Optional[float] = None
+        self.endpoint: Optional[str] = None
+        self.done = False
+        self.disconnected = False
+
+
+# The timings of the request being served, if any
+_request_timings: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def record_stage(stage_name: str, elapsed: float, outcome: str = "success"):
+    """
+    Records the time spent in a stage. Within a request, the stage is recorded with the endpoint and outcome of the
+    request once it ends; outside of requests, e.g. in the polarity backfill, it is recorded right away.
+
+    Args:
+        stage_name (str): The name of the stage.
+        elapsed (float): The time spent, in seconds.
+        outcome (str): The outcome of the stage, used outside of requests. Defaults to 'success'.
+    """
+    timings = _request_timings.get()
+    if timings is None:
+        STAGE_SECONDS.observe(elapsed, "background", stage_name, outcome)
+    elif timings.done:
+        # Work started by the request and ending after it, e.g. a background refresh of the response cache
+        STAGE_SECONDS.observe(elapsed, timings.endpoint, stage_name, "background")
+    else:
+        timings.stages.append((stage_name, elapsed))
+
+
+def record_disconnect():
+    """
+    Records that the client of the current request disconnected before its response was sent, so that the request
+    is recorded with the 'disconnected' outcome.
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.disconnected = True
+
+
+@contextmanager
+def stage(stage_name: str):
+    """
+    Times the enclosed block as a stage of the current request.
+
+    Args:
+        stage_name (str): The name of the stage.
+    """
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "success"
+    finally:
+        record_stage(stage_name, time.perf_counter() - start, outcome)
+
+
+def record_scoring(elapsed: float, n_comments: int):
+    """
+    Records the time spent scoring a batch of comments, in total and per comment.
+
+    Args:
+        elapsed (float): The time spent scoring the batch, in seconds.
+        n_comments (int): The number of comments of the batch.
+    """
+    record_stage("scoring", elapsed)
+    if n_comments:
+        SCORING_SECONDS_PER_COMMENT.observe(elapsed / n_comments, count=n_comments)
+
+
+def timed_handler(endpoint):
+    """
+    Decorates an endpoint so that its own time is recorded as the 'handler' stage, and the time FastAPI then takes to
+    validate and serialize its return value as the 'serialization' stage.
+    """
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        with stage("handler"):
+            result = await endpoint(*args, **kwargs)
+
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.handler_end = time.perf_counter()
+
+        return result
+
+    return wrapper
+
+
+def outcome_of(status_code: int) -> str:
+    if status_code >= 500:
+        return "server_error"
+    if status_code >= 400:
+        return "client_error"
+    return "success"
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing each HTTP request, and recording the stages timed while serving it with its endpoint, i.e.
+    the path template of its route, and its outcome.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _request_timings.set(timings)
+        start = time.perf_counter()
+        status_code = 500
+        response_start = None
+
+        async def send_with_status(message):
+            nonlocal status_code, response_start
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                response_start = time.perf_counter()
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            _request_timings.reset(token)
+            elapsed = time.perf_counter() - start
+
+            # Only matched routes are labeled by path, so that unknown paths do not create new series
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            outcome = "disconnected" if timings.disconnected else outcome_of(status_code)
+
+            if timings.handler_end is not None and response_start is not None:
+                timings.stages.append(("serialization", response_start - timings.handler_end))
+
+            for stage_name, stage_elapsed in timings.stages:
+                STAGE_SECONDS.observe(stage_elapsed, endpoint, stage_name, outcome)
+            REQUEST_SECONDS.observe(elapsed, endpoint, outcome)
+
+            timings.endpoint = endpoint
+            timings.done = True
+
+
+def render_stats(prefix: str, documentation: str, stats: dict, counters: Sequence[str] = ()) -> List[str]:
+    """
+    Renders the counters of a component, e.g. the pool or a cache, as one metric per counter.
+
+    Args:
+        prefix (str): The prefix of the names of the metrics.
+        documentation (str): The description of the component.
+        stats (dict): The values, by name.
+        counters (Sequence[str]): The names of the values that only increase, the others are gauges. Defaults to none.
+
+    Returns:
+        List[str]: The lines of the metrics.
+    """
+    lines = []
+    for key, value in stats.items():
+        if value is None:
+            continue
+
+        if key in counters:
+            name = f"{prefix}_{key}" if key.endswith("_total") else f"{prefix}_{key}_total"
+            lines.extend(render_metric(name, "counter", f"{documentation}: {key}.", [("", {}, value)]))
+        else:
+            lines.extend(render_metric(f"{prefix}_{key}", "gauge", f"{documentation}: {key}.", [("", {}, value)]))
+
+    return lines
+
+
+def render_replicas(replicas: List[dict]) -> List[str]:
+    """
+    Renders the state of the read replicas, as one metric per value labelled with the replica.
+
+    Args:
+        replicas (List[dict]): The stats of each replica, from `ReplicaSet.stats`.
+
+    Returns:
+        List[str]: The lines of the metrics.
+    """
+    lines = render_metric(
+        "feddit_db_replica_healthy",
+        "gauge",
+        "Database read replica: 1 if it serves reads, 0 otherwise.",
+        [("", {"replica": replica["name"]}, int(replica["healthy"])) for replica in replicas],
+    )
+    lines.extend(
+        render_metric(
+            "feddit_db_replica_lag_seconds",
+            "gauge",
+            "Database read replica: replication lag at the last health check.",
+            [
+                ("", {"replica": replica["name"]}, replica["lag_seconds"])
+                for replica in replicas
+                if replica["lag_seconds"] is not None
+            ],
+        )
+    )
+    for key in ("acquire_count", "failures"):
+        lines.extend(
+            render_metric(
+                f"feddit_db_replica_{key}_total",
+                "counter",
+                f"Database read replica: {key}.",
+                [("", {"replica": replica["name"]}, replica[key]) for replica in replicas],
+            )
+        )
+
+    return lines
+
+
+def hit_ratio(hits: int, total: int) -> float:
+    return hits / total if total else 0.0
+
+
+def render_metrics(
+    pool_stats: dict,
+    polarity_cache_stats: dict,
+    response_cache_stats: dict,
+    admission_stats: dict,
+    live_stats: dict,
+) -> str:
+    """
+    Renders all the metrics in the Prometheus text format: the latency histograms, the connection pool saturation,
+    the counters and hit ratios of the caches, the state of the admission control and of the live feeds.
+
+    Args:
+        pool_stats (dict): The stats of `PostgreClient.pool_stats`.
+        polarity_cache_stats (dict): The stats of `PolarityCache.stats`.
+        response_cache_stats (dict): The stats of `ResponseCache.stats`.
+        admission_stats (dict): The stats of `AdmissionController.stats`.
+        live_stats (dict): The stats of `LiveFeeds.stats`.
+
+    Returns:
+        str: The metrics.
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+
+    pool_stats = dict(pool_stats)
+    replicas = pool_stats.pop("replicas", [])
+    lines.extend(
+        render_stats(
+            "feddit_db_pool",
+            "Database connection pool",
+            pool_stats,
+            counters=("acquire_count", "acquire_seconds_total"),
+        )
+    )
+    if replicas:
+        lines.extend(render_replicas(replicas))
+
+    polarity_cache_hits = polarity_cache_stats["hits"] + polarity_cache_stats["backend_hits"]
+    lines.extend(
+        render_stats(
+            "feddit_polarity_cache",
+            "Polarity cache",
+            {
+                **polarity_cache_stats,
+                "hit_ratio": hit_ratio(
+                    polarity_cache_hits, polarity_cache_hits + polarity_cache_stats["misses"]
+                ),
+            },
+            counters=("hits", "backend_hits", "misses", "evictions"),
+        )
+    )
+
+    response_cache_hits = response_cache_stats["hits"] + response_cache_stats["stale_hits"]
+    lines.extend(
+        render_stats(
+            "feddit_response_cache",
+            "Response cache",
+            {
+                **response_cache_stats,
+                "hit_ratio": hit_ratio(
+                    response_cache_hits,
+                    response_cache_hits + response_cache_stats["misses"] + response_cache_stats["coalesced"],
+                ),
+            },
+            counters=("hits", "stale_hits", "misses", "coalesced"),
+        )
+    )
+
+    lines.extend(
+        render_stats(
+            "feddit_admission",
+            "Admission control",
+            admission_stats,
+            counters=("admitted", "waited", "wait_seconds_total", "rejected_overloaded", "rejected_client"),
+        )
+    )
+
+    lines.extend(
+        render_stats(
+            "feddit_live",
+            "Live feeds",
+            live_stats,
+            counters=("polls", "comments_read", "comments_sent", "comments_late", "overflows"),
+        )
+    )
+
+    return "\n".join(lines) + "\n"
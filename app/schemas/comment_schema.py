@@ -1,4 +1,11 @@
-from pydantic import BaseModel
+import os
+from datetime import date
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, Field
+
+COMMENTS_BATCH_MAX_QUERIES = int(os.getenv("COMMENTS_BATCH_MAX_QUERIES", 100))
+COMMENTS_MAX_PAGE_SIZE = int(os.getenv("COMMENTS_MAX_PAGE_SIZE", 1000))
 
 
 class Comment(BaseModel):
@@ -12,9 +19,126 @@ class ErrorResponse(BaseModel):
     detail: str
 
 
+class SentimentDistribution(BaseModel):
+    positive: int
+    neutral: int
+    negative: int
+    count: int
+    mean_polarity: Optional[float] = None
+
+
+class SentimentBucket(SentimentDistribution):
+    start: date
+
+
+class SubfedditSentiment(BaseModel):
+    subfeddit_name: str
+    bucket: str
+    total: SentimentDistribution
+    buckets: List[SentimentBucket]
+
+
+class CommentsQuery(BaseModel):
+    subfeddit_name: str
+    n_comments: int = Field(default=25, ge=1, le=COMMENTS_MAX_PAGE_SIZE)
+    from_date: Optional[str] = None
+    to_date: Optional[str] = None
+    polarity_sorting: Optional[Literal["asc", "desc"]] = None
+    min_polarity: float = Field(default=-1, ge=-1, le=1)
+    max_polarity: float = Field(default=1, ge=-1, le=1)
+    cursor: Optional[str] = None
+
+
+class CommentsBatchRequest(BaseModel):
+    queries: List[CommentsQuery] = Field(
+        min_length=1, max_length=COMMENTS_BATCH_MAX_QUERIES
+    )
+
+
+class CommentsBatchResult(BaseModel):
+    subfeddit_name: str
+    status_code: int
+    comments: Optional[List[Comment]] = None
+    next_cursor: Optional[str] = None
+    detail: Optional[str] = None
+
+
+class CommentsBatchResponse(BaseModel):
+    results: List[CommentsBatchResult]
+
+
 class HealthCheckResponse(BaseModel):
     status: str
 
 
 class WelcomeMessage(BaseModel):
     message: str
+
+
+class ReplicaStats(BaseModel):
+    name: str
+    healthy: bool
+    lag_seconds: Optional[float] = None
+    acquire_count: int
+    failures: int
+
+
+class PoolStats(BaseModel):
+    waiting: int
+    acquire_count: int
+    acquire_seconds_total: float
+    acquire_seconds_max: float
+    min_size: Optional[int] = None
+    max_size: Optional[int] = None
+    size: Optional[int] = None
+    idle: Optional[int] = None
+    in_use: Optional[int] = None
+    replicas: List[ReplicaStats] = []
+
+
+class PolarityCacheStats(BaseModel):
+    hits: int
+    backend_hits: int
+    misses: int
+    evictions: int
+    size: int
+
+
+class ResponseCacheStats(BaseModel):
+    hits: int
+    stale_hits: int
+    misses: int
+    coalesced: int
+    size: int
+
+
+class AdmissionStats(BaseModel):
+    capacity: int
+    in_use: int
+    in_flight: int
+    queued: int
+    queued_clients: int
+    admitted: int
+    waited: int
+    wait_seconds_total: float
+    wait_seconds_max: float
+    rejected_overloaded: int
+    rejected_client: int
+
+
+class LiveFeedStats(BaseModel):
+    feeds: int
+    subscribers: int
+    polls: int
+    comments_read: int
+    comments_sent: int
+    comments_late: int
+    overflows: int
+
+
+class StatsResponse(BaseModel):
+    pool: PoolStats
+    polarity_cache: PolarityCacheStats
+    response_cache: ResponseCacheStats
+    admission: AdmissionStats
+    live: LiveFeedStats
@@ -0,0 +1,136 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+
+from app.scoring.polarity import SCORER_VERSION, text_hash
+
+POLARITY_BACKFILL_ENABLED = os.getenv("POLARITY_BACKFILL_ENABLED", "false").lower() == "true"
+POLARITY_BACKFILL_BATCH_SIZE = int(os.getenv("POLARITY_BACKFILL_BATCH_SIZE", 500))
+POLARITY_BACKFILL_INTERVAL = float(os.getenv("POLARITY_BACKFILL_INTERVAL", 30))
+
+# Key of the advisory lock held by the process running a backfill pass
+POLARITY_BACKFILL_LOCK_KEY = 7_340_114
+
+logger = logging.getLogger(__name__)
+
+
+class PolarityBackfill:
+    """
+    Precomputes the polarity scores of the comments into the `comment_polarity` table, so that comments can be
+    filtered and sorted by polarity in the database. Each pass walks the comments in ID order and scores the ones
+    that are new, or whose text or scorer version changed since they were scored.
+
+    When several processes run the backfill in the background, e.g. the workers of uvicorn, a single one runs each pass.
+    """
+
+    def __init__(
+        self,
+        db_client,
+        scoring_engine,
+        batch_size: int = POLARITY_BACKFILL_BATCH_SIZE,
+        interval: float = POLARITY_BACKFILL_INTERVAL,
+        shard_count: int = 1,
+        shard_index: int = 0,
+    ):
+        """
+        Initializes the PolarityBackfill instance.
+
+        Args:
+            db_client (PostgreClient): The client used to read the comments and store their scores.
+            scoring_engine (ScoringEngine): The engine used to score the comments.
+            batch_size (int): The number of comments scored at once. Defaults to POLARITY_BACKFILL_BATCH_SIZE.
+            interval (float): The number of seconds between two passes. Defaults to POLARITY_BACKFILL_INTERVAL.
+            shard_count (int): The number of shards the comments are split into by ID. Defaults to 1.
+            shard_index (int): The shard of the comments to score. Defaults to 0.
+        """
+        self.db_client = db_client
+        self.scoring_engine = scoring_engine
+        self.batch_size = batch_size
+        self.interval = interval
+        self.shard_count = shard_count
+        self.shard_index = shard_index
+        self.task: Optional[asyncio.Task] = None
+
+    async def run_once(
+        self,
+        after_id: int = 0,
+        on_progress: Optional[Callable[[int], Awaitable[None]]] = None,
+    ) -> int:
+        """
+        Runs one pass over the comments, scoring the ones without an up-to-date precomputed score.
+
+        Args:
+            after_id (int): Only the comments with an ID greater than this one are scored. Defaults to 0.
+            on_progress (Optional[Callable[[int], Awaitable[None]]]): Called with the ID of the last comment of
+                each batch, once its scores are stored. Defaults to None.
+
+        Returns:
+            int: The number of comments scored.
+        """
+        scored = 0
+
+        while True:
+            comments = await self.db_client.get_unscored_comments(
+                after_id=after_id,
+                limit=self.batch_size,
+                shard_count=self.shard_count,
+                shard_index=self.shard_index,
+            )
+            if not comments:
+                return scored
+
+            scores = await self.scoring_engine.score_batch(
+                [comment["text"] for comment in comments]
+            )
+            await self.db_client.store_polarities(
+                [
+                    (comment["id"], text_hash(comment["text"]), SCORER_VERSION, *score)
+                    for comment, score in zip(comments, scores)
+                ]
+            )
+
+            scored += len(comments)
+            after_id = comments[-1]["id"]
+            if on_progress is not None:
+                await on_progress(after_id)
+
+    async def run_forever(self):
+        """
+        Runs a pass every `interval` seconds, until cancelled. Failed passes are logged and retried at the next one,
+        and the pass is skipped while another process runs one.
+        """
+        while True:
+            try:
+                async with self.db_client.try_advisory_lock(POLARITY_BACKFILL_LOCK_KEY) as locked:
+                    if locked:
+                        scored = await self.run_once()
+                        if scored:
+                            logger.info("Polarity backfill scored %d comments", scored)
+                    else:
+                        logger.debug("Another process is running the polarity backfill, skipping this pass")
+            except Exception as e:
+                logger.error("Error while backfilling polarity scores: %s", e)
+
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """
+        Starts running the passes in the background.
+        """
+        if self.task is None:
+            self.task = asyncio.create_task(self.run_forever())
+
+    async def stop(self):
+        """
+        Stops the background passes, interrupting the current one.
+        """
+        if self.task is None:
+            return
+
+        task, self.task = self.task, None
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
@@ -0,0 +1,327 @@
+import asyncio
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from app.scoring.polarity import SCORER_VERSION, text_hash
+
+POLARITY_CACHE_SIZE = int(os.getenv("POLARITY_CACHE_SIZE", 100_000))
+POLARITY_CACHE_TTL = float(os.getenv("POLARITY_CACHE_TTL", 3600))
+POLARITY_CACHE_BACKEND = os.getenv("POLARITY_CACHE_BACKEND", "")
+POLARITY_CACHE_SQLITE_PATH = os.getenv(
+    "POLARITY_CACHE_SQLITE_PATH", "polarity_cache.sqlite3"
+)
+
+# (comment id, hash of the comment text, scorer version)
+CacheKey = Tuple[int, str, str]
+Score = Tuple[float, str]
+
+
+class SQLitePolarityBackend:
+    """
+    Durable polarity cache backend storing the scores in a local SQLite file.
+    """
+
+    def __init__(self, path: str = POLARITY_CACHE_SQLITE_PATH):
+        """
+        Initializes the SQLitePolarityBackend instance. The file is only opened by `open`.
+
+        Args:
+            path (str): The path of the SQLite file. Defaults to POLARITY_CACHE_SQLITE_PATH.
+        """
+        self.path = path
+        self.conn = None
+
+    def _open(self):
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS comment_polarity ("
+            "comment_id INTEGER PRIMARY KEY, text_hash TEXT NOT NULL, scorer_version TEXT NOT NULL, "
+            "polarity_score REAL NOT NULL, polarity_classification TEXT NOT NULL)"
+        )
+        self.conn.commit()
+
+    def _get(self, comment_ids: List[int]) -> List[dict]:
+        placeholders = ", ".join("?" * len(comment_ids))
+        rows = self.conn.execute(
+            "SELECT comment_id, text_hash, scorer_version, polarity_score, polarity_classification "
+            f"FROM comment_polarity WHERE comment_id IN ({placeholders})",
+            comment_ids,
+        ).fetchall()
+        columns = ("comment_id", "text_hash", "scorer_version", "polarity_score", "polarity_classification")
+        return [dict(zip(columns, row)) for row in rows]
+
+    def _store(self, polarities: List[tuple]):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO comment_polarity "
+            "(comment_id, text_hash, scorer_version, polarity_score, polarity_classification) "
+            "VALUES (?, ?, ?, ?, ?)",
+            polarities,
+        )
+        self.conn.commit()
+
+    async def open(self):
+        """
+        Opens the SQLite file and creates the `comment_polarity` table if needed.
+        """
+        await asyncio.to_thread(self._open)
+
+    async def close(self):
+        """
+        Closes the SQLite file.
+        """
+        if self.conn is not None:
+            await asyncio.to_thread(self.conn.close)
+            self.conn = None
+
+    async def get_polarities(self, comment_ids: List[int]) -> List[dict]:
+        """
+        Retrieves the stored scores of the given comments.
+
+        Args:
+            comment_ids (List[int]): The IDs of the comments.
+
+        Returns:
+            List[dict]: The stored scores, with the text hash and scorer version they were computed with.
+        """
+        return await asyncio.to_thread(self._get, comment_ids)
+
+    async def store_polarities(self, polarities: List[tuple]):
+        """
+        Stores the given scores.
+
+        Args:
+            polarities (List[tuple]): Tuples of (comment_id, text_hash, scorer_version, polarity_score,
+                polarity_classification).
+        """
+        await asyncio.to_thread(self._store, polarities)
+
+
+class PostgresPolarityBackend:
+    """
+    Durable polarity cache backend storing the scores in the `comment_polarity` Postgres side table.
+    """
+
+    def __init__(self, db_client):
+        """
+        Initializes the PostgresPolarityBackend instance.
+
+        Args:
+            db_client (PostgreClient): The client whose pool is used to read and write the scores.
+        """
+        self.db_client = db_client
+
+    async def open(self):
+        """
+        Creates the `comment_polarity` table if needed.
+        """
+        await self.db_client.create_polarity_table()
+
+    async def close(self):
+        """
+        Nothing to release, the pool is owned by the database client.
+        """
+
+    async def get_polarities(self, comment_ids: List[int]) -> List[dict]:
+        """
+        Retrieves the stored scores of the given comments.
+
+        Args:
+            comment_ids (List[int]): The IDs of the comments.
+
+        Returns:
+            List[dict]: The stored scores, with the text hash and scorer version they were computed with.
+        """
+        return await self.db_client.get_polarities(comment_ids)
+
+    async def store_polarities(self, polarities: List[tuple]):
+        """
+        Stores the given scores.
+
+        Args:
+            polarities (List[tuple]): Tuples of (comment_id, text_hash, scorer_version, polarity_score,
+                polarity_classification).
+        """
+        await self.db_client.store_polarities(polarities)
+
+
+def build_backend(kind: str, db_client=None):
+    """
+    Builds the durable backend of the polarity cache.
+
+    Args:
+        kind (str): '' for no durable backend, 'sqlite' or 'postgres'.
+        db_client (PostgreClient, optional): The database client used by the 'postgres' backend.
+
+    Returns:
+        The backend instance, or None when no durable backend is configured.
+
+    Raises:
+        ValueError: If the backend kind is not supported.
+    """
+    if not kind:
+        return None
+    elif kind == "sqlite":
+        return SQLitePolarityBackend()
+    elif kind == "postgres":
+        return PostgresPolarityBackend(db_client)
+    else:
+        raise ValueError(f"Unsupported polarity cache backend '{kind}'.")
+
+
+class PolarityCache:
+    """
+    Caches the polarity scores of comments, so that comments whose text did not change are not scored again.
+    Scores are kept in an in-process LRU with size and TTL limits, backed by an optional durable backend.
+    Entries are keyed by (comment id, hash of the text, scorer version).
+    """
+
+    def __init__(
+        self,
+        max_size: int = POLARITY_CACHE_SIZE,
+        ttl: float = POLARITY_CACHE_TTL,
+        backend=None,
+    ):
+        """
+        Initializes the PolarityCache instance.
+
+        Args:
+            max_size (int): Maximum number of entries kept in memory. Defaults to POLARITY_CACHE_SIZE.
+            ttl (float): Number of seconds an entry is kept in memory. Defaults to POLARITY_CACHE_TTL.
+            backend (optional): Durable backend queried on memory misses. Defaults to None.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.backend = backend
+        self.entries: "OrderedDict[CacheKey, Tuple[float, Score]]" = OrderedDict()
+
+        # Counters used to size the cache
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(comment: dict) -> CacheKey:
+        """
+        Builds the cache key of a comment.
+
+        Args:
+            comment (dict): The comment, with its 'id' and 'text'.
+
+        Returns:
+            CacheKey: The (comment id, text hash, scorer version) key.
+        """
+        return comment["id"], text_hash(comment["text"]), SCORER_VERSION
+
+    def stats(self) -> dict:
+        """
+        Returns the counters of the cache.
+
+        Returns:
+            dict: The number of hits (in memory and in the backend), misses and evictions, and the current size.
+        """
+        return {
+            "hits": self.hits,
+            "backend_hits": self.backend_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.entries),
+        }
+
+    async def open(self):
+        """
+        Opens the durable backend, if any.
+        """
+        if self.backend is not None:
+            await self.backend.open()
+
+    async def close(self):
+        """
+        Closes the durable backend, if any.
+        """
+        if self.backend is not None:
+            await self.backend.close()
+
+    def _get_memory(self, key: CacheKey) -> Optional[Score]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+
+        expires_at, score = entry
+        if expires_at < time.monotonic():
+            del self.entries[key]
+            return None
+
+        self.entries.move_to_end(key)
+        return score
+
+    def _set_memory(self, key: CacheKey, score: Score):
+        if self.max_size <= 0:
+            return
+
+        self.entries[key] = (time.monotonic() + self.ttl, score)
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_many(self, comments: List[dict]) -> Dict[int, Score]:
+        """
+        Looks up the scores of the given comments, first in memory and then in the durable backend.
+
+        Args:
+            comments (List[dict]): The comments, with their 'id' and 'text'.
+
+        Returns:
+            Dict[int, Score]: The (polarity score, classification) of the comments found, by comment ID.
+        """
+        found = {}
+        missing = {}
+
+        for comment in comments:
+            key = self.key(comment)
+            score = self._get_memory(key)
+            if score is not None:
+                found[comment["id"]] = score
+                self.hits += 1
+            else:
+                missing[comment["id"]] = key
+
+        if missing and self.backend is not None:
+            rows = await self.backend.get_polarities(list(missing))
+            for row in rows:
+                key = missing.get(row["comment_id"])
+
+                # Scores stored for a different text or scorer version are stale
+                if key is None or key != (row["comment_id"], row["text_hash"], row["scorer_version"]):
+                    continue
+
+                score = (row["polarity_score"], row["polarity_classification"])
+                self._set_memory(key, score)
+                found[row["comment_id"]] = score
+                del missing[row["comment_id"]]
+                self.backend_hits += 1
+
+        self.misses += len(missing)
+        return found
+
+    async def set_many(self, scored_comments: Iterable[Tuple[dict, Score]]):
+        """
+        Stores the scores of the given comments in memory and in the durable backend.
+
+        Args:
+            scored_comments (Iterable[Tuple[dict, Score]]): Pairs of comment and (polarity score, classification).
+        """
+        polarities = []
+
+        for comment, score in scored_comments:
+            key = self.key(comment)
+            self._set_memory(key, score)
+            polarities.append((*key, *score))
+
+        if polarities and self.backend is not None:
+            await self.backend.store_polarities(polarities)
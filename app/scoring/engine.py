@@ -0,0 +1,135 @@
+import asyncio
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from app.scoring.polarity import classify_polarity, get_lexicon, score_batch
+
+SCORING_EXECUTOR = os.getenv("SCORING_EXECUTOR", "thread")
+SCORING_WORKERS = int(os.getenv("SCORING_WORKERS", os.cpu_count() or 1))
+SCORING_BATCH_SIZE = int(os.getenv("SCORING_BATCH_SIZE", 64))
+
+# Text scored by each worker of the pool when the engine is warmed up
+WARM_UP_TEXT = "This is a good warm-up :)"
+
+
+def score_texts(texts: Sequence[str]) -> List[Tuple[float, str]]:
+    """
+    Scores a chunk of texts. Runs inside the executor, so it has to stay a module level function
+    to be picklable by a process pool.
+
+    Args:
+        texts (Sequence[str]): The texts to be scored.
+
+    Returns:
+        List[Tuple[float, str]]: The polarity score and classification of each text, in order.
+    """
+    return [(polarity, classify_polarity(polarity)) for polarity in score_batch(texts)]
+
+
+class ScoringEngine:
+    """
+    Runs CPU-bound sentiment scoring on a thread or process pool, so that scoring large batches of
+    comments does not block the event loop serving the API.
+    """
+
+    def __init__(
+        self,
+        executor: str = SCORING_EXECUTOR,
+        workers: int = SCORING_WORKERS,
+        batch_size: int = SCORING_BATCH_SIZE,
+    ):
+        """
+        Initializes the ScoringEngine instance. The pool itself is only created by `start`.
+
+        Args:
+            executor (str): The kind of pool to use, either 'thread' or 'process'. Defaults to SCORING_EXECUTOR.
+            workers (int): The number of workers of the pool. Defaults to SCORING_WORKERS.
+            batch_size (int): The number of texts sent to a worker at once. Defaults to SCORING_BATCH_SIZE.
+
+        Raises:
+            ValueError: If the executor kind is not supported.
+        """
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unsupported scoring executor '{executor}'.")
+
+        self.executor_kind = executor
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.executor: Optional[Executor] = None
+
+    def start(self):
+        """
+        Creates the worker pool. Calling it on an already started engine has no effect.
+        """
+        if self.executor is not None:
+            return
+
+        if self.executor_kind == "process":
+            # Each process loads the lexicon as it starts, rather than on the first texts it scores
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=get_lexicon)
+        else:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="scoring"
+            )
+
+    async def warm_up(self):
+        """
+        Scores a text on each worker of the pool, so that the worker processes are started and the lexicon is loaded
+        before the first comments are scored. Without a pool, the lexicon is loaded in the current process.
+        """
+        if self.executor is None:
+            await asyncio.to_thread(get_lexicon)
+            return
+
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *(
+                loop.run_in_executor(self.executor, score_texts, [WARM_UP_TEXT])
+                for _ in range(self.workers)
+            )
+        )
+
+    async def shutdown(self):
+        """
+        Waits for the pending scoring work to finish and releases the worker pool.
+        """
+        if self.executor is None:
+            return
+
+        executor, self.executor = self.executor, None
+
+        # Draining the pool blocks, so it is done from a thread to keep the event loop free
+        await asyncio.to_thread(executor.shutdown, wait=True)
+
+    async def score_batch(self, texts: Sequence[str]) -> List[Tuple[float, str]]:
+        """
+        Scores the given texts, splitting them into chunks that are scored concurrently by the pool.
+        When the engine has not been started (e.g. outside of the application lifespan), the texts
+        are scored inline.
+
+        Args:
+            texts (Sequence[str]): The texts to be scored.
+
+        Returns:
+            List[Tuple[float, str]]: The polarity score and classification of each text, in order.
+        """
+        if not texts:
+            return []
+
+        if self.executor is None:
+            return score_texts(texts)
+
+        loop = asyncio.get_running_loop()
+        chunks = [
+            texts[i : i + self.batch_size]
+            for i in range(0, len(texts), self.batch_size)
+        ]
+        results = await asyncio.gather(
+            *(
+                loop.run_in_executor(self.executor, score_texts, list(chunk))
+                for chunk in chunks
+            )
+        )
+
+        return [score for chunk_scores in results for score in chunk_scores]
@@ -0,0 +1,157 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from app.scoring.backfill import POLARITY_BACKFILL_BATCH_SIZE, PolarityBackfill
+
+WORKER_BATCH_SIZE = int(os.getenv("WORKER_BATCH_SIZE", POLARITY_BACKFILL_BATCH_SIZE))
+WORKER_INTERVAL = float(os.getenv("WORKER_INTERVAL", 5))
+WORKER_RESCAN_INTERVAL = float(os.getenv("WORKER_RESCAN_INTERVAL", 3600))
+WORKER_SHARD_COUNT = int(os.getenv("WORKER_SHARD_COUNT", 1))
+WORKER_SHARD_INDEX = int(os.getenv("WORKER_SHARD_INDEX", 0))
+WORKER_NOTIFY_CHANNEL = os.getenv("WORKER_NOTIFY_CHANNEL", "")
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionWorker:
+    """
+    Scores the comments incrementally into the `comment_polarity` table, outside of the API. The worker tails the
+    comments by ID from a checkpoint stored in the database, so that a restart resumes where it stopped, and
+    periodically rescans all of them to catch the comments whose text changed or that were committed out of ID order.
+    Several workers split the comments between them by ID modulo the number of shards.
+    """
+
+    def __init__(
+        self,
+        db_client,
+        scoring_engine,
+        batch_size: int = WORKER_BATCH_SIZE,
+        interval: float = WORKER_INTERVAL,
+        rescan_interval: float = WORKER_RESCAN_INTERVAL,
+        shard_count: int = WORKER_SHARD_COUNT,
+        shard_index: int = WORKER_SHARD_INDEX,
+        notify_channel: str = WORKER_NOTIFY_CHANNEL,
+    ):
+        """
+        Initializes the IngestionWorker instance.
+
+        Args:
+            db_client (PostgreClient): The client used to read the comments and store their scores.
+            scoring_engine (ScoringEngine): The engine used to score the comments.
+            batch_size (int): The number of comments scored at once. Defaults to WORKER_BATCH_SIZE.
+            interval (float): Seconds between two polls for new comments. Defaults to WORKER_INTERVAL.
+            rescan_interval (float): Seconds between two rescans of all the comments. Defaults to WORKER_RESCAN_INTERVAL.
+            shard_count (int): The number of workers splitting the comments. Defaults to WORKER_SHARD_COUNT.
+            shard_index (int): The shard of this worker, from 0 to shard_count - 1. Defaults to WORKER_SHARD_INDEX.
+            notify_channel (str): Channel whose notifications trigger a poll right away, '' to disable. Defaults to
+                WORKER_NOTIFY_CHANNEL.
+
+        Raises:
+            ValueError: If the shard index is not within the shard count.
+        """
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(
+                f"The shard index must be between 0 and {shard_count - 1}, not {shard_index}."
+            )
+
+        self.db_client = db_client
+        self.interval = interval
+        self.rescan_interval = rescan_interval
+        self.notify_channel = notify_channel
+        self.backfill = PolarityBackfill(
+            db_client,
+            scoring_engine,
+            batch_size=batch_size,
+            shard_count=shard_count,
+            shard_index=shard_index,
+        )
+        self.checkpoint_name = f"polarity-{shard_index}-of-{shard_count}"
+        self.last_id: Optional[int] = None
+        self.last_rescan: Optional[float] = None
+        self.wakeup = asyncio.Event()
+
+    async def save_checkpoint(self, last_id: int):
+        """
+        Records the ID of the last comment scanned.
+
+        Args:
+            last_id (int): The ID of the last comment scanned.
+        """
+        self.last_id = last_id
+        await self.db_client.store_checkpoint(self.checkpoint_name, last_id)
+
+    async def tail(self) -> int:
+        """
+        Scores the comments added since the checkpoint, advancing it after each batch, and once they are all scanned,
+        to the last comment, so that the comments already scored, e.g. by the API, are not scanned again.
+
+        Returns:
+            int: The number of comments scored.
+        """
+        if self.last_id is None:
+            self.last_id = await self.db_client.get_checkpoint(self.checkpoint_name)
+
+        # The pass scans every comment up to the last one at its start
+        last_comment_id = await self.db_client.get_last_comment_id()
+        scored = await self.backfill.run_once(
+            after_id=self.last_id, on_progress=self.save_checkpoint
+        )
+
+        if last_comment_id > self.last_id:
+            await self.save_checkpoint(last_comment_id)
+
+        return scored
+
+    async def run_once(self) -> int:
+        """
+        Scores the new comments and, when it is due, rescans all the comments of the shard.
+
+        Returns:
+            int: The number of comments scored.
+        """
+        scored = await self.tail()
+
+        now = time.monotonic()
+        if self.last_rescan is None or now - self.last_rescan >= self.rescan_interval:
+            scored += await self.backfill.run_once()
+            self.last_rescan = now
+
+        return scored
+
+    def on_notification(self, conn, pid, channel, payload):
+        """
+        Wakes the worker up when a notification is received.
+        """
+        self.wakeup.set()
+
+    async def run_forever(self):
+        """
+        Runs a pass every `interval` seconds, or as soon as a notification is received, until cancelled.
+        Failed passes are logged and retried at the next one.
+        """
+        listen_conn = None
+        if self.notify_channel:
+            listen_conn = await self.db_client.listen(
+                self.notify_channel, self.on_notification
+            )
+
+        try:
+            while True:
+                self.wakeup.clear()
+                try:
+                    scored = await self.run_once()
+                    if scored:
+                        logger.info("Scoring worker %s scored %d comments", self.checkpoint_name, scored)
+                except Exception as e:
+                    logger.error("Error while scoring comments: %s", e)
+
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            if listen_conn is not None:
+                await listen_conn.close()
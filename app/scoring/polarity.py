@@ -0,0 +1,225 @@
+import hashlib
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, List, Sequence, Tuple
+
+# Version of the scoring logic, stored alongside cached and precomputed scores.
+# It must be bumped whenever a change to the scoring can change the scores.
+SCORER_VERSION = "textblob-pattern-1"
+
+
+def text_hash(text: str) -> str:
+    """
+    Hashes the text of a comment, to detect when a stored score no longer matches the comment.
+    It is the MD5 hex digest, so that it can also be computed in SQL with `md5(text)`.
+
+    Args:
+        text (str): The text of the comment.
+
+    Returns:
+        str: The hex digest of the text.
+    """
+    return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+
+def classify_polarity(polarity: float) -> str:
+    """
+    Classifies a polarity score as 'positive', 'negative' or 'neutral'.
+
+    Args:
+        polarity (float): The polarity score, between -1 and 1.
+
+    Returns:
+        str: The sentiment classification of the polarity score.
+    """
+    if polarity > 0.1:
+        return "positive"
+    elif polarity < -0.1:
+        return "negative"
+    else:
+        return "neutral"
+
+
+class SentimentLexicon:
+    """
+    A compact copy of the lexicon of TextBlob's default sentiment analyzer, which scores texts the same way
+    `TextBlob(text).sentiment.polarity` does, without building a TextBlob, a parse and a subjectivity score per text.
+    Only the polarity, the intensity and whether the word can modify the next one are kept for each word.
+    """
+
+    def __init__(
+        self,
+        words: Dict[str, Tuple[float, float, bool]],
+        emoticons: Dict[str, float],
+        negations: FrozenSet[str],
+        punctuation: str,
+        find_tokens: Callable[[str], List[str]],
+    ):
+        """
+        Initializes the SentimentLexicon instance.
+
+        Args:
+            words (Dict[str, Tuple[float, float, bool]]): The (polarity, intensity, is_modifier) of each known word.
+            emoticons (Dict[str, float]): The polarity of each lower-cased emoticon.
+            negations (FrozenSet[str]): The words that invert the polarity of the next known word.
+            punctuation (str): The punctuation characters, which are never emoticons.
+            find_tokens (Callable[[str], List[str]]): Splits a text into sentences of space-separated tokens.
+        """
+        self.words = words
+        self.emoticons = emoticons
+        self.negations = negations
+        self.punctuation = punctuation
+        self.find_tokens = find_tokens
+
+    @classmethod
+    def from_textblob(cls) -> "SentimentLexicon":
+        """
+        Builds the lexicon from the sentiment lexicon shipped with TextBlob. TextBlob, and NLTK with it, is only
+        imported here, as it takes a large part of the startup time of the API.
+
+        Returns:
+            SentimentLexicon: The compact lexicon.
+        """
+        from textblob._text import EMOTICONS, PUNCTUATION
+        from textblob.en import parser
+        from textblob.en import sentiment as pattern_sentiment
+
+        # Words are looked up without part-of-speech tag, i.e. with the scores averaged over all their tags
+        words = {
+            word: (float(tags[None][0]), float(tags[None][2]), "RB" in tags)
+            for word, tags in pattern_sentiment.items()
+        }
+
+        # An emoticon belonging to several moods gets the polarity of the first one, as in TextBlob
+        emoticons = {}
+        for (_, polarity), mood_emoticons in EMOTICONS.items():
+            for emoticon in mood_emoticons:
+                emoticons.setdefault(emoticon.lower(), polarity)
+
+        return cls(words, emoticons, frozenset(pattern_sentiment.negations), PUNCTUATION, parser.find_tokens)
+
+    def polarity(self, tokens: List[str]) -> float:
+        """
+        Computes the polarity of a tokenized text, as the average polarity of its known words, where a word preceded
+        by an adverb ("very good") is intensified, a word preceded by a negation ("not good") is inverted and halved,
+        an exclamation mark boosts the previous word and emoticons count as words.
+
+        Args:
+            tokens (List[str]): The lower-cased tokens of the text.
+
+        Returns:
+            float: The polarity score, between -1 and 1.
+        """
+        words, emoticons, negations, punctuation = self.words, self.emoticons, self.negations, self.punctuation
+
+        # Each assessment is a [polarity, intensity, negated] list
+        assessments = []
+        modifier = None
+        negation = None
+
+        for token in tokens:
+            entry = words.get(token)
+            if entry is not None:
+                polarity, intensity, is_modifier = entry
+                if modifier is None:
+                    assessments.append([polarity, intensity, False])
+                else:
+                    # Known word preceded by a modifier ("really good")
+                    last = assessments[-1]
+                    last[0] = max(-1.0, min(polarity * last[1], +1.0))
+                    last[1] = intensity
+
+                # Known word preceded by a negation ("not really good")
+                if negation is not None:
+                    assessments[-1][1] = 1.0 / assessments[-1][1]
+                    assessments[-1][2] = True
+
+                modifier = token if is_modifier else None
+                negation = token if token in negations else None
+                continue
+
+            # Unknown word may be a negation, which is kept across small words ("not a good")
+            if token in negations:
+                negation = token
+            elif negation and len(token.strip("'")) > 1:
+                negation = None
+
+            if negation is not None and modifier is not None and modifier.endswith("ly"):
+                # Negation preceded by a modifier ("really not good")
+                assessments[-1][2] = True
+                negation = None
+            elif modifier and len(token) > 2:
+                # Modifiers are kept across small words ("really is a good")
+                modifier = None
+
+            # Exclamation marks boost the previous word, and indicate sarcasm in parentheses
+            if token == "!" and assessments:
+                assessments[-1][0] = max(-1.0, min(assessments[-1][0] * 1.25, +1.0))
+            if token == "(!)":
+                assessments.append([0.0, 1.0, False])
+
+            if not token.isalpha() and len(token) <= 5 and token not in punctuation:
+                emoticon_polarity = emoticons.get(token)
+                if emoticon_polarity is not None:
+                    assessments.append([emoticon_polarity, 1.0, False])
+
+        # Sum in order rather than with sum(), to add the floats exactly like TextBlob does
+        total = 0
+        for polarity, _, negated in assessments:
+            total += polarity * -0.5 if negated else polarity
+
+        return total / float(len(assessments) or 1)
+
+
+@lru_cache(maxsize=None)
+def get_lexicon() -> SentimentLexicon:
+    """
+    Returns the sentiment lexicon, loading it on first use. Each process loads it once.
+
+    Returns:
+        SentimentLexicon: The compact lexicon.
+    """
+    return SentimentLexicon.from_textblob()
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits a text into lower-cased tokens, with the tokenizer of TextBlob's default sentiment analyzer.
+
+    Args:
+        text (str): The text to be tokenized.
+
+    Returns:
+        List[str]: The lower-cased tokens of the text.
+    """
+    return [token.lower() for token in " ".join(get_lexicon().find_tokens(text)).split()]
+
+
+def score_batch(texts: Sequence[str]) -> List[float]:
+    """
+    Computes the polarity score of each of the given texts, with the same results as `TextBlob(text).sentiment.polarity`.
+
+    Args:
+        texts (Sequence[str]): The texts to be scored.
+
+    Returns:
+        List[float]: The polarity score of each text, in order.
+    """
+    lexicon = get_lexicon()
+
+    return [lexicon.polarity(tokenize(text)) for text in texts]
+
+
+def get_polarity(text: str) -> Tuple[float, str]:
+    """
+    Analyzes the sentiment of the given text like TextBlob and returns its polarity score
+    and classification ('positive', 'negative', or 'neutral') based on the polarity score.
+
+    Args:
+        text (str): The text whose sentiment is to be analyzed.
+
+    Returns:
+        Tuple[float, str]: A tuple containing the polarity score and the sentiment classification.
+    """
+    polarity = score_batch([text])[0]
+
+    return polarity, classify_polarity(polarity)
@@ -0,0 +1,46 @@
+import argparse
+import os
+
+import uvicorn
+
+SERVER_HOST = os.getenv("SERVER_HOST", "0.0.0.0")
+SERVER_PORT = int(os.getenv("SERVER_PORT", 8081))
+# Number of API processes, one per core by default so that the requests and their scoring use all the cores
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", os.cpu_count() or 1))
+SERVER_GRACEFUL_SHUTDOWN_TIMEOUT = float(os.getenv("SERVER_GRACEFUL_SHUTDOWN_TIMEOUT", 30))
+
+
+def run(host: str, port: int, workers: int):
+    """
+    Serves the API with several uvicorn worker processes, without reloading. Each process runs the lifespan of the
+    API, opening its own database pool and loading the sentiment lexicon, before it accepts connections, and nothing
+    is shared between the processes.
+
+    Args:
+        host (str): The address to listen on.
+        port (int): The port to listen on.
+        workers (int): The number of worker processes.
+    """
+    # The processes would rotate the same log file under each other, so they log to stderr only unless told otherwise
+    os.environ.setdefault("LOG_FILE", "")
+
+    uvicorn.run(
+        "app.app:app",
+        host=host,
+        port=port,
+        workers=max(1, workers),
+        # The logs of uvicorn go through the handlers of the API, which each process sets up when the lifespan of the
+        # API starts; the messages logged by uvicorn before, e.g. when it spawns the processes, go to the last-resort
+        # handler of Python, which only prints the warnings and errors to stderr
+        log_config=None,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_SHUTDOWN_TIMEOUT,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves the API in production, with a process per core.")
+    parser.add_argument("--host", default=SERVER_HOST)
+    parser.add_argument("--port", type=int, default=SERVER_PORT)
+    parser.add_argument("--workers", type=int, default=WEB_CONCURRENCY)
+    args = parser.parse_args()
+    run(args.host, args.port, args.workers)
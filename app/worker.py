@@ -0,0 +1,76 @@
+import argparse
+import asyncio
+import logging
+import signal
+
+from app.database.postgre import PostgreClient
+from app.logging_config import setup_logging
+from app.scoring.engine import SCORING_EXECUTOR, SCORING_WORKERS, ScoringEngine
+from app.scoring.ingestion import (
+    WORKER_BATCH_SIZE,
+    WORKER_SHARD_COUNT,
+    WORKER_SHARD_INDEX,
+    IngestionWorker,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def main(args: argparse.Namespace):
+    """
+    Runs a scoring worker until it receives SIGINT or SIGTERM.
+
+    Args:
+        args (argparse.Namespace): The command line arguments.
+    """
+    # The worker reads the comments it scores right after writing its checkpoint, so it only uses the primary
+    db_client = PostgreClient(replica_urls=[])
+    scoring_engine = ScoringEngine(executor=args.executor, workers=args.workers)
+
+    # Startup: connect to DB and create the tables the worker writes to
+    logger.info("Connecting to the database...")
+    await db_client.connect_to_db()
+    await db_client.create_polarity_table()
+    await db_client.create_sentiment_rollup()
+    await db_client.create_checkpoint_table()
+
+    scoring_engine.start()
+
+    worker = IngestionWorker(
+        db_client,
+        scoring_engine,
+        batch_size=args.batch_size,
+        shard_count=args.shard_count,
+        shard_index=args.shard_index,
+    )
+    logger.info("Starting the scoring worker %s...", worker.checkpoint_name)
+
+    # Stop gracefully on SIGINT or SIGTERM, the batch being scored is scored again on restart
+    task = asyncio.create_task(worker.run_forever())
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, task.cancel)
+
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        # Shutdown: let the pending scoring work finish, then close the database connections
+        logger.info("Shutting down the scoring worker...")
+        await scoring_engine.shutdown()
+        await db_client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Scores the sentiment of new and changed comments into the database."
+    )
+    parser.add_argument("--shard-count", type=int, default=WORKER_SHARD_COUNT)
+    parser.add_argument("--shard-index", type=int, default=WORKER_SHARD_INDEX)
+    parser.add_argument("--batch-size", type=int, default=WORKER_BATCH_SIZE)
+    parser.add_argument("--executor", choices=["thread", "process"], default=SCORING_EXECUTOR)
+    parser.add_argument("--workers", type=int, default=SCORING_WORKERS)
+    # Log to stderr only, the rotated log file belongs to the API process
+    setup_logging(log_file="")
+    asyncio.run(main(parser.parse_args()))
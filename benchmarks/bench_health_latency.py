@@ -0,0 +1,136 @@
+"""
+Measures the latency of `/health` while a large `/comments` request is being scored.
+
+The database is replaced by an in-memory stub, so the benchmark only measures how much the
+sentiment scoring of the `/comments` request stalls the event loop for the other requests.
+
+Usage:
+    python benchmarks/bench_health_latency.py --comments 2000 --executor inline thread process
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+import httpx
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.app import app
+from app.endpoints.comments import comments_handler
+from app.scoring.cache import PolarityCache
+from app.scoring.engine import ScoringEngine
+
+SAMPLE_TEXTS = [
+    "Love it. Love it. Love it.",
+    "Hate it! Hate it! Hate it! Nooooooo!",
+    "Well done! Enjoy! Good work. Proud of you.",
+    "It is what it is, nothing special about it.",
+    "Terrible service, I will never come back again.",
+]
+
+
+class StubPostgreClient:
+    """
+    Stands in for PostgreClient, returning `n_comments` synthetic comments without any I/O.
+    """
+
+    async def get_subfeddit_id(self, subfeddit_name: str) -> int:
+        return 1
+
+    async def get_comments(self, subfeddit_id, n_comments=25, **filters):
+        # None of the comments has a precomputed score, so all of them are scored by the request
+        return [
+            {
+                "id": i,
+                "text": SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)],
+                "polarity_score": None,
+                "polarity_classification": None,
+                "created_at": 1654041600 - i,
+            }
+            for i in range(n_comments)
+        ]
+
+
+def percentile(samples, pct):
+    """Returns the nearest-rank percentile of the given samples."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+async def run(executor: str, n_comments: int, health_interval: float) -> dict:
+    """Runs one `/comments` call with `/health` probes in the background and returns the stats."""
+    if executor == "inline":
+        comments_handler.scoring_engine = ScoringEngine()
+    else:
+        comments_handler.scoring_engine = ScoringEngine(executor=executor)
+        comments_handler.scoring_engine.start()
+
+    comments_handler.db_client = StubPostgreClient()
+    # Start from an empty cache, so every run scores all the comments
+    comments_handler.polarity_cache = PolarityCache()
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+        async def probe_health(done: asyncio.Event):
+            # Latencies are measured from the time each probe was due, so that the time a
+            # blocked event loop delays the probe is counted as well
+            due = time.perf_counter()
+            while True:
+                await client.get("/health")
+                latencies.append((time.perf_counter() - due) * 1000)
+                if done.is_set():
+                    break
+                due = time.perf_counter() + health_interval
+                await asyncio.sleep(health_interval)
+
+        done = asyncio.Event()
+        prober = asyncio.create_task(probe_health(done))
+
+        # Let the prober get going so the probes overlap the whole `/comments` call
+        await asyncio.sleep(0.05)
+        latencies.clear()
+
+        start = time.perf_counter()
+        response = await client.get(
+            "/comments", params={"subfeddit_name": "bench", "n_comments": n_comments}
+        )
+        comments_ms = (time.perf_counter() - start) * 1000
+
+        done.set()
+        await prober
+
+    await comments_handler.scoring_engine.shutdown()
+    response.raise_for_status()
+
+    return {
+        "executor": executor,
+        "comments_ms": round(comments_ms, 1),
+        "health_samples": len(latencies),
+        "health_p50_ms": round(statistics.median(latencies), 2),
+        "health_p99_ms": round(percentile(latencies, 99), 2),
+        "health_max_ms": round(max(latencies), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--comments", type=int, default=2000)
+    parser.add_argument("--interval", type=float, default=0.001)
+    parser.add_argument(
+        "--executor", nargs="+", default=["inline", "thread", "process"]
+    )
+    args = parser.parse_args()
+
+    for executor in args.executor:
+        print(asyncio.run(run(executor, args.comments, args.interval)))
+
+
+if __name__ == "__main__":
+    main()
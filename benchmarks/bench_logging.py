@@ -0,0 +1,154 @@
+"""
+Measures the throughput of `/comments` with logging off, written synchronously from the event loop, and
+written through the queue to a background thread, with and without sampling.
+
+The database is replaced by an in-memory stub and the response cache serves the repeated request, so the
+benchmark mostly measures the cost of the request logs. `--write-delay` emulates a slower disk, e.g. a network
+volume, by waiting after each write of a log record.
+
+Usage:
+    python benchmarks/bench_logging.py --requests 5000 --concurrency 20 --write-delay 0.5
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import httpx
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.app import app
+from app.endpoints.comments import comments_handler
+from app.logging_config import TEXT_FORMAT, setup_logging, shutdown_logging
+
+MODES = ["off", "sync", "queue", "sampled"]
+
+
+class StubPostgreClient:
+    """
+    Stands in for PostgreClient, returning `n_comments` already scored comments without any I/O.
+    """
+
+    async def get_comments_by_title(self, subfeddit_name, n_comments=25, **filters):
+        return 1, [
+            {
+                "id": i,
+                "username": f"user_{i}",
+                "text": "Love it.",
+                "polarity_score": 0.5,
+                "polarity_classification": "positive",
+                "created_at": 1654041600 - i,
+            }
+            for i in range(n_comments)
+        ]
+
+
+def percentile(samples, pct):
+    """Returns the nearest-rank percentile of the given samples."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def slow_down_writes(write_delay: float):
+    """Makes every log handler wait `write_delay` milliseconds after writing a record."""
+    flush = logging.StreamHandler.flush
+
+    def slow_flush(self):
+        flush(self)
+        time.sleep(write_delay / 1000)
+
+    logging.StreamHandler.flush = slow_flush
+
+
+def configure(mode: str, log_file: str, sample_rate: float):
+    """Sets up the logging of the given mode, writing to `log_file`."""
+    shutdown_logging()
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+
+    if mode == "off":
+        root.setLevel(logging.CRITICAL)
+    elif mode == "sync":
+        # The former setup: each record is formatted and written to the file by the caller
+        handler = logging.FileHandler(log_file, mode="a")
+        handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(logging.INFO)
+    else:
+        setup_logging(
+            level="INFO",
+            sample_rate=sample_rate if mode == "sampled" else 1,
+            log_file=log_file,
+            console=False,
+        )
+
+    # Leave out the logs of the benchmark's own HTTP client
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+async def run(mode: str, requests: int, concurrency: int, sample_rate: float) -> dict:
+    """Runs `requests` calls of `/comments` with `concurrency` callers in flight and returns the stats."""
+    comments_handler.db_client = StubPostgreClient()
+    transport = httpx.ASGITransport(app=app)
+    latencies = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        log_file = os.path.join(directory, "app.log")
+        configure(mode, log_file, sample_rate)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+
+            async def call():
+                async with semaphore:
+                    start = time.perf_counter()
+                    response = await client.get("/comments", params={"subfeddit_name": "bench"})
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    response.raise_for_status()
+
+            start = time.perf_counter()
+            await asyncio.gather(*(call() for _ in range(requests)))
+            elapsed = time.perf_counter() - start
+
+        # Count the lines once the queued records are written
+        shutdown_logging()
+        with open(log_file, "a+") as file:
+            file.seek(0)
+            lines = sum(1 for _ in file)
+
+    return {
+        "mode": mode,
+        "requests_per_s": round(requests / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p99_ms": round(percentile(latencies, 99), 2),
+        "log_lines": lines,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--sample-rate", type=float, default=0.01)
+    parser.add_argument("--write-delay", type=float, default=0, help="milliseconds")
+    parser.add_argument("--mode", nargs="+", choices=MODES, default=MODES)
+    args = parser.parse_args()
+
+    if args.write_delay:
+        slow_down_writes(args.write_delay)
+
+    for mode in args.mode:
+        print(asyncio.run(run(mode, args.requests, args.concurrency, args.sample_rate)))
+
+
+if __name__ == "__main__":
+    main()
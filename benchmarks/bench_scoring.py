@@ -0,0 +1,68 @@
+"""
+Measures the sentiment scoring throughput of a single core, in comments per second, of TextBlob objects
+(`TextBlob(text).sentiment.polarity`) versus the batch scorer (`score_batch`), and checks they give the same scores.
+
+Usage:
+    python benchmarks/bench_scoring.py --comments 20000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from textblob import TextBlob
+
+from app.scoring.polarity import get_lexicon, score_batch
+
+SENTENCES = [
+    "This is a really great post, I love it!",
+    "Terrible experience. I'm never coming back... worst service ever",
+    "The product arrived on time and works as expected.",
+    "Not bad at all :)",
+    "Honestly it is not a good idea, but the team was very helpful.",
+    "Why would anyone do that?",
+    "Best. Thread. Ever. <3",
+    "I don't know, it seems fine to me.",
+]
+
+
+def build_comments(n_comments: int, seed: int = 0) -> list:
+    """Builds comments of one to four random sentences."""
+    rng = random.Random(seed)
+    return [" ".join(rng.choices(SENTENCES, k=rng.randint(1, 4))) for _ in range(n_comments)]
+
+
+def textblob_batch(texts):
+    return [TextBlob(text).sentiment.polarity for text in texts]
+
+
+def measure(scorer, texts) -> tuple:
+    """Returns the scores and the throughput of the scorer, in comments per second."""
+    start = time.perf_counter()
+    scores = scorer(texts)
+    return scores, len(texts) / (time.perf_counter() - start)
+
+
+def main(args):
+    texts = build_comments(args.comments)
+
+    # Load both lexicons before measuring
+    TextBlob("warm up").sentiment
+    get_lexicon()
+
+    reference, textblob_rate = measure(textblob_batch, texts)
+    scores, batch_rate = measure(score_batch, texts)
+
+    print(f"textblob:    {textblob_rate:10.0f} comments/s per core")
+    print(f"score_batch: {batch_rate:10.0f} comments/s per core ({batch_rate / textblob_rate:.1f}x)")
+    print(f"identical scores: {scores == reference}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--comments", type=int, default=20000)
+    main(parser.parse_args())
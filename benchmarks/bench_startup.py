@@ -0,0 +1,78 @@
+"""
+Measures the cold start of the API: the time to import `app.app` in a fresh interpreter, the time to load the
+sentiment lexicon as the lifespan does, and the import-time profile of the modules taking the longest to import.
+
+Usage:
+    python benchmarks/bench_startup.py --runs 10 --top 15
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+
+from common import ROOT, save_results, summarize
+
+# Times the import of the API, then the loading of the lexicon, in the fresh interpreter it runs in
+STARTUP_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import app.app
+imported = time.perf_counter()
+from app.scoring.polarity import get_lexicon
+get_lexicon()
+warm = time.perf_counter()
+print(json.dumps({"import_ms": (imported - start) * 1000, "lexicon_ms": (warm - imported) * 1000}))
+"""
+
+
+def measure(runs: int) -> list:
+    """Starts `runs` fresh interpreters and summarizes their import and lexicon loading times."""
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", STARTUP_SCRIPT], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        timings.append(json.loads(output.splitlines()[-1]))
+
+    return [
+        {"name": stage, **summarize([timing[stage] for timing in timings])}
+        for stage in ("import_ms", "lexicon_ms")
+    ]
+
+
+def import_profile(top: int) -> list:
+    """Returns the modules taking the longest to import with `app.app`, with their cumulative time in milliseconds."""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.app"], cwd=ROOT, capture_output=True, text=True
+    ).stderr
+
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        modules.append((int(cumulative) / 1000, name.strip()))
+
+    return sorted(modules, reverse=True)[:top]
+
+
+def main(args):
+    results = measure(args.runs)
+    for result in results:
+        print(result)
+
+    print("\nslowest imports of app.app (cumulative ms):")
+    for cumulative_ms, name in import_profile(args.top):
+        print(f"{cumulative_ms:10.1f}  {name}")
+
+    output = save_results("startup", {"runs": args.runs}, results, args.output)
+    print(f"\nresults saved to {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--output", help="file to save the results to (default: benchmarks/results/)")
+    main(parser.parse_args())
@@ -0,0 +1,133 @@
+"""
+Helpers shared by the benchmarks: the local Postgres fixture, latency statistics and the JSON results.
+"""
+
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import List, Optional
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+sys.path.append(ROOT)
+
+from app.database import postgre
+
+# Keeps the containerless Postgres server started by `use_database` alive until the process exits
+_server = None
+
+
+def use_database(pgdata: Optional[str] = None) -> str:
+    """
+    Points PostgreClient at the benchmark database: the one of `DATABASE_URI` if set, otherwise a containerless
+    Postgres server started with the optional `pgserver` package, whose data is kept in `pgdata`.
+
+    Args:
+        pgdata (Optional[str]): The data directory of the containerless server. Defaults to benchmarks/.pgdata.
+
+    Returns:
+        str: The connection URI of the database.
+
+    Raises:
+        RuntimeError: If `DATABASE_URI` is not set and `pgserver` is not installed.
+    """
+    global _server
+
+    uri = os.getenv("DATABASE_URI")
+    if not uri:
+        try:
+            import pgserver
+        except ImportError:
+            raise RuntimeError(
+                "Set DATABASE_URI, e.g. to the database of docker-compose.yml, or `pip install pgserver` "
+                "to run the benchmarks against a containerless Postgres server."
+            )
+
+        _server = pgserver.get_server(pgdata or os.path.join(ROOT, "benchmarks", ".pgdata"))
+        uri = _server.get_uri()
+
+    # PostgreClient reads the URI when it connects
+    postgre.DATABASE_URL = uri
+    return uri
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Returns the nearest-rank percentile of the given samples."""
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies_ms: List[float], elapsed: Optional[float] = None) -> dict:
+    """
+    Summarizes latencies, in milliseconds, and the throughput when the elapsed time of the run is given.
+    """
+    summary = {}
+    if elapsed is not None:
+        summary["requests_per_s"] = round(len(latencies_ms) / elapsed, 1)
+
+    summary.update(
+        samples=len(latencies_ms),
+        mean_ms=round(statistics.fmean(latencies_ms), 3),
+        p50_ms=round(statistics.median(latencies_ms), 3),
+        p95_ms=round(percentile(latencies_ms, 95), 3),
+        p99_ms=round(percentile(latencies_ms, 99), 3),
+        max_ms=round(max(latencies_ms), 3),
+    )
+    return summary
+
+
+def git_commit() -> str:
+    """Returns the commit the benchmark runs on, with a '-dirty' suffix when the tree has uncommitted changes."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+    return commit + ("-dirty" if dirty else "")
+
+
+def save_results(benchmark: str, parameters: dict, results: List[dict], output: Optional[str] = None) -> str:
+    """
+    Saves the results of a benchmark as JSON, with the commit and machine they were measured on, so that they can be
+    compared between commits with `benchmarks/compare.py`.
+
+    Args:
+        benchmark (str): The name of the benchmark.
+        parameters (dict): The parameters of the run.
+        results (List[dict]): The results, one per case, each with a 'name'.
+        output (Optional[str]): The file to write. Defaults to benchmarks/results/<benchmark>-<commit>.json.
+
+    Returns:
+        str: The path of the file written.
+    """
+    commit = git_commit()
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{benchmark}-{commit}.json")
+
+    report = {
+        "benchmark": benchmark,
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "parameters": parameters,
+        "results": results,
+    }
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
+
+    return output
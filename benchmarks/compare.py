@@ -0,0 +1,74 @@
+"""
+Compares two result files of the same benchmark, e.g. measured on two commits, case by case.
+
+Throughputs are better when higher and latencies when lower; the changes beyond `--threshold` percent in the wrong
+direction are flagged as regressions, and the exit code is 1 when there is any.
+
+Usage:
+    python benchmarks/compare.py benchmarks/results/load-1a2b3c4.json benchmarks/results/load-5d6e7f8.json
+"""
+
+import argparse
+import json
+import sys
+
+# The compared metrics, and whether higher is better
+METRICS = {
+    "requests_per_s": True,
+    "p50_ms": False,
+    "p95_ms": False,
+    "p99_ms": False,
+}
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> tuple:
+    """Returns the lines of the comparison, and the number of regressions."""
+    lines = [f"{baseline['benchmark']}: {baseline['commit']} -> {candidate['commit']}"]
+    regressions = 0
+    baseline_results = {result["name"]: result for result in baseline["results"]}
+
+    for result in candidate["results"]:
+        reference = baseline_results.get(result["name"])
+        if reference is None:
+            lines.append(f"  {result['name']}: not in the baseline")
+            continue
+
+        changes = []
+        for metric, higher_is_better in METRICS.items():
+            if metric not in result or not reference.get(metric):
+                continue
+
+            change = (result[metric] - reference[metric]) / reference[metric] * 100
+            regressed = change < -threshold if higher_is_better else change > threshold
+            regressions += regressed
+            changes.append(
+                f"{metric} {reference[metric]} -> {result[metric]} ({change:+.1f}%)" + (" REGRESSION" if regressed else "")
+            )
+
+        lines.append(f"  {result['name']}: " + ", ".join(changes))
+
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10, help="percent")
+    args = parser.parse_args()
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.candidate) as file:
+        candidate = json.load(file)
+
+    if baseline["benchmark"] != candidate["benchmark"]:
+        sys.exit(f"Cannot compare the {baseline['benchmark']} and {candidate['benchmark']} benchmarks")
+
+    lines, regressions = compare(baseline, candidate, args.threshold)
+    print("\n".join(lines))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the modules to test
+from app.handlers.admission import AdmissionController, ClientQueueFullError, OverloadedError
+
+
+async def hold(controller: AdmissionController, client: str, cost: int, release: asyncio.Event, order: list):
+    """Holds an admission until the release event is set, recording the order of the admissions"""
+    async with controller.admit(client, cost):
+        order.append(client)
+        await release.wait()
+
+
+@pytest.mark.asyncio
+async def test_admit_within_capacity():
+    """Test AdmissionController's admit method admits right away the requests within the capacity"""
+    controller = AdmissionController(capacity=100)
+
+    async with controller.admit("a", 60):
+        async with controller.admit("b", 40):
+            assert controller.in_use == 100
+
+    # A request costing more than the capacity is admitted alone
+    async with controller.admit("a", 500):
+        assert controller.in_use == 100
+
+    stats = controller.stats()
+    assert stats["in_use"] == 0
+    assert stats["admitted"] == 3
+    assert stats["waited"] == 0
+
+
+@pytest.mark.asyncio
+async def test_clients_served_in_turn():
+    """Test AdmissionController's admit method serves the waiting clients in turn, one request each"""
+    controller = AdmissionController(capacity=10, max_queue_wait=5)
+    release, order = asyncio.Event(), []
+
+    # The first request takes the whole capacity, the next ones wait: three of client a, then one of client b
+    first = asyncio.create_task(hold(controller, "first", 10, release, order))
+    await asyncio.sleep(0)
+    tasks = [asyncio.create_task(hold(controller, client, 10, release, order)) for client in ["a", "a", "a", "b"]]
+    await asyncio.sleep(0)
+    assert controller.stats()["queued"] == 4
+    assert controller.stats()["queued_clients"] == 2
+
+    release.set()
+    await asyncio.gather(first, *tasks)
+
+    assert order == ["first", "a", "b", "a", "a"]
+    assert controller.in_use == 0
+
+
+@pytest.mark.asyncio
+async def test_reject_after_max_queue_wait():
+    """Test AdmissionController's admit method rejects a request that waited too long, without leaking capacity"""
+    controller = AdmissionController(capacity=10, max_queue_wait=0.01)
+    release, order = asyncio.Event(), []
+    task = asyncio.create_task(hold(controller, "a", 10, release, order))
+    await asyncio.sleep(0)
+
+    with pytest.raises(OverloadedError) as error:
+        async with controller.admit("b", 5):
+            pass
+
+    assert error.value.retry_after == 1
+    assert controller.stats()["queued"] == 0
+    assert controller.stats()["rejected_overloaded"] == 1
+
+    release.set()
+    await task
+    assert controller.in_use == 0
+
+
+@pytest.mark.asyncio
+async def test_reject_full_queues():
+    """Test AdmissionController's admit method rejects the requests of a client with too many waiting ones, and any
+    request when the queue is full"""
+    controller = AdmissionController(capacity=10, max_queue_wait=5, max_queue_size=2, max_client_queue=1)
+    release, order = asyncio.Event(), []
+    tasks = [asyncio.create_task(hold(controller, client, 10, release, order)) for client in ["a", "a", "b"]]
+    await asyncio.sleep(0)
+
+    with pytest.raises(ClientQueueFullError):
+        async with controller.admit("a", 1):
+            pass
+    with pytest.raises(OverloadedError):
+        async with controller.admit("c", 1):
+            pass
+
+    assert controller.stats()["rejected_client"] == 1
+    assert controller.stats()["rejected_overloaded"] == 1
+
+    release.set()
+    await asyncio.gather(*tasks)
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    """Test AdmissionController's admit method drops a cancelled request from the queue, letting the next one in"""
+    controller = AdmissionController(capacity=10, max_queue_wait=5)
+    release, order = asyncio.Event(), []
+    first = asyncio.create_task(hold(controller, "first", 8, release, order))
+    await asyncio.sleep(0)
+    large = asyncio.create_task(hold(controller, "large", 10, release, order))
+    small = asyncio.create_task(hold(controller, "small", 2, release, order))
+    await asyncio.sleep(0)
+    assert order == ["first"]
+
+    # The small request was held back by the large one waiting before it
+    large.cancel()
+    await asyncio.sleep(0.01)
+    assert order == ["first", "small"]
+
+    release.set()
+    await asyncio.gather(first, small)
+    assert controller.in_use == 0
+    assert controller.stats()["queued"] == 0
@@ -1,11 +1,13 @@
 import os
 import sys
+from unittest.mock import MagicMock
 
 from fastapi.testclient import TestClient
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 from app.app import app
+from app.endpoints import comments
 
 # Create a test client
 client = TestClient(app)
@@ -25,6 +27,21 @@ def test_health_check_endpoint():
     assert response.json() == {"status": "ok"}
 
 
+def test_readiness_check_endpoint(monkeypatch):
+    """Test the readiness endpoint only reports ready once the lifespan has warmed the process up"""
+    # The test client does not run the lifespan, so the process is not ready
+    response = client.get("/health/ready")
+    assert response.status_code == 503
+    assert response.json() == {"status": "unavailable"}
+
+    # Simulate the end of the startup
+    monkeypatch.setattr(app.state, "ready", True, raising=False)
+    monkeypatch.setattr(comments.comments_handler.db_client, "pool", MagicMock())
+    response = client.get("/health/ready")
+    assert response.status_code == 200
+    assert response.json() == {"status": "ok"}
+
+
 def test_comments_router_included():
     """
     Test that the comments router is properly included
@@ -38,3 +55,28 @@ def test_comments_router_included():
     # This is a simple check and might need adjustment based on your actual route naming
     has_comments_routes = any("comments" in route for route in routes)
     assert has_comments_routes
+
+
+def test_stats_endpoint():
+    """Test the stats endpoint returns the pool and polarity cache metrics"""
+    response = client.get("/stats")
+    assert response.status_code == 200
+    assert response.json()["pool"]["waiting"] == 0
+    assert response.json()["polarity_cache"]["misses"] >= 0
+    assert response.json()["response_cache"]["coalesced"] >= 0
+    assert response.json()["admission"]["in_use"] == 0
+    assert response.json()["live"]["subscribers"] == 0
+
+
+def test_metrics_endpoint():
+    """Test the metrics endpoint returns the request histograms and the pool and cache metrics in the Prometheus format"""
+    client.get("/health")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'feddit_request_duration_seconds_count{endpoint="/health",outcome="success"}' in response.text
+    assert "# TYPE feddit_db_pool_waiting gauge" in response.text
+    assert "feddit_polarity_cache_hit_ratio" in response.text
+    assert "feddit_response_cache_misses_total" in response.text
+    assert "feddit_admission_rejected_overloaded_total" in response.text
+    assert "feddit_live_comments_sent_total" in response.text
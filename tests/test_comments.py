@@ -1,14 +1,30 @@
+import asyncio
+import base64
+import json
 import os
 import sys
 from unittest.mock import patch
 
 import pytest
 from fastapi import HTTPException
+from fastapi.testclient import TestClient
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 
-from app.endpoints.comments import comments_handler, get_comments
+from app.app import app
+from app.database.postgre import SubfedditNotFoundError
+from app.endpoints.comments import admission_controller, comments_handler, get_comments, stream_comments
+from app.handlers.admission import AdmissionController
+from app.handlers.comments_handler import STREAM_BATCH_SIZE
+
+
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    """Fixture to start every test with an empty response cache"""
+    comments_handler.response_cache.clear()
+    yield
+    comments_handler.response_cache.clear()
 
 
 @pytest.mark.asyncio
@@ -31,7 +47,7 @@ async def test_get_comments_api_success():
                 "polarity_classification": "negative",
             },
         ]
-        mock_get_comments.return_value = mock_comments
+        mock_get_comments.return_value = (mock_comments, "next-page")
 
         # Call the API endpoint
         result = await get_comments(
@@ -53,8 +69,12 @@ async def test_get_comments_api_success():
             n_comments=2,
             min_polarity=-0.8,
             max_polarity=0.8,
+            cursor=None,
+            search=None,
         )
-        assert result == mock_comments
+        assert result.media_type == "application/json"
+        assert json.loads(result.body) == mock_comments
+        assert result.headers["X-Next-Cursor"] == "next-page"
 
 
 @pytest.mark.asyncio
@@ -71,3 +91,296 @@ async def test_get_comments_api_error():
         # Assertions
         assert excinfo.value.status_code == 500
         assert "An unexpected error occurred" in excinfo.value.detail
+
+
+@pytest.mark.asyncio
+async def test_get_comments_api_last_page():
+    """Test the get_comments API endpoint does not return a cursor after the last page"""
+    with patch.object(comments_handler, "get_comments") as mock_get_comments:
+        mock_get_comments.return_value = ([], None)
+
+        response = await get_comments(subfeddit_name="test_subfeddit")
+
+        assert response.body == b"[]"
+        assert "X-Next-Cursor" not in response.headers
+
+
+@pytest.mark.asyncio
+async def test_get_comments_api_invalid_cursor():
+    """Test the get_comments API endpoint returns a 400 error for an invalid cursor"""
+    with pytest.raises(HTTPException) as excinfo:
+        await get_comments(subfeddit_name="test_subfeddit", cursor="not-a-cursor")
+
+    assert excinfo.value.status_code == 400
+
+    # A well-formed cursor whose created_at was replaced by a string does not reach the database
+    tampered = base64.urlsafe_b64encode(b'{"s":"created_at","k":["yesterday",42]}').decode("ascii")
+    with patch.object(comments_handler.db_client, "get_comments") as mock_get_comments:
+        with pytest.raises(HTTPException) as excinfo:
+            await get_comments(subfeddit_name="test_subfeddit", cursor=tampered)
+
+    assert excinfo.value.status_code == 400
+    assert excinfo.value.detail == "Invalid cursor."
+    mock_get_comments.assert_not_called()
+
+
+def mock_batches(*batches):
+    """Builds the async iterator of comment batches returned by CommentsHandler.stream_comments"""
+
+    async def iterate():
+        for batch in batches:
+            yield batch
+
+    return iterate()
+
+
+@pytest.mark.parametrize(
+    "format, media_type, expected",
+    [
+        (
+            "ndjson",
+            "application/x-ndjson",
+            '{"id": 1, "text": "Great post!", "polarity_score": 0.8, "polarity_classification": "positive"}\n'
+            '{"id": 2, "text": "Bad, bad.", "polarity_score": -0.6, "polarity_classification": "negative"}\n',
+        ),
+        (
+            "csv",
+            "text/csv",
+            "id,text,polarity_score,polarity_classification\r\n"
+            "1,Great post!,0.8,positive\r\n"
+            '2,"Bad, bad.",-0.6,negative\r\n',
+        ),
+    ],
+)
+def test_stream_comments_api(format, media_type, expected):
+    """Test the stream_comments API endpoint writes every batch in the requested format"""
+    client = TestClient(app)
+
+    with patch.object(comments_handler, "stream_comments") as mock_stream_comments:
+        mock_stream_comments.return_value = mock_batches(
+            [{"id": 1, "text": "Great post!", "polarity_score": 0.8, "polarity_classification": "positive"}],
+            [{"id": 2, "text": "Bad, bad.", "polarity_score": -0.6, "polarity_classification": "negative"}],
+        )
+
+        response = client.get(
+            "/comments/stream", params={"subfeddit_name": "test_subfeddit", "format": format}
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(media_type)
+    assert response.text == expected
+
+
+def test_stream_comments_api_error():
+    """Test the stream_comments API endpoint returns a 500 error when the stream cannot be opened"""
+    client = TestClient(app)
+
+    with patch.object(comments_handler, "stream_comments") as mock_stream_comments:
+        mock_stream_comments.side_effect = ValueError("Subfeddit 'unknown' not found.")
+
+        response = client.get("/comments/stream", params={"subfeddit_name": "unknown"})
+
+    assert response.status_code == 500
+
+
+def test_stream_comments_api_invalid_date():
+    """Test the stream_comments API endpoint returns a 400 error for a malformed date before the stream starts"""
+    client = TestClient(app)
+
+    with patch.object(comments_handler, "stream_comments") as mock_stream_comments:
+        response = client.get("/comments/stream", params={"subfeddit_name": "test_subfeddit", "from_date": "2023-01-01"})
+
+    assert response.status_code == 400
+    assert response.json()["detail"] == "from_date must be formatted as DD-MM-YYYY"
+    mock_stream_comments.assert_not_called()
+
+
+def test_stream_comments_api_admission():
+    """Test the stream_comments API endpoint holds its admission while streaming, and sheds the streams it cannot admit"""
+    client = TestClient(app)
+    controller = AdmissionController(capacity=1000, max_queue_wait=0)
+    in_use = []
+
+    async def batches():
+        # The admission of the stream is held while its batches are read
+        in_use.append(controller.in_use)
+        yield [{"id": 1, "text": "Great post!", "polarity_score": 0.8, "polarity_classification": "positive"}]
+
+    with patch.object(comments_handler, "stream_comments") as mock_stream_comments, patch.object(
+        admission_controller, "admit", controller.admit
+    ):
+        mock_stream_comments.return_value = batches()
+        response = client.get("/comments/stream", params={"subfeddit_name": "test_subfeddit"})
+        released = controller.in_use == 0
+
+        # A controller whose capacity is all in use, and that does not let requests wait
+        controller.in_use = 1000
+        mock_stream_comments.reset_mock()
+        overloaded = client.get("/comments/stream", params={"subfeddit_name": "test_subfeddit"})
+
+    assert response.status_code == 200
+    assert in_use == [STREAM_BATCH_SIZE]
+    assert released
+    assert controller.admitted == 1
+    assert overloaded.status_code == 503
+    assert overloaded.headers["Retry-After"] == "1"
+    mock_stream_comments.assert_not_called()
+
+
+def test_stream_comments_api_releases_admission_on_error():
+    """Test the stream_comments API endpoint gives its admission back when the stream cannot be opened"""
+    client = TestClient(app)
+    controller = AdmissionController(capacity=1000)
+
+    with patch.object(comments_handler, "stream_comments") as mock_stream_comments, patch.object(
+        admission_controller, "admit", controller.admit
+    ):
+        mock_stream_comments.side_effect = SubfedditNotFoundError("Subfeddit 'unknown' not found.")
+        response = client.get("/comments/stream", params={"subfeddit_name": "unknown"})
+
+    assert response.status_code == 404
+    assert controller.in_use == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_comments_api_releases_admission_on_cancel():
+    """Test the stream_comments API endpoint gives its admission back when the request is cancelled before it streams"""
+    controller = AdmissionController(capacity=1000)
+    started = asyncio.Event()
+
+    async def open_stream(**kwargs):
+        started.set()
+        await asyncio.Event().wait()
+
+    with patch.object(comments_handler, "stream_comments", side_effect=open_stream), patch.object(
+        admission_controller, "admit", controller.admit
+    ):
+        before = controller.stats()
+        task = asyncio.create_task(stream_comments(subfeddit_name="Dummy Topic 1"))
+        await started.wait()
+        assert controller.in_use == STREAM_BATCH_SIZE
+
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    after = controller.stats()
+    assert after["in_use"] == before["in_use"] == 0
+    assert after["in_flight"] == before["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_get_comments_api_subfeddit_not_found():
+    """Test the get_comments API endpoint returns a 404 error for an unknown subfeddit"""
+    with patch.object(comments_handler, "get_comments") as mock_get_comments:
+        mock_get_comments.side_effect = SubfedditNotFoundError("Subfeddit 'unknown' not found.")
+
+        with pytest.raises(HTTPException) as excinfo:
+            await get_comments(subfeddit_name="unknown")
+
+        assert excinfo.value.status_code == 404
+
+
+def test_get_comments_batch_api():
+    """Test the get_comments_batch API endpoint reports the result of each query"""
+    client = TestClient(app)
+
+    with patch.object(comments_handler, "get_comments_batch") as mock_get_comments_batch:
+        mock_get_comments_batch.return_value = [
+            (
+                [{"id": 1, "text": "Great post!", "polarity_score": 0.8, "polarity_classification": "positive"}],
+                "next-page",
+            ),
+            SubfedditNotFoundError("Subfeddit 'unknown' not found."),
+        ]
+
+        response = client.post(
+            "/comments/batch",
+            json={"queries": [{"subfeddit_name": "test_subfeddit", "n_comments": 1}, {"subfeddit_name": "unknown"}]},
+        )
+
+    assert response.status_code == 200
+    first, second = response.json()["results"]
+    assert first["status_code"] == 200
+    assert first["comments"][0]["id"] == 1
+    assert first["next_cursor"] == "next-page"
+    assert second["status_code"] == 404
+    assert second["comments"] is None
+    assert mock_get_comments_batch.call_args.args[0][0]["n_comments"] == 1
+
+
+def test_get_comments_batch_api_invalid_polarity():
+    """Test the get_comments_batch API endpoint rejects out of range polarities"""
+    client = TestClient(app)
+
+    response = client.post(
+        "/comments/batch", json={"queries": [{"subfeddit_name": "test_subfeddit", "min_polarity": -2}]}
+    )
+
+    assert response.status_code == 422
+
+
+def test_get_comments_api_etag():
+    """Test the get_comments API endpoint answers a matching If-None-Match with a 304 from the cache"""
+    client = TestClient(app)
+
+    with patch.object(comments_handler, "get_comments") as mock_get_comments:
+        mock_get_comments.return_value = (
+            [{"id": 1, "text": "Great post!", "polarity_score": 0.8, "polarity_classification": "positive"}],
+            None,
+        )
+
+        response = client.get("/comments", params={"subfeddit_name": "test_subfeddit"})
+        etag = response.headers["ETag"]
+        revalidated = client.get(
+            "/comments", params={"subfeddit_name": "test_subfeddit"}, headers={"If-None-Match": etag}
+        )
+
+    assert response.status_code == 200
+    assert "max-age" in response.headers["Cache-Control"]
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == etag
+    mock_get_comments.assert_called_once()
+
+
+def test_search_comments_api():
+    """Test the search_comments API endpoint searches with the other filters, and requires a query"""
+    client = TestClient(app)
+
+    with patch.object(comments_handler, "get_comments") as mock_get_comments:
+        mock_get_comments.return_value = (
+            [{"id": 1, "text": "Checkout is broken", "polarity_score": -0.4, "polarity_classification": "negative"}],
+            None,
+        )
+
+        response = client.get(
+            "/comments/search",
+            params={"subfeddit_name": "search_subfeddit", "q": "checkout", "max_polarity": -0.1},
+        )
+        missing_query = client.get("/comments/search", params={"subfeddit_name": "search_subfeddit"})
+
+    assert response.status_code == 200
+    assert response.json()[0]["id"] == 1
+    assert mock_get_comments.call_args.kwargs["search"] == "checkout"
+    assert mock_get_comments.call_args.kwargs["max_polarity"] == -0.1
+    assert missing_query.status_code == 422
+
+
+def test_get_comments_api_admission():
+    """Test the get_comments API endpoint bounds the page size and sheds the requests it cannot admit in time"""
+    client = TestClient(app)
+
+    too_large = client.get("/comments", params={"subfeddit_name": "test_subfeddit", "n_comments": 100000})
+
+    # An admission controller whose capacity is all in use, and that does not let requests wait
+    overloaded = AdmissionController(capacity=10, max_queue_wait=0)
+    overloaded.in_use = 10
+    with patch.object(comments_handler, "get_comments") as mock_get_comments, patch.object(
+        admission_controller, "admit", overloaded.admit
+    ):
+        response = client.get("/comments", params={"subfeddit_name": "test_subfeddit"})
+
+    assert too_large.status_code == 422
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    mock_get_comments.assert_not_called()
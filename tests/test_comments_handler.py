@@ -1,3 +1,4 @@
+import json
 import os
 import sys
 from unittest.mock import AsyncMock
@@ -7,7 +8,11 @@ import pytest
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 # Import the modules to test
+from app.database.postgre import SubfedditNotFoundError
+from app.database.subfeddit_cache import SubfedditCache
 from app.handlers.comments_handler import CommentsHandler
+from app.handlers.cursor import InvalidCursorError
+from app.handlers.response_cache import compute_etag
 
 
 @pytest.fixture
@@ -16,6 +21,7 @@ def comments_handler():
     handler = CommentsHandler()
     # Replace the real PostgreClient with a mock
     handler.db_client = AsyncMock()
+    handler.subfeddit_cache = SubfedditCache(handler.db_client)
     return handler
 
 
@@ -49,70 +55,220 @@ def test_get_polarity_neutral():
 @pytest.mark.asyncio
 async def test_get_comments_basic(comments_handler):
     """Test CommentsHandler's get_comments method with basic parameters"""
-    # Configure mocks
-    comments_handler.db_client.get_subfeddit_id.return_value = 123
-    comments_handler.db_client.get_comments.return_value = [
-        {"id": 1, "text": "Positive comment!"},
-        {"id": 2, "text": "Negative comment :("},
-    ]
+    # Configure mocks, the subfeddit is not cached and the comments have no precomputed polarity yet
+    comments_handler.db_client.get_comments_by_title.return_value = (
+        123,
+        [
+            {"id": 1, "text": "Positive comment!", "polarity_score": None, "polarity_classification": None},
+            {"id": 2, "text": "Negative comment :(", "polarity_score": None, "polarity_classification": None},
+        ],
+    )
 
     # Call the method
-    result = await comments_handler.get_comments(subfeddit_name="test_subfeddit")
+    result, next_cursor = await comments_handler.get_comments(subfeddit_name="test_subfeddit")
 
     # Assertions
-    comments_handler.db_client.get_subfeddit_id.assert_called_once_with(
-        subfeddit_name="test_subfeddit"
-    )
-    comments_handler.db_client.get_comments.assert_called_once_with(
-        subfeddit_id=123, from_date=None, to_date=None, n_comments=25
+    comments_handler.db_client.get_subfeddit_id.assert_not_called()
+    comments_handler.db_client.get_comments_by_title.assert_called_once_with(
+        subfeddit_name="test_subfeddit",
+        from_date=None,
+        to_date=None,
+        n_comments=25,
+        min_polarity=-1,
+        max_polarity=1,
+        polarity_sorting=None,
+        after=None,
+        search=None,
     )
 
+    assert comments_handler.subfeddit_cache.lookup("test_subfeddit") == 123
+    assert next_cursor is None
     assert len(result) == 2
-    assert "polarity_score" in result[0]
-    assert "polarity_classification" in result[0]
+    assert result[0]["polarity_score"] > 0.1
+    assert result[0]["polarity_classification"] == "positive"
+    assert result[1]["polarity_score"] < -0.1
+    assert result[1]["polarity_classification"] == "negative"
 
 
 @pytest.mark.asyncio
 async def test_get_comments_with_polarity_filter(comments_handler):
-    """Test CommentsHandler's get_comments method with polarity filtering"""
+    """Test CommentsHandler's get_comments method delegates polarity filtering to the database"""
     # Configure mocks
-    comments_handler.db_client.get_subfeddit_id.return_value = 123
+    comments_handler.subfeddit_cache.add("test_subfeddit", 123)
     comments_handler.db_client.get_comments.return_value = [
-        {"id": 1, "text": "Extremely positive comment!!!!"},
-        {"id": 2, "text": "Very negative comment :((("},
-        {"id": 3, "text": "Neutral comment."},
+        {"id": 1, "text": "Extremely positive comment!!!!", "polarity_score": 0.6, "polarity_classification": "positive"},
     ]
+    comments_handler.scoring_engine = AsyncMock()
 
     # Call the method with min_polarity filter
-    result = await comments_handler.get_comments(
+    result, _ = await comments_handler.get_comments(
         subfeddit_name="test_subfeddit", min_polarity=0.2, max_polarity=1.0
     )
 
     # Assertions
-    assert len(result) < 3
-    for comment in result:
-        assert comment["polarity_score"] >= 0.2
+    assert comments_handler.db_client.get_comments.call_args.kwargs["min_polarity"] == 0.2
+    assert comments_handler.db_client.get_comments.call_args.kwargs["max_polarity"] == 1.0
+    comments_handler.scoring_engine.score_batch.assert_not_called()
+    assert result == comments_handler.db_client.get_comments.return_value
 
 
 @pytest.mark.asyncio
 async def test_get_comments_with_sorting(comments_handler):
-    """Test CommentsHandler's get_comments method with polarity sorting"""
+    """Test CommentsHandler's get_comments method delegates polarity sorting to the database"""
     # Configure mocks
-    comments_handler.db_client.get_subfeddit_id.return_value = 123
+    comments_handler.subfeddit_cache.add("test_subfeddit", 123)
     comments_handler.db_client.get_comments.return_value = [
-        {"id": 1, "text": "Positive comment!"},
-        {"id": 2, "text": "Negative comment :("},
-        {"id": 3, "text": "Neutral comment."},
+        {"id": 1, "text": "Positive comment!", "polarity_score": 0.5, "polarity_classification": "positive"},
+        {"id": 3, "text": "Neutral comment.", "polarity_score": 0.0, "polarity_classification": "neutral"},
+        {"id": 2, "text": "Negative comment :(", "polarity_score": -0.5, "polarity_classification": "negative"},
     ]
 
     # Call the method with polarity_sorting="desc"
-    result = await comments_handler.get_comments(
+    result, _ = await comments_handler.get_comments(
         subfeddit_name="test_subfeddit", polarity_sorting="desc"
     )
 
     # Assertions
-    assert len(result) == 3
+    assert comments_handler.db_client.get_comments.call_args.kwargs["polarity_sorting"] == "desc"
+    assert [comment["id"] for comment in result] == [1, 3, 2]
+
+
+@pytest.mark.asyncio
+async def test_get_comments_pagination(comments_handler):
+    """Test CommentsHandler's get_comments method returns a cursor after a full page and follows it"""
+    # Configure mocks
+    comments_handler.subfeddit_cache.add("test_subfeddit", 123)
+    comments_handler.db_client.get_comments.return_value = [
+        {"id": 9, "text": "Newer", "polarity_score": 0.0, "polarity_classification": "neutral", "created_at": 200},
+        {"id": 8, "text": "Older", "polarity_score": 0.0, "polarity_classification": "neutral", "created_at": 100},
+    ]
+
+    # Call the method for the first two pages
+    _, next_cursor = await comments_handler.get_comments(subfeddit_name="test_subfeddit", n_comments=2)
+    await comments_handler.get_comments(subfeddit_name="test_subfeddit", n_comments=2, cursor=next_cursor)
+
+    # Assertions
+    assert next_cursor is not None
+    assert comments_handler.db_client.get_comments.call_args.kwargs["after"] == [100, 8]
+
+
+@pytest.mark.asyncio
+async def test_score_comments_uses_cache(comments_handler):
+    """Test CommentsHandler's score_comments method only scores comments missing from the cache"""
+    comments = [
+        {"id": 1, "text": "Positive comment!"},
+        {"id": 2, "text": "Negative comment :("},
+    ]
+    first = await comments_handler.score_comments(comments)
+
+    comments_handler.scoring_engine = AsyncMock()
+    second = await comments_handler.score_comments(comments)
+
+    comments_handler.scoring_engine.score_batch.assert_not_called()
+    assert first == second
+
+
+@pytest.mark.asyncio
+async def test_stream_comments(comments_handler):
+    """Test CommentsHandler's stream_comments method scores every streamed batch"""
+
+    async def stream_comments(**kwargs):
+        yield [{"id": 1, "text": "Positive comment!", "polarity_score": None, "polarity_classification": None}]
+        yield [{"id": 2, "text": "Precomputed", "polarity_score": -0.5, "polarity_classification": "negative"}]
+
+    # Configure mocks
+    comments_handler.subfeddit_cache.add("test_subfeddit", 123)
+    comments_handler.db_client.stream_comments = stream_comments
+
+    # Call the method and consume the stream
+    batches = await comments_handler.stream_comments(subfeddit_name="test_subfeddit")
+    result = [batch async for batch in batches]
+
+    # Assertions
+    assert [len(batch) for batch in result] == [1, 1]
+    assert result[0][0]["polarity_classification"] == "positive"
+    assert result[1][0]["polarity_score"] == -0.5
 
-    # Check that comments are in descending order of polarity
-    for i in range(len(result) - 1):
-        assert result[i]["polarity_score"] >= result[i + 1]["polarity_score"]
+
+@pytest.mark.asyncio
+async def test_get_comments_uses_subfeddit_cache(comments_handler):
+    """Test CommentsHandler's get_comments method resolves cached subfeddits without querying the database"""
+    # Configure mocks
+    comments_handler.subfeddit_cache.add("test_subfeddit", 123)
+    comments_handler.db_client.get_comments.return_value = []
+
+    # Call the method
+    await comments_handler.get_comments(subfeddit_name="test_subfeddit")
+
+    # Assertions
+    comments_handler.db_client.get_subfeddit_id.assert_not_called()
+    assert comments_handler.db_client.get_comments.call_args.kwargs["subfeddit_id"] == 123
+
+
+@pytest.mark.asyncio
+async def test_get_comments_unknown_subfeddit(comments_handler):
+    """Test CommentsHandler's get_comments method remembers unknown subfeddits"""
+    # Configure mocks
+    comments_handler.db_client.get_comments_by_title.side_effect = SubfedditNotFoundError("not found")
+
+    # Call the method twice
+    for _ in range(2):
+        with pytest.raises(SubfedditNotFoundError):
+            await comments_handler.get_comments(subfeddit_name="unknown")
+
+    # Assertions
+    comments_handler.db_client.get_comments_by_title.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_comments_batch(comments_handler):
+    """Test CommentsHandler's get_comments_batch method scores all the pages at once and isolates failing queries"""
+    # Configure mocks, one subfeddit is cached and one is unknown
+    comments_handler.subfeddit_cache.add("first", 1)
+    comments_handler.db_client.get_comments.return_value = [
+        {"id": 1, "text": "Positive comment!", "polarity_score": None, "polarity_classification": None, "created_at": 10},
+    ]
+    comments_handler.db_client.get_comments_by_title.side_effect = SubfedditNotFoundError("not found")
+    comments_handler.scoring_engine = AsyncMock()
+    comments_handler.scoring_engine.score_batch.return_value = [(0.5, "positive")]
+
+    # Call the method
+    results = await comments_handler.get_comments_batch(
+        [
+            {"subfeddit_name": "first", "n_comments": 1},
+            {"subfeddit_name": "unknown"},
+            {"subfeddit_name": "first", "cursor": "not-a-cursor"},
+        ]
+    )
+
+    # Assertions
+    comments, next_cursor = results[0]
+    assert comments[0]["polarity_classification"] == "positive"
+    assert next_cursor is not None
+    assert isinstance(results[1], SubfedditNotFoundError)
+    assert isinstance(results[2], InvalidCursorError)
+    comments_handler.scoring_engine.score_batch.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_get_comments_cached_serializes_once(comments_handler):
+    """Test CommentsHandler's get_comments_cached method caches the page as JSON with its entity tag"""
+    # Configure mocks
+    comments_handler.subfeddit_cache.add("test_subfeddit", 123)
+    comments_handler.db_client.get_comments.return_value = [
+        {"id": 1, "text": "Positive comment!", "polarity_score": 0.5, "polarity_classification": "positive"},
+    ]
+
+    # Call the method twice
+    first = await comments_handler.get_comments_cached(subfeddit_name="test_subfeddit")
+    second = await comments_handler.get_comments_cached(subfeddit_name="test_subfeddit")
+
+    # Assertions
+    body, next_cursor, etag = first
+    assert second == first
+    assert json.loads(body) == [
+        {"id": 1, "text": "Positive comment!", "polarity_score": 0.5, "polarity_classification": "positive"}
+    ]
+    assert next_cursor is None
+    assert etag == compute_etag(body)
+    comments_handler.db_client.get_comments.assert_called_once()
@@ -0,0 +1,68 @@
+import base64
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the modules to test
+from app.handlers.cursor import InvalidCursorError, decode_cursor, encode_cursor
+
+COMMENT = {"id": 42, "created_at": 1654041600, "polarity_score": -0.3125}
+
+
+def test_round_trip_by_date():
+    """Test a cursor encodes the (created_at, id) of the comment when sorted by date"""
+    cursor = encode_cursor(None, COMMENT)
+
+    assert decode_cursor(cursor, None) == [1654041600, 42]
+
+
+@pytest.mark.parametrize("polarity_sorting", ["asc", "desc"])
+def test_round_trip_by_polarity(polarity_sorting):
+    """Test a cursor encodes the (polarity_score, id) of the comment when sorted by polarity"""
+    cursor = encode_cursor(polarity_sorting, COMMENT)
+
+    assert decode_cursor(cursor, polarity_sorting) == [-0.3125, 42]
+
+
+def test_cursor_bound_to_sort_order():
+    """Test a cursor cannot be used with another sort order"""
+    cursor = encode_cursor("asc", COMMENT)
+
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, "desc")
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "e30=", "eyJzIjoiY3JlYXRlZF9hdCJ9"])
+def test_malformed_cursor(cursor):
+    """Test malformed cursors are rejected"""
+    with pytest.raises(InvalidCursorError):
+        decode_cursor(cursor, None)
+
+
+def tampered_cursor(sort: str, keys: list) -> str:
+    payload = json.dumps({"s": sort, "k": keys})
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii")
+
+
+@pytest.mark.parametrize(
+    "polarity_sorting, sort, keys",
+    [
+        (None, "created_at", ["1654041600", 42]),
+        (None, "created_at", [1654041600, "42"]),
+        (None, "created_at", [1654041600.5, 42]),
+        (None, "created_at", [2**63, 42]),
+        (None, "created_at", [1654041600, True]),
+        (None, "created_at", [1654041600, 42, 7]),
+        ("desc", "polarity_desc", ["-0.3", 42]),
+        ("desc", "polarity_desc", [None, 42]),
+        ("desc", "polarity_desc", [float("nan"), 42]),
+    ],
+)
+def test_tampered_cursor(polarity_sorting, sort, keys):
+    """Test cursors whose keys do not have the types of the sort order are rejected"""
+    with pytest.raises(InvalidCursorError, match="Invalid cursor"):
+        decode_cursor(tampered_cursor(sort, keys), polarity_sorting)
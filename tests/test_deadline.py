@@ -0,0 +1,134 @@
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the modules to test
+from app.deadline import DeadlineExceededError, DeadlineMiddleware, _deadline, remaining, request_timeout
+
+
+def make_receive(disconnect: asyncio.Event):
+    """Creates an ASGI receive callable sending an empty body, then the disconnect once the event is set"""
+    messages = [{"type": "http.request", "body": b"", "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    return receive
+
+
+def make_scope(headers=()):
+    return {"type": "http", "path": "/comments", "headers": list(headers)}
+
+
+def test_request_timeout():
+    """Test request_timeout only lets the clients shorten the default timeout"""
+    assert request_timeout([], 30) == 30
+    assert request_timeout([(b"x-request-timeout", b"2.5")], 30) == 2.5
+    assert request_timeout([(b"X-Request-Timeout", b"60")], 30) == 30
+    assert request_timeout([(b"x-request-timeout", b"soon")], 30) == 30
+    assert request_timeout([(b"x-request-timeout", b"5")], None) == 5
+    assert request_timeout([], None) is None
+
+
+@pytest.mark.asyncio
+async def test_deadline_exceeded():
+    """Test DeadlineMiddleware cancels a request past its deadline and answers with a 504"""
+    cancelled = asyncio.Event()
+    left = []
+
+    async def app(scope, receive, send):
+        left.append(remaining())
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = DeadlineMiddleware(app, timeout=30)
+    await middleware(make_scope([(b"x-request-timeout", b"0.05")]), make_receive(asyncio.Event()), send)
+
+    assert 0 < left[0] <= 0.05
+    assert cancelled.is_set()
+    assert sent[0]["status"] == 504
+    assert json.loads(sent[1]["body"]) == {"detail": "The request did not complete within its deadline."}
+    # Outside of the request, there is no deadline anymore
+    assert remaining() is None
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect():
+    """Test DeadlineMiddleware cancels a request whose client disconnects, without answering it"""
+    cancelled = asyncio.Event()
+    disconnect = asyncio.Event()
+
+    async def app(scope, receive, send):
+        disconnect.set()
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = DeadlineMiddleware(app, timeout=30)
+    await asyncio.wait_for(middleware(make_scope(), make_receive(disconnect), send), timeout=1)
+
+    assert cancelled.is_set()
+    assert sent == []
+
+
+@pytest.mark.asyncio
+async def test_started_response_outlives_deadline():
+    """Test DeadlineMiddleware lets a response started within the deadline be streamed past it"""
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await asyncio.sleep(0.1)
+        await send({"type": "http.response.body", "body": b"done"})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    middleware = DeadlineMiddleware(app, timeout=0.05)
+    await middleware(make_scope(), make_receive(asyncio.Event()), send)
+
+    assert sent[0]["status"] == 200
+    assert sent[1]["body"] == b"done"
+
+
+def test_remaining():
+    """Test remaining returns the time left before the deadline, and raises once it has passed"""
+    assert remaining() is None
+
+    token = _deadline.set(time.monotonic() + 10)
+    try:
+        assert 9 < remaining() <= 10
+    finally:
+        _deadline.reset(token)
+
+    token = _deadline.set(time.monotonic() - 1)
+    try:
+        with pytest.raises(DeadlineExceededError):
+            remaining()
+    finally:
+        _deadline.reset(token)
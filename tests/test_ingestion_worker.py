@@ -0,0 +1,80 @@
+import os
+import sys
+from unittest.mock import AsyncMock
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the modules to test
+from app.scoring.engine import ScoringEngine
+from app.scoring.ingestion import IngestionWorker
+
+
+@pytest.mark.asyncio
+async def test_tail_resumes_from_checkpoint():
+    """Test IngestionWorker's tail method starts after the checkpoint and advances it after each batch"""
+    db_client = AsyncMock()
+    db_client.get_checkpoint.return_value = 10
+    db_client.get_last_comment_id.return_value = 15
+    db_client.get_unscored_comments.side_effect = [
+        [{"id": 12, "text": "Great post!"}],
+        [{"id": 15, "text": "Awful post."}],
+        [],
+    ]
+    worker = IngestionWorker(db_client, ScoringEngine(), shard_count=2, shard_index=1)
+
+    scored = await worker.tail()
+
+    assert scored == 2
+    db_client.get_checkpoint.assert_called_once_with("polarity-1-of-2")
+    assert [call.kwargs["after_id"] for call in db_client.get_unscored_comments.call_args_list] == [10, 12, 15]
+    assert db_client.get_unscored_comments.call_args.kwargs["shard_count"] == 2
+    assert [call.args for call in db_client.store_checkpoint.call_args_list] == [
+        ("polarity-1-of-2", 12),
+        ("polarity-1-of-2", 15),
+    ]
+    assert worker.last_id == 15
+
+
+@pytest.mark.asyncio
+async def test_run_once_rescans_when_due():
+    """Test IngestionWorker's run_once method rescans all the comments at most once per rescan interval"""
+    db_client = AsyncMock()
+    db_client.get_checkpoint.return_value = 0
+    db_client.get_last_comment_id.return_value = 0
+    db_client.get_unscored_comments.return_value = []
+    worker = IngestionWorker(db_client, ScoringEngine(), rescan_interval=3600)
+
+    await worker.run_once()
+    await worker.run_once()
+
+    # One tail per pass, and a single rescan starting from the first comment
+    after_ids = [call.kwargs["after_id"] for call in db_client.get_unscored_comments.call_args_list]
+    assert after_ids == [0, 0, 0]
+    db_client.store_checkpoint.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_tail_advances_checkpoint_past_scored_comments():
+    """Test IngestionWorker's tail method moves the checkpoint to the last comment scanned, even when the comments
+    after it were already scored"""
+    db_client = AsyncMock()
+    db_client.get_checkpoint.return_value = 10
+    db_client.get_last_comment_id.return_value = 40
+    db_client.get_unscored_comments.return_value = []
+    worker = IngestionWorker(db_client, ScoringEngine())
+
+    assert await worker.tail() == 0
+    await worker.tail()
+
+    # The second pass only scans the comments added after the first one
+    after_ids = [call.kwargs["after_id"] for call in db_client.get_unscored_comments.call_args_list]
+    assert after_ids == [10, 40]
+    db_client.store_checkpoint.assert_called_once_with("polarity-0-of-1", 40)
+
+
+def test_invalid_shard():
+    """Test IngestionWorker rejects a shard index outside of the shard count"""
+    with pytest.raises(ValueError):
+        IngestionWorker(AsyncMock(), ScoringEngine(), shard_count=2, shard_index=2)
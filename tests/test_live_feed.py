@@ -0,0 +1,217 @@
+import asyncio
+import os
+import sys
+import time
+from unittest.mock import AsyncMock
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the modules to test
+from app import deadline, metrics
+from app.handlers.live_feed import LiveFeedOverflowError, LiveFeeds, Subscriber
+
+
+def comment(comment_id: int, polarity_score: float, change_seq: int = None) -> dict:
+    return {
+        "change_seq": change_seq or comment_id,
+        "id": comment_id,
+        "text": f"comment {comment_id}",
+        "polarity_score": polarity_score,
+        "polarity_classification": "positive" if polarity_score > 0 else "negative",
+    }
+
+
+class ScoredComments:
+    """Serves the scored comments of a subfeddit after a watermark, in the order they were scored, like
+    PostgreClient.get_live_comments"""
+
+    def __init__(self, comments):
+        self.comments = comments
+
+    def __call__(self, subfeddit_id, after_seq, limit):
+        # Like the queries of the client, which record their time and are given the time left to the request
+        metrics.record_stage("get_live_comments_sql", 0.001)
+        deadline.remaining()
+        return [comment for comment in self.comments if comment["change_seq"] > after_seq][:limit]
+
+
+@pytest.fixture
+def db_client():
+    """Fixture to create a mock PostgreClient whose comments are all scored before the feeds start"""
+    client = AsyncMock()
+    client.get_live_watermark.return_value = 2
+    client.get_live_comments.side_effect = ScoredComments([comment(1, -0.5), comment(2, 0.5)])
+    return client
+
+
+@pytest.mark.asyncio
+async def test_poll_fans_out_to_subscribers(db_client):
+    """Test LiveFeeds reads the new comments of a subfeddit once for all its subscribers, filtered by polarity"""
+    feeds = LiveFeeds(db_client, poll_interval=60, batch_size=2)
+    new_comments = [comment(3, -0.8), comment(4, 0.1), comment(5, 0.9)]
+
+    async with feeds.subscribe(1) as (everything, watermark):
+        async with feeds.subscribe(1, max_polarity=0) as (negative, _):
+            assert watermark == 2
+            # Let the poller of the feed run its first poll, which finds nothing new
+            await asyncio.sleep(0)
+            db_client.get_live_comments.side_effect = ScoredComments(new_comments)
+            db_client.get_live_comments.reset_mock()
+
+            assert await feeds.poll(feeds.feeds[1]) == 3
+            assert feeds.feeds[1].watermark == 5
+
+            assert await everything.next_batch() == new_comments
+            assert await negative.next_batch() == [comment(3, -0.8)]
+            assert feeds.stats()["feeds"] == 1
+            assert feeds.stats()["subscribers"] == 2
+
+    # Two pages of the comments after the re-read window below the watermark were read for both subscribers
+    assert [call.args for call in db_client.get_live_comments.call_args_list] == [(1, 0, 2), (1, 4, 2)]
+    # The feed stopped with its last subscriber
+    assert feeds.stats()["feeds"] == 0
+    assert feeds.stats()["comments_read"] == 3
+
+
+@pytest.mark.asyncio
+async def test_poller_runs_outside_of_the_request(db_client):
+    """Test the poller of a feed does not record its polls in the request of its first subscriber, nor inherit its
+    deadline"""
+    feeds = LiveFeeds(db_client, poll_interval=0.001)
+    timings = metrics.RequestTimings()
+    metrics._request_timings.set(timings)
+    deadline._deadline.set(time.monotonic() + 0.01)
+
+    async with feeds.subscribe(1) as (subscriber, _):
+        stages = len(timings.stages)
+        await asyncio.sleep(0.05)
+
+        # The feed keeps polling after the deadline of the request, without recording its polls in it
+        db_client.get_live_comments.side_effect = ScoredComments([comment(3, 0.2)])
+        assert await subscriber.next_batch(timeout=1) == [comment(3, 0.2)]
+        assert feeds.polls > 5
+        assert len(timings.stages) == stages
+
+
+@pytest.mark.asyncio
+async def test_poll_reads_comments_scored_out_of_id_order(db_client):
+    """Test LiveFeeds sends the comments scored after its watermark whatever their ID, e.g. a comment scored again"""
+    feeds = LiveFeeds(db_client, poll_interval=60)
+
+    async with feeds.subscribe(1) as (subscriber, _):
+        await asyncio.sleep(0)
+        rescored = [comment(4, 0.3, change_seq=3), comment(1, 0.9, change_seq=4)]
+        db_client.get_live_comments.side_effect = ScoredComments(rescored)
+
+        await feeds.poll(feeds.feeds[1])
+        assert await subscriber.next_batch() == rescored
+        assert feeds.feeds[1].watermark == 4
+
+    db_client.get_live_watermark.assert_called_once_with(1)
+
+
+@pytest.mark.asyncio
+async def test_poll_reads_comments_committed_late(db_client):
+    """Test LiveFeeds sends once the comments committed after later ones were read, within its re-read window"""
+    feeds = LiveFeeds(db_client, poll_interval=60, reread_window=10)
+    scored = [comment(1, -0.5), comment(2, 0.5)]
+    db_client.get_live_comments.side_effect = ScoredComments(scored)
+
+    async with feeds.subscribe(1) as (subscriber, _):
+        await asyncio.sleep(0)
+        scored.append(comment(4, 0.4))
+        assert await feeds.poll(feeds.feeds[1]) == 1
+        assert await subscriber.next_batch() == [comment(4, 0.4)]
+
+        # The comment numbered 3 is committed after the comment numbered 4 was read
+        scored.insert(2, comment(3, 0.3))
+        assert await feeds.poll(feeds.feeds[1]) == 1
+        assert await subscriber.next_batch() == [comment(3, 0.3)]
+
+        # Then no comment is sent again
+        assert await feeds.poll(feeds.feeds[1]) == 0
+        assert await subscriber.next_batch(timeout=0.01) == []
+        assert feeds.feeds[1].watermark == 4
+
+    assert feeds.stats()["comments_late"] == 1
+
+
+@pytest.mark.asyncio
+async def test_backlog_is_not_sent_again_by_the_feed(db_client):
+    """Test LiveFeeds does not send again the comments of a backlog that the feed reads as committed late"""
+    feeds = LiveFeeds(db_client, poll_interval=60, reread_window=10)
+    scored = [comment(1, -0.5), comment(3, 0.3)]
+    db_client.get_live_watermark.return_value = 3
+    db_client.get_live_comments.side_effect = ScoredComments(scored)
+
+    async with feeds.subscribe(1) as (subscriber, watermark):
+        await asyncio.sleep(0)
+        # The comment numbered 2 is committed once the feed started, and read by the feed before the backlog
+        scored.insert(1, comment(2, 0.5))
+        assert await feeds.poll(feeds.feeds[1]) == 1
+
+        backlog = [comments async for comments in feeds.backlog(1, subscriber, 0, watermark)]
+        assert backlog == [[comment(1, -0.5), comment(2, 0.5), comment(3, 0.3)]]
+
+        scored.append(comment(4, 0.4))
+        await feeds.poll(feeds.feeds[1])
+        assert await subscriber.next_batch() == [comment(4, 0.4)]
+
+
+@pytest.mark.asyncio
+async def test_stream_resumes_after_last_event_id(db_client):
+    """Test LiveFeeds first streams the comments missed since the last event ID, then the new ones"""
+    feeds = LiveFeeds(db_client, poll_interval=60)
+    stream = feeds.stream(1, last_event_id=1)
+
+    assert await anext(stream) == [comment(2, 0.5)]
+
+    # The comment scored after the subscription comes from the feed
+    db_client.get_live_comments.side_effect = ScoredComments([comment(2, 0.5), comment(3, 0.2)])
+    await feeds.poll(feeds.feeds[1])
+    assert await anext(stream) == [comment(3, 0.2)]
+
+    await stream.aclose()
+    assert feeds.stats()["comments_sent"] == 2
+    assert feeds.stats()["feeds"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_heartbeat(db_client):
+    """Test LiveFeeds yields an empty batch when no comment came within the heartbeat interval"""
+    feeds = LiveFeeds(db_client, poll_interval=60)
+    stream = feeds.stream(1, heartbeat_interval=0.01)
+
+    assert await anext(stream) == []
+    await stream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_subscriber_overflow():
+    """Test Subscriber stops buffering when its buffer is full, and overflows once the buffer is sent"""
+    subscriber = Subscriber(after_seq=1, buffer_size=2)
+
+    assert subscriber.offer([comment(1, 0.1), comment(2, 0.2), comment(3, 0.3)]) == 2
+    assert subscriber.offer([comment(4, 0.4), comment(5, 0.5)]) == 0
+    assert subscriber.overflowed
+
+    assert await subscriber.next_batch() == [comment(2, 0.2), comment(3, 0.3)]
+    with pytest.raises(LiveFeedOverflowError):
+        await subscriber.next_batch()
+
+
+@pytest.mark.asyncio
+async def test_notification_wakes_feed(db_client):
+    """Test LiveFeeds polls the feed of the subfeddit of a notification right away"""
+    feeds = LiveFeeds(db_client, poll_interval=60)
+
+    async with feeds.subscribe(1) as (subscriber, _):
+        await asyncio.sleep(0)
+        db_client.get_live_comments.side_effect = ScoredComments([comment(3, 0.2)])
+
+        feeds.on_notification(None, 0, "live", "1")
+        assert await subscriber.next_batch(timeout=1) == [comment(3, 0.2)]
+
+    await feeds.stop()
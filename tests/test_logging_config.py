@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import queue
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the module to test
+from app.logging_config import (
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    SamplingFilter,
+    setup_logging,
+    shutdown_logging,
+)
+
+
+def make_record(level=logging.INFO, msg="Fetched %d comments", args=(3,), **extra):
+    record = logging.LogRecord("app.test", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+@pytest.fixture
+def restore_root_logger():
+    """Restores the handlers and level of the root logger replaced by setup_logging"""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    yield
+    shutdown_logging()
+    root.handlers[:] = handlers
+    root.setLevel(level)
+
+
+def test_json_formatter():
+    """Test JsonFormatter formats the message lazily and adds the extra fields"""
+    entry = json.loads(JsonFormatter().format(make_record(subfeddit_name="Dummy Topic 1")))
+
+    assert entry["message"] == "Fetched 3 comments"
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "app.test"
+    assert entry["subfeddit_name"] == "Dummy Topic 1"
+    assert "args" not in entry and "msg" not in entry
+
+
+def test_sampling_filter():
+    """Test SamplingFilter only drops the sampled records below the warning level"""
+    sampling_filter = SamplingFilter(rate=0)
+
+    assert not sampling_filter.filter(make_record(sampled=True))
+    assert sampling_filter.filter(make_record())
+    assert sampling_filter.filter(make_record(level=logging.ERROR, sampled=True))
+    assert SamplingFilter(rate=1).filter(make_record(sampled=True))
+
+
+def test_queue_handler_drops_when_full():
+    """Test NonBlockingQueueHandler drops the records instead of blocking when the queue is full"""
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+
+    handler.handle(make_record())
+    handler.handle(make_record())
+
+    assert handler.queue.qsize() == 1
+    assert handler.dropped == 1
+
+
+def test_setup_logging(tmp_path, restore_root_logger):
+    """Test setup_logging writes the records to the log file as JSON from the listener thread"""
+    log_file = tmp_path / "app.log"
+    setup_logging(level="INFO", sample_rate=0, log_file=str(log_file), console=False)
+
+    logger = logging.getLogger("app.test")
+    logger.info("Fetched %d comments", 3, extra={"sampled": True})
+    logger.info("Fetched %d comments", 4, extra={"count": 4})
+    logger.debug("Not written")
+    shutdown_logging()
+
+    entries = [json.loads(line) for line in log_file.read_text().splitlines()]
+    assert [entry["message"] for entry in entries] == ["Fetched 4 comments"]
+    assert entries[0]["count"] == 4
+
+
+def test_setup_logging_rotates_the_file(tmp_path, restore_root_logger):
+    """Test setup_logging rotates the log file once it reaches its maximum size"""
+    log_file = tmp_path / "app.log"
+    setup_logging(log_file=str(log_file), console=False, max_bytes=1000, backup_count=2)
+
+    logger = logging.getLogger("app.test")
+    for i in range(100):
+        logger.info("Comment %d", i)
+    shutdown_logging()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["app.log", "app.log.1", "app.log.2"]
+    assert log_file.stat().st_size <= 1000
@@ -0,0 +1,94 @@
+import os
+import sys
+
+from fastapi import FastAPI, HTTPException
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the module to test
+from app import metrics
+from app.metrics import Histogram, MetricsMiddleware, render_stats, stage, timed_handler
+
+# A minimal application with a timed endpoint, so that the recorded stages are known
+app = FastAPI()
+app.add_middleware(MetricsMiddleware)
+
+
+@app.get("/items/{item_id}")
+@timed_handler
+async def get_item(item_id: int):
+    with stage("lookup"):
+        if item_id == 0:
+            raise HTTPException(status_code=404, detail="Item not found")
+    return {"id": item_id}
+
+
+client = TestClient(app)
+
+
+def samples(histogram: Histogram) -> dict:
+    """Returns the number of observations of each series of a histogram"""
+    return {
+        label_values: sum(bucket_counts)
+        for label_values, (bucket_counts, _) in histogram.series.items()
+    }
+
+
+def test_histogram_render():
+    """Test Histogram renders cumulative buckets, sum and count per series"""
+    histogram = Histogram("test_seconds", "Test.", ("endpoint",), buckets=(0.1, 1))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a", count=2)
+
+    lines = histogram.render()
+
+    assert lines[:2] == ["# HELP test_seconds Test.", "# TYPE test_seconds histogram"]
+    assert 'test_seconds_bucket{endpoint="/a",le="0.1"} 1' in lines
+    assert 'test_seconds_bucket{endpoint="/a",le="1.0"} 3' in lines
+    assert 'test_seconds_bucket{endpoint="/a",le="+Inf"} 3' in lines
+    assert 'test_seconds_sum{endpoint="/a"} 1.05' in lines
+    assert 'test_seconds_count{endpoint="/a"} 3' in lines
+
+
+def test_middleware_records_stages_by_endpoint_and_outcome():
+    """Test MetricsMiddleware records the request and its stages with the route's path and the request outcome"""
+    metrics.REQUEST_SECONDS.clear()
+    metrics.STAGE_SECONDS.clear()
+
+    assert client.get("/items/1").status_code == 200
+    assert client.get("/items/0").status_code == 404
+    assert client.get("/unknown").status_code == 404
+
+    assert samples(metrics.REQUEST_SECONDS) == {
+        ("/items/{item_id}", "success"): 1,
+        ("/items/{item_id}", "client_error"): 1,
+        ("unmatched", "client_error"): 1,
+    }
+    assert samples(metrics.STAGE_SECONDS) == {
+        ("/items/{item_id}", "lookup", "success"): 1,
+        ("/items/{item_id}", "handler", "success"): 1,
+        ("/items/{item_id}", "serialization", "success"): 1,
+        ("/items/{item_id}", "lookup", "client_error"): 1,
+        ("/items/{item_id}", "handler", "client_error"): 1,
+    }
+
+
+def test_stage_outside_of_requests():
+    """Test stage records the stages run outside of requests right away, with their own outcome"""
+    metrics.STAGE_SECONDS.clear()
+
+    with stage("backfill"):
+        pass
+
+    assert samples(metrics.STAGE_SECONDS) == {("background", "backfill", "success"): 1}
+
+
+def test_render_stats():
+    """Test render_stats renders the counters and gauges of a component"""
+    lines = render_stats("test_pool", "Pool", {"acquire_count": 3, "idle": 2, "size": None}, counters=("acquire_count",))
+
+    assert "# TYPE test_pool_acquire_count_total counter" in lines
+    assert "test_pool_acquire_count_total 3" in lines
+    assert "test_pool_idle 2" in lines
+    assert not any("size" in line for line in lines)
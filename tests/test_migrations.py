@@ -0,0 +1,132 @@
+import json
+import os
+import sys
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the modules to test
+from app.database.migrations import MIGRATIONS_LOCK_KEY, Migration, SchemaMigrator, seq_scans
+
+
+@pytest.fixture
+def migrations():
+    """Fixture to create a plain migration and an index migration"""
+    return [
+        Migration("first", "CREATE TABLE first (id INT);"),
+        Migration(
+            "second_idx",
+            "CREATE INDEX CONCURRENTLY IF NOT EXISTS second_idx ON first (id);",
+            index="second_idx",
+        ),
+    ]
+
+
+@pytest.fixture
+def mock_conn():
+    """Fixture to create a connection holding the migrations lock, with no migration applied yet"""
+    conn = AsyncMock()
+    conn.fetchval.return_value = True
+    conn.fetch.return_value = []
+    return conn
+
+
+@pytest.fixture
+def schema_migrator(migrations, mock_conn):
+    """Fixture to create a SchemaMigrator whose client opens the mock connection"""
+    db_client = AsyncMock()
+    db_client.connect.return_value = mock_conn
+    return SchemaMigrator(db_client, migrations)
+
+
+def executed(conn) -> list:
+    return [call.args[0] for call in conn.execute.call_args_list]
+
+
+@pytest.mark.asyncio
+async def test_run_applies_pending_migrations(schema_migrator, mock_conn):
+    """Test SchemaMigrator's run method applies and records the migrations not applied yet, in order"""
+    mock_conn.fetch.return_value = [{"name": "first"}]
+    mock_conn.fetchval.side_effect = [True, None]
+
+    # Call the method
+    applied = await schema_migrator.run()
+
+    # Assertions
+    assert applied == ["second_idx"]
+    mock_conn.fetchval.assert_any_call("SELECT pg_try_advisory_lock($1);", MIGRATIONS_LOCK_KEY)
+    assert "CREATE TABLE first (id INT);" not in executed(mock_conn)
+    assert "CREATE INDEX CONCURRENTLY IF NOT EXISTS second_idx ON first (id);" in executed(mock_conn)
+    mock_conn.execute.assert_any_call("INSERT INTO schema_migrations (name) VALUES ($1);", "second_idx")
+    mock_conn.close.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_run_rebuilds_invalid_index(schema_migrator, mock_conn):
+    """Test SchemaMigrator's run method drops the invalid index left by an interrupted build before building it"""
+    mock_conn.fetch.return_value = [{"name": "first"}]
+    mock_conn.fetchval.side_effect = [True, False]
+
+    # Call the method
+    await schema_migrator.run()
+
+    # Assertions
+    statements = executed(mock_conn)
+    drop = statements.index("DROP INDEX CONCURRENTLY IF EXISTS second_idx;")
+    assert drop < statements.index("CREATE INDEX CONCURRENTLY IF NOT EXISTS second_idx ON first (id);")
+
+
+@pytest.mark.asyncio
+async def test_run_skips_when_locked(schema_migrator, mock_conn):
+    """Test SchemaMigrator's run method leaves the migrations to the instance already applying them"""
+    mock_conn.fetchval.return_value = False
+
+    # Call the method
+    applied = await schema_migrator.run()
+
+    # Assertions
+    assert applied is None
+    mock_conn.execute.assert_not_called()
+    mock_conn.close.assert_awaited_once()
+
+
+def test_seq_scans():
+    """Test seq_scans lists the tables read with a sequential scan anywhere in a plan"""
+    plan = {
+        "Node Type": "Hash Join",
+        "Plans": [
+            {"Node Type": "Seq Scan", "Relation Name": "comment"},
+            {
+                "Node Type": "Hash",
+                "Plans": [{"Node Type": "Index Scan", "Relation Name": "comment_polarity"}],
+            },
+        ],
+    }
+
+    assert seq_scans(plan) == ["comment"]
+    assert seq_scans({"Node Type": "Index Scan", "Relation Name": "comment"}) == []
+
+
+@pytest.mark.asyncio
+async def test_check_plans_reports_large_seq_scans(schema_migrator, mock_conn):
+    """Test SchemaMigrator's check_plans method reports the sequential scans of the large tables only"""
+    schema_migrator.db_client.query_shapes = MagicMock(
+        return_value={"lookup": ("SELECT 1;", []), "page": ("SELECT 2;", [1])}
+    )
+    lookup_plan = [{"Plan": {"Node Type": "Seq Scan", "Relation Name": "subfeddit"}}]
+    page_plan = [{"Plan": {"Node Type": "Seq Scan", "Relation Name": "comment"}}]
+    mock_conn.fetchval.side_effect = [json.dumps(lookup_plan), json.dumps(page_plan)]
+    mock_conn.fetch.side_effect = [[], [{"relname": "comment"}]]
+
+    # Call the method
+    found = await schema_migrator.check_plans(min_rows=1000)
+
+    # Assertions
+    assert found == {"page": ["comment"]}
+    mock_conn.fetchval.assert_any_call("EXPLAIN (FORMAT JSON) SELECT 2;", 1)
+    mock_conn.fetch.assert_any_call(
+        "SELECT relname FROM pg_class WHERE relname = ANY($1::text[]) AND reltuples >= $2;", ["comment"], 1000
+    )
+    mock_conn.close.assert_awaited_once()
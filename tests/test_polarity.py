@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+from textblob import TextBlob
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.scoring.polarity import get_polarity, score_batch
+
+
+TEXTS = [
+    "This is amazing! I love it.",
+    "This is terrible! I hate it.",
+    "This is a neutral statement.",
+    "Not bad at all, really not bad.",
+    "It is not a good movie, it is very very good!!",
+    "I don't think it's great... never again :(",
+    "Oh great, another meeting (!)",
+    "Best. Day. Ever. <3 :D",
+    "HORRIBLY slow and terribly expensive",
+    "",
+    "   ",
+    "Mr. Smith went to the U.S. and was happy.\n\nThe end was sad",
+    "\"Nice\" 'quote' “smart” ‘quotes’",
+]
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_score_batch_matches_textblob(text):
+    """Test score_batch gives exactly the polarity of TextBlob"""
+    assert score_batch([text]) == [TextBlob(text).sentiment.polarity]
+
+
+def test_score_batch_keeps_order():
+    """Test score_batch scores every text of a batch, in order"""
+    assert score_batch(TEXTS) == [TextBlob(text).sentiment.polarity for text in TEXTS]
+
+
+def test_get_polarity_classification():
+    """Test get_polarity classifies the polarity score"""
+    assert get_polarity("This is amazing! I love it.")[1] == "positive"
+    assert get_polarity("This is terrible! I hate it.")[1] == "negative"
+    assert get_polarity("This is a neutral statement.")[1] == "neutral"
@@ -0,0 +1,73 @@
+import asyncio
+import contextlib
+import os
+import sys
+from unittest.mock import AsyncMock
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the modules to test
+from app.scoring.backfill import POLARITY_BACKFILL_LOCK_KEY, PolarityBackfill
+from app.scoring.engine import ScoringEngine
+from app.scoring.polarity import SCORER_VERSION, get_polarity, text_hash
+
+
+@pytest.mark.asyncio
+async def test_run_once_scores_every_batch():
+    """Test PolarityBackfill's run_once method walks the unscored comments batch by batch"""
+    db_client = AsyncMock()
+    db_client.get_unscored_comments.side_effect = [
+        [{"id": 1, "text": "Great post!"}, {"id": 2, "text": "Awful post."}],
+        [{"id": 7, "text": "Neutral post."}],
+        [],
+    ]
+    backfill = PolarityBackfill(db_client, ScoringEngine(), batch_size=2)
+
+    scored = await backfill.run_once()
+
+    assert scored == 3
+    assert [call.kwargs["after_id"] for call in db_client.get_unscored_comments.call_args_list] == [0, 2, 7]
+    db_client.store_polarities.assert_any_call(
+        [(7, text_hash("Neutral post."), SCORER_VERSION, *get_polarity("Neutral post."))]
+    )
+
+
+@pytest.mark.asyncio
+async def test_start_and_stop():
+    """Test PolarityBackfill runs in the background until stopped"""
+    db_client = AsyncMock()
+    db_client.get_unscored_comments.return_value = []
+    backfill = PolarityBackfill(db_client, ScoringEngine(), interval=60)
+
+    backfill.start()
+    await backfill.stop()
+
+    assert backfill.task is None
+
+
+@pytest.mark.asyncio
+async def test_run_forever_skips_locked_passes():
+    """Test PolarityBackfill only runs the passes for which it holds the advisory lock of the backfill"""
+    db_client = AsyncMock()
+    db_client.get_unscored_comments.return_value = []
+    locked_keys = []
+
+    @contextlib.asynccontextmanager
+    async def try_advisory_lock(key):
+        # Another process holds the lock during the first pass
+        locked_keys.append(key)
+        yield len(locked_keys) > 1
+
+    db_client.try_advisory_lock = try_advisory_lock
+    backfill = PolarityBackfill(db_client, ScoringEngine(), interval=0)
+
+    backfill.start()
+    while not db_client.get_unscored_comments.called:
+        await asyncio.sleep(0)
+    await backfill.stop()
+
+    # Every pass but the first one read the comments
+    assert set(locked_keys) == {POLARITY_BACKFILL_LOCK_KEY}
+    assert db_client.get_unscored_comments.call_count == len(locked_keys) - 1
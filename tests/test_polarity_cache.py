@@ -0,0 +1,143 @@
+import os
+import sys
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the modules to test
+from app.scoring.cache import (
+    PolarityCache,
+    PostgresPolarityBackend,
+    SQLitePolarityBackend,
+    build_backend,
+)
+from app.scoring.polarity import SCORER_VERSION, text_hash
+
+COMMENT = {"id": 1, "text": "Great post!"}
+
+
+@pytest.mark.asyncio
+async def test_get_many_miss_then_hit():
+    """Test PolarityCache counts a miss before the score is set and a hit after"""
+    cache = PolarityCache()
+
+    assert await cache.get_many([COMMENT]) == {}
+    await cache.set_many([(COMMENT, (0.8, "positive"))])
+    assert await cache.get_many([COMMENT]) == {1: (0.8, "positive")}
+
+    assert cache.stats()["misses"] == 1
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_changed_text_is_a_miss():
+    """Test PolarityCache does not return the score of a comment whose text changed"""
+    cache = PolarityCache()
+    await cache.set_many([(COMMENT, (0.8, "positive"))])
+
+    result = await cache.get_many([{"id": 1, "text": "Edited: awful post."}])
+
+    assert result == {}
+
+
+@pytest.mark.asyncio
+async def test_lru_eviction():
+    """Test PolarityCache evicts the least recently used entry when full"""
+    cache = PolarityCache(max_size=2)
+    comments = [{"id": i, "text": f"comment {i}"} for i in range(3)]
+
+    await cache.set_many([(comments[0], (0.0, "neutral")), (comments[1], (0.0, "neutral"))])
+    await cache.get_many([comments[0]])
+    await cache.set_many([(comments[2], (0.0, "neutral"))])
+
+    assert set(await cache.get_many(comments)) == {0, 2}
+    assert cache.stats()["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_ttl_expiry():
+    """Test PolarityCache drops entries older than the TTL"""
+    cache = PolarityCache(ttl=10)
+
+    with patch("app.scoring.cache.time.monotonic", return_value=100):
+        await cache.set_many([(COMMENT, (0.8, "positive"))])
+
+    with patch("app.scoring.cache.time.monotonic", return_value=111):
+        assert await cache.get_many([COMMENT]) == {}
+
+    assert cache.stats()["size"] == 0
+
+
+@pytest.mark.asyncio
+async def test_backend_hit_and_stale_rows():
+    """Test PolarityCache serves matching backend rows and ignores stale ones"""
+    backend = AsyncMock()
+    backend.get_polarities.return_value = [
+        {
+            "comment_id": 1,
+            "text_hash": text_hash("Great post!"),
+            "scorer_version": SCORER_VERSION,
+            "polarity_score": 0.8,
+            "polarity_classification": "positive",
+        },
+        {
+            "comment_id": 2,
+            "text_hash": text_hash("Old text"),
+            "scorer_version": SCORER_VERSION,
+            "polarity_score": -0.5,
+            "polarity_classification": "negative",
+        },
+    ]
+    cache = PolarityCache(backend=backend)
+
+    result = await cache.get_many([COMMENT, {"id": 2, "text": "New text"}])
+
+    backend.get_polarities.assert_called_once_with([1, 2])
+    assert result == {1: (0.8, "positive")}
+    assert cache.stats()["backend_hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+@pytest.mark.asyncio
+async def test_set_many_writes_through_backend():
+    """Test PolarityCache writes new scores to the backend"""
+    backend = AsyncMock()
+    cache = PolarityCache(backend=backend)
+
+    await cache.set_many([(COMMENT, (0.8, "positive"))])
+
+    backend.store_polarities.assert_called_once_with(
+        [(1, text_hash("Great post!"), SCORER_VERSION, 0.8, "positive")]
+    )
+
+
+@pytest.mark.asyncio
+async def test_sqlite_backend_round_trip(tmp_path):
+    """Test SQLitePolarityBackend persists scores across instances"""
+    path = str(tmp_path / "cache.sqlite3")
+
+    backend = SQLitePolarityBackend(path)
+    await backend.open()
+    await PolarityCache(backend=backend).set_many([(COMMENT, (0.8, "positive"))])
+    await backend.close()
+
+    backend = SQLitePolarityBackend(path)
+    await backend.open()
+    cache = PolarityCache(backend=backend)
+    result = await cache.get_many([COMMENT])
+    await backend.close()
+
+    assert result == {1: (0.8, "positive")}
+    assert cache.stats()["backend_hits"] == 1
+
+
+def test_build_backend():
+    """Test build_backend returns the configured backend"""
+    assert build_backend("") is None
+    assert isinstance(build_backend("sqlite"), SQLitePolarityBackend)
+    assert isinstance(build_backend("postgres", AsyncMock()), PostgresPolarityBackend)
+
+    with pytest.raises(ValueError):
+        build_backend("redis")
@@ -2,14 +2,20 @@ import contextlib
 import os
 import sys
 from datetime import datetime
-from unittest.mock import AsyncMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 
 # Import the modules to test
-from app.database.postgre import PostgreClient
+from app.database.postgre import (
+    SUBFEDDIT_ID_QUERY,
+    LIVE_COMMENTS_QUERY,
+    PostgreClient,
+    SubfedditNotFoundError,
+)
+from app.scoring.polarity import SCORER_VERSION
 
 
 @pytest.fixture
@@ -58,7 +64,7 @@ async def test_get_subfeddit_id_success(postgres_client):
 
     # Assertions
     mock_conn.fetchrow.assert_called_once_with(
-        "SELECT id FROM subfeddit WHERE title = $1;", "Dummy Topic 1"
+        "SELECT id FROM subfeddit WHERE title = $1;", "Dummy Topic 1", timeout=None
     )
     assert result == 1
 
@@ -113,13 +119,44 @@ async def test_get_comments_no_filters(postgres_client):
 
     # Assertions
     mock_conn.fetch.assert_called_once_with(
-        "SELECT id, text FROM comment WHERE subfeddit_id = $1 ORDER BY created_at DESC LIMIT $2;",
+        "SELECT c.id, c.text, p.polarity_score, p.polarity_classification, c.created_at "
+        "FROM comment c LEFT JOIN comment_polarity p "
+        "ON p.comment_id = c.id AND p.scorer_version = $2 "
+        "WHERE c.subfeddit_id = $1 ORDER BY c.created_at DESC, c.id DESC LIMIT $3;",
         1,
+        SCORER_VERSION,
         2,
+        timeout=None,
     )
     assert result == mock_comments
 
 
+@pytest.mark.asyncio
+async def test_get_comments_with_search(postgres_client):
+    """Test PostgreClient's get_comments method combines the full-text search with the polarity filters"""
+    # Create a mock connection
+    mock_conn = AsyncMock()
+    mock_conn.fetch.return_value = []
+
+    # Create an actual async context manager class
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    # Replace the pool's acquire method with our context manager
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    # Call the method with a search and a polarity filter
+    await postgres_client.get_comments(subfeddit_id=1, max_polarity=-0.1, search="checkout -paypal")
+
+    # Assertions, the predicate has the expression of the full-text index
+    query, *params = mock_conn.fetch.call_args.args
+    assert "AND to_tsvector('english', c.text) @@ websearch_to_tsquery('english', $3) " in query
+    assert "AND p.polarity_score BETWEEN $4 AND $5" in query
+    assert params == [1, SCORER_VERSION, "checkout -paypal", -1, -0.1, 25]
+
+
 @pytest.mark.asyncio
 async def test_get_comments_with_date_filters(postgres_client):
     """Test PostgreClient's get_comments method with date filters"""
@@ -150,10 +187,489 @@ async def test_get_comments_with_date_filters(postgres_client):
 
     # Assertions
     mock_conn.fetch.assert_called_once_with(
-        "SELECT id, text FROM comment WHERE subfeddit_id = $1 AND created_at >= $2 AND created_at <= $3 ORDER BY created_at DESC LIMIT $4;",
+        "SELECT c.id, c.text, p.polarity_score, p.polarity_classification, c.created_at "
+        "FROM comment c LEFT JOIN comment_polarity p "
+        "ON p.comment_id = c.id AND p.scorer_version = $2 "
+        "WHERE c.subfeddit_id = $1 AND c.created_at >= $3 AND c.created_at <= $4 "
+        "ORDER BY c.created_at DESC, c.id DESC LIMIT $5;",
         1,
+        SCORER_VERSION,
         from_timestamp,
         to_timestamp,
         1,
+        timeout=None,
     )
     assert result == mock_comments
+
+
+@pytest.mark.asyncio
+async def test_store_and_get_polarities(postgres_client):
+    """Test PostgreClient's store_polarities and get_polarities methods"""
+    # Create a mock connection
+    mock_conn = AsyncMock()
+    mock_conn.fetch.return_value = [
+        {
+            "comment_id": 1,
+            "text_hash": "abc",
+            "scorer_version": "v1",
+            "polarity_score": 0.8,
+            "polarity_classification": "positive",
+        }
+    ]
+
+    # Create an actual async context manager class
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    # Replace the pool's acquire method with our context manager
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    # Call the methods
+    await postgres_client.store_polarities([(1, "abc", "v1", 0.8, "positive")])
+    result = await postgres_client.get_polarities([1])
+
+    # Assertions
+    query, *columns = mock_conn.execute.call_args.args
+    assert "ON CONFLICT (comment_id) DO UPDATE" in query
+    # A score written again takes a new change sequence number, for the live feeds to send it again
+    assert "change_seq = EXCLUDED.change_seq" in query
+    assert columns == [[1], ["abc"], ["v1"], [0.8], ["positive"]]
+    assert mock_conn.fetch.call_args.args[1] == [1]
+    assert result[0]["polarity_score"] == 0.8
+
+
+@pytest.mark.asyncio
+async def test_get_comments_with_polarity_filters(postgres_client):
+    """Test PostgreClient's get_comments method filters and sorts by polarity in SQL"""
+    # Create a mock connection
+    mock_conn = AsyncMock()
+    mock_conn.fetch.return_value = []
+
+    # Create an actual async context manager class
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    # Replace the pool's acquire method with our context manager
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    # Call the method with polarity filters and sorting
+    await postgres_client.get_comments(
+        subfeddit_id=1, n_comments=10, min_polarity=0.2, polarity_sorting="desc"
+    )
+
+    # Assertions
+    mock_conn.fetch.assert_called_once_with(
+        "SELECT c.id, c.text, p.polarity_score, p.polarity_classification, p.created_at "
+        "FROM comment_polarity p JOIN comment c ON c.id = p.comment_id "
+        "WHERE p.subfeddit_id = $1 AND p.scorer_version = $2 "
+        "AND p.polarity_score BETWEEN $3 AND $4 "
+        "ORDER BY p.polarity_score DESC, p.comment_id DESC LIMIT $5;",
+        1,
+        SCORER_VERSION,
+        0.2,
+        1,
+        10,
+        timeout=None,
+    )
+
+
+@pytest.mark.asyncio
+async def test_get_comments_after_cursor(postgres_client):
+    """Test PostgreClient's get_comments method continues after the previous page with a keyset predicate"""
+    # Create a mock connection
+    mock_conn = AsyncMock()
+    mock_conn.fetch.return_value = []
+
+    # Create an actual async context manager class
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    # Replace the pool's acquire method with our context manager
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    # Call the method for the pages after a comment, by date and by ascending polarity
+    await postgres_client.get_comments(subfeddit_id=1, n_comments=10, after=[1654000000, 42])
+    await postgres_client.get_comments(
+        subfeddit_id=1, n_comments=10, polarity_sorting="asc", after=[-0.25, 42]
+    )
+
+    # Assertions
+    by_date, by_polarity = mock_conn.fetch.call_args_list
+    assert by_date.args[0].endswith(
+        "WHERE c.subfeddit_id = $1 AND (c.created_at, c.id) < ($3, $4) "
+        "ORDER BY c.created_at DESC, c.id DESC LIMIT $5;"
+    )
+    assert by_date.args[1:] == (1, SCORER_VERSION, 1654000000, 42, 10)
+    assert by_polarity.args[0].endswith(
+        "AND p.polarity_score BETWEEN $3 AND $4 AND (p.polarity_score, p.comment_id) > ($5, $6) "
+        "ORDER BY p.polarity_score ASC, p.comment_id ASC LIMIT $7;"
+    )
+    assert by_polarity.args[1:] == (1, SCORER_VERSION, -1, 1, -0.25, 42, 10)
+
+
+@pytest.mark.asyncio
+async def test_get_unscored_comments(postgres_client):
+    """Test PostgreClient's get_unscored_comments method"""
+    # Create a mock connection
+    mock_conn = AsyncMock()
+    mock_conn.fetch.return_value = [{"id": 5, "text": "New comment"}]
+
+    # Create an actual async context manager class
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    # Replace the pool's acquire method with our context manager
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    # Call the method
+    result = await postgres_client.get_unscored_comments(after_id=4, limit=100)
+
+    # Assertions
+    query, *params = mock_conn.fetch.call_args.args
+    assert "p.text_hash <> md5(c.text)" in query
+    assert params == [4, SCORER_VERSION, 100]
+    assert result == [{"id": 5, "text": "New comment"}]
+
+
+@pytest.mark.asyncio
+async def test_get_unscored_comments_of_shard(postgres_client):
+    """Test PostgreClient's get_unscored_comments method keeps the comments of one shard"""
+    mock_conn = AsyncMock()
+    mock_conn.fetch.return_value = []
+
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    await postgres_client.get_unscored_comments(after_id=4, limit=100, shard_count=3, shard_index=1)
+
+    query, *params = mock_conn.fetch.call_args.args
+    assert "c.id % $3 = $4" in query and query.endswith("LIMIT $5;")
+    assert params == [4, SCORER_VERSION, 3, 1, 100]
+
+
+@pytest.mark.asyncio
+async def test_checkpoint(postgres_client):
+    """Test PostgreClient's get_checkpoint and store_checkpoint methods"""
+    mock_conn = AsyncMock()
+    mock_conn.fetchval.return_value = None
+
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    assert await postgres_client.get_checkpoint("polarity-0-of-1") == 0
+
+    await postgres_client.store_checkpoint("polarity-0-of-1", 42)
+    query, *params = mock_conn.execute.call_args.args
+    assert "ON CONFLICT (name) DO UPDATE" in query
+    assert params == ["polarity-0-of-1", 42]
+
+
+@pytest.mark.asyncio
+async def test_stream_comments(postgres_client):
+    """Test PostgreClient's stream_comments method reads a server-side cursor batch by batch"""
+    # Create a mock connection whose cursor returns two batches
+    mock_cursor = AsyncMock()
+    mock_cursor.fetch.side_effect = [[{"id": 2, "text": "a"}, {"id": 1, "text": "b"}], [{"id": 0, "text": "c"}], []]
+    mock_conn = AsyncMock()
+    mock_conn.cursor.return_value = mock_cursor
+
+    @contextlib.asynccontextmanager
+    async def mock_transaction(**kwargs):
+        yield
+
+    mock_conn.transaction = mock_transaction
+
+    # Create an actual async context manager class
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    # Replace the pool's acquire method with our context manager
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    # Call the method and consume the stream
+    batches = [batch async for batch in postgres_client.stream_comments(subfeddit_id=1, batch_size=2)]
+
+    # Assertions
+    query, *params = mock_conn.cursor.call_args.args
+    assert "LIMIT" not in query
+    assert params == [1, SCORER_VERSION]
+    mock_cursor.fetch.assert_called_with(2)
+    assert batches == [[{"id": 2, "text": "a"}, {"id": 1, "text": "b"}], [{"id": 0, "text": "c"}]]
+
+
+@pytest.mark.asyncio
+async def test_get_subfeddits(postgres_client):
+    """Test PostgreClient's get_subfeddits method maps every subfeddit name to its ID"""
+    # Create a mock connection
+    mock_conn = AsyncMock()
+    mock_conn.fetch.return_value = [{"id": 1, "title": "Dummy Topic 1"}, {"id": 2, "title": "Dummy Topic 2"}]
+
+    # Create an actual async context manager class
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    # Replace the pool's acquire method with our context manager
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    # Call the method
+    result = await postgres_client.get_subfeddits()
+
+    # Assertions
+    mock_conn.fetch.assert_called_once_with("SELECT id, title FROM subfeddit;")
+    assert result == {"Dummy Topic 1": 1, "Dummy Topic 2": 2}
+
+
+@pytest.mark.asyncio
+async def test_get_live_comments(postgres_client):
+    """Test PostgreClient's get_live_comments method reads the comments of a subfeddit scored after the watermark"""
+    # Create a mock connection
+    mock_conn = AsyncMock()
+    mock_conn.fetch.return_value = [
+        {"change_seq": 11, "id": 12, "text": "Comment", "polarity_score": 0.3, "polarity_classification": "positive"}
+    ]
+
+    # Create an actual async context manager class
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    # Replace the pool's acquire method with our context manager
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    # Call the method
+    result = await postgres_client.get_live_comments(subfeddit_id=1, after_seq=10, limit=100)
+
+    # Assertions
+    mock_conn.fetch.assert_called_once_with(LIVE_COMMENTS_QUERY, 1, 10, 100)
+    assert result[0]["id"] == 12
+
+
+@pytest.mark.asyncio
+async def test_connect_to_db_tunes_pool(postgres_client, monkeypatch):
+    """Test PostgreClient's connect_to_db method configures the pool and prepares connections"""
+    create_pool = AsyncMock()
+    monkeypatch.setattr("asyncpg.create_pool", create_pool)
+
+    await postgres_client.connect_to_db()
+
+    kwargs = create_pool.call_args.kwargs
+    assert kwargs["max_size"] >= kwargs["min_size"]
+    assert kwargs["init"] == postgres_client.prepare_connection
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("locked", [True, False])
+async def test_try_advisory_lock(postgres_client, locked):
+    """Test PostgreClient's try_advisory_lock method releases the lock it acquired, and only that one"""
+    mock_conn = AsyncMock()
+    mock_conn.fetchval.return_value = locked
+
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    async with postgres_client.try_advisory_lock(42) as acquired:
+        assert acquired is locked
+        mock_conn.execute.assert_not_called()
+
+    mock_conn.fetchval.assert_called_once_with("SELECT pg_try_advisory_lock($1);", 42)
+    if locked:
+        mock_conn.execute.assert_called_once_with("SELECT pg_advisory_unlock($1);", 42)
+    else:
+        mock_conn.execute.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_prepare_connection(postgres_client):
+    """Test PostgreClient's prepare_connection method prepares every query shape once"""
+    mock_conn = AsyncMock()
+
+    await postgres_client.prepare_connection(mock_conn)
+
+    queries = PostgreClient.prepared_queries()
+    prepared = [call.args[0] for call in mock_conn.fetch.call_args_list]
+    assert sorted(prepared) == sorted(query for query, _ in queries)
+    # Each query runs once, with parameters matching its placeholders
+    for call, (query, params) in zip(mock_conn.fetch.call_args_list, queries):
+        assert call.args == (query, *params)
+
+    # The shape of a page of comments with date filters is among them
+    query, _ = PostgreClient._build_page_query(1, "01-06-2022", "05-06-2022", 1)
+    assert query in prepared
+
+
+def test_query_shapes():
+    """Test PostgreClient's query_shapes method gives each shape the parameters its query expects"""
+    shapes = PostgreClient.query_shapes()
+
+    assert shapes["subfeddit_id"] == (SUBFEDDIT_ID_QUERY, ["example"])
+    for query, params in shapes.values():
+        assert f"${len(params)}" in query
+        assert f"${len(params) + 1}" not in query
+
+
+@pytest.mark.asyncio
+async def test_pool_stats_and_close(postgres_client):
+    """Test PostgreClient's pool_stats method reports the acquisitions and close releases the pool"""
+
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield AsyncMock()
+
+    pool = MagicMock()
+    pool.close = AsyncMock()
+    pool.acquire = mock_acquire
+    pool.get_size.return_value = 10
+    pool.get_idle_size.return_value = 7
+    postgres_client.pool = pool
+
+    async with postgres_client.acquire():
+        assert postgres_client.pool_stats()["waiting"] == 0
+
+    stats = postgres_client.pool_stats()
+    assert stats["acquire_count"] == 1
+    assert stats["in_use"] == 3
+
+    await postgres_client.close()
+
+    pool.close.assert_called_once()
+    assert postgres_client.pool is None
+
+
+@pytest.mark.asyncio
+async def test_get_comments_by_title(postgres_client):
+    """Test PostgreClient's get_comments_by_title method resolves the subfeddit within the comments query"""
+    # Create a mock connection, an existing subfeddit without comments returns a single null row
+    mock_conn = AsyncMock()
+    mock_conn.fetch.side_effect = [
+        [
+            {"subfeddit_id": 1, "id": 33730, "text": "Hate it!"},
+            {"subfeddit_id": 1, "id": 33729, "text": "Love it!"},
+        ],
+        [{"subfeddit_id": 2, "id": None, "text": None}],
+        [],
+    ]
+
+    # Create an actual async context manager class
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    # Replace the pool's acquire method with our context manager
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    # Call the method for a subfeddit with comments, one without, and an unknown one
+    with_comments = await postgres_client.get_comments_by_title("Dummy Topic 1", n_comments=2)
+    without_comments = await postgres_client.get_comments_by_title("Dummy Topic 2")
+    with pytest.raises(SubfedditNotFoundError):
+        await postgres_client.get_comments_by_title("wrong_subfeddit")
+
+    # Assertions
+    query, *params = mock_conn.fetch.call_args_list[0].args
+    assert query.startswith("WITH s AS (SELECT id FROM subfeddit WHERE title = $1) ")
+    assert "WHERE c.subfeddit_id = s.id ORDER BY c.created_at DESC, c.id DESC LIMIT $3) page ON true" in query
+    assert params == ["Dummy Topic 1", SCORER_VERSION, 2]
+    assert with_comments[0] == 1
+    assert [(comment["id"], comment["text"]) for comment in with_comments[1]] == [(33730, "Hate it!"), (33729, "Love it!")]
+    assert without_comments == (2, [])
+
+
+@pytest.mark.asyncio
+async def test_get_sentiment(postgres_client):
+    """Test PostgreClient's get_sentiment method reads the rollup table by bucket and date range"""
+    # Create a mock connection
+    mock_conn = AsyncMock()
+    mock_conn.fetch.return_value = [
+        {"bucket": datetime(2023, 1, 2).date(), "positive": 2, "neutral": 1, "negative": 0, "polarity_sum": 0.9}
+    ]
+
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    # Call the method
+    result = await postgres_client.get_sentiment(
+        subfeddit_id=1, from_date="01-01-2023", to_date="31-01-2023", bucket="week"
+    )
+
+    # Assertions
+    query, *params = mock_conn.fetch.call_args.args
+    assert "FROM subfeddit_sentiment_daily WHERE subfeddit_id = $1" in query
+    assert "day >= $3" in query and "day <= $4" in query
+    assert params == [1, "week", datetime(2023, 1, 1).date(), datetime(2023, 1, 31).date()]
+    assert result[0]["positive"] == 2
+
+
+@pytest.mark.asyncio
+async def test_create_sentiment_rollup_only_once(postgres_client):
+    """Test PostgreClient's create_sentiment_rollup method leaves an existing rollup table untouched"""
+    # Create a mock connection, on which the rollup table already exists
+    mock_conn = MagicMock()
+    mock_conn.execute = AsyncMock()
+    mock_conn.fetchval = AsyncMock(return_value="subfeddit_sentiment_daily")
+    mock_conn.transaction.return_value = AsyncMock()
+
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    # Call the method
+    await postgres_client.create_sentiment_rollup()
+
+    # Assertions, the writers of comment_polarity were not blocked
+    mock_conn.execute.assert_not_called()
+    mock_conn.transaction.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_create_sentiment_rollup_created_meanwhile(postgres_client):
+    """Test PostgreClient's create_sentiment_rollup method checks again for the rollup table once it holds the lock"""
+    # Create a mock connection, on which another instance creates the rollup table before the lock is taken
+    mock_conn = MagicMock()
+    mock_conn.execute = AsyncMock()
+    mock_conn.fetchval = AsyncMock(side_effect=[None, "subfeddit_sentiment_daily"])
+    mock_conn.transaction.return_value = AsyncMock()
+
+    @contextlib.asynccontextmanager
+    async def mock_acquire():
+        yield mock_conn
+
+    postgres_client.pool = AsyncMock()
+    postgres_client.pool.acquire = mock_acquire
+
+    # Call the method
+    await postgres_client.create_sentiment_rollup()
+
+    # Assertions, only the lock was taken
+    mock_conn.execute.assert_called_once_with("LOCK TABLE comment_polarity IN SHARE ROW EXCLUSIVE MODE;")
@@ -0,0 +1,164 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app import deadline
+from app.handlers.response_cache import ResponseCache, etag_matches
+
+
+class Counter:
+    """Computes a value counting its calls, optionally blocking until released"""
+
+    def __init__(self):
+        self.calls = 0
+        self.released = asyncio.Event()
+        self.released.set()
+
+    async def __call__(self):
+        self.calls += 1
+        await self.released.wait()
+        return {"calls": self.calls}
+
+
+@pytest.mark.asyncio
+async def test_get_caches_value():
+    """Test ResponseCache serves fresh entries without computing them again"""
+    cache = ResponseCache(ttl=60, stale_ttl=0)
+    compute = Counter()
+
+    first = await cache.get("key", compute)
+    second = await cache.get("key", compute)
+
+    assert first == second
+    assert compute.calls == 1
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_coalesces_concurrent_misses():
+    """Test ResponseCache computes concurrent misses of the same key once"""
+    cache = ResponseCache(ttl=60, stale_ttl=0)
+    compute = Counter()
+    compute.released.clear()
+
+    pending = [asyncio.create_task(cache.get("key", compute)) for _ in range(10)]
+    await asyncio.sleep(0)
+    compute.released.set()
+    results = await asyncio.gather(*pending)
+
+    assert compute.calls == 1
+    assert all(result == results[0] for result in results)
+    assert cache.stats()["coalesced"] == 9
+
+
+@pytest.mark.asyncio
+async def test_get_cancels_computation_without_callers():
+    """Test ResponseCache keeps a computation running while a caller waits for it, and cancels it with its last
+    caller"""
+    cache = ResponseCache(ttl=60, stale_ttl=0)
+    compute = Counter()
+    compute.released.clear()
+
+    first = asyncio.create_task(cache.get("key", compute))
+    second = asyncio.create_task(cache.get("key", compute))
+    await asyncio.sleep(0)
+    computation = cache.in_flight["key"]
+
+    first.cancel()
+    await asyncio.sleep(0)
+    assert not computation.done()
+
+    second.cancel()
+    await asyncio.wait({computation}, timeout=1)
+    assert computation.cancelled()
+    assert "key" not in cache.in_flight
+    assert "key" not in cache.waiting
+
+
+@pytest.mark.asyncio
+async def test_get_waits_until_each_caller_deadline():
+    """Test ResponseCache computes a value without the deadline of its first caller, each caller waiting for it until
+    its own deadline"""
+    cache = ResponseCache(ttl=60, stale_ttl=0)
+    compute = Counter()
+    compute.released.clear()
+    deadlines = []
+
+    async def compute_without_deadline():
+        deadlines.append(deadline.remaining())
+        return await compute()
+
+    async def get_within(timeout):
+        deadline._deadline.set(time.monotonic() + timeout)
+        return await cache.get("key", compute_without_deadline)
+
+    first = asyncio.create_task(get_within(0.01))
+    second = asyncio.create_task(get_within(10))
+    await asyncio.sleep(0.05)
+
+    # The first caller timed out, while the computation keeps running for the second one
+    with pytest.raises(TimeoutError):
+        await first
+    assert not second.done()
+
+    compute.released.set()
+    value, _ = await second
+    assert value == {"calls": 1}
+    assert deadlines == [None]
+
+
+@pytest.mark.asyncio
+async def test_get_serves_stale_while_revalidating():
+    """Test ResponseCache serves a stale entry and refreshes it in the background"""
+    cache = ResponseCache(ttl=0.01, stale_ttl=60)
+    compute = Counter()
+
+    first, _ = await cache.get("key", compute)
+    await asyncio.sleep(0.02)
+    stale, _ = await cache.get("key", compute)
+    await asyncio.gather(*cache.in_flight.values())
+    refreshed, _ = await cache.get("key", compute)
+
+    assert stale == first
+    assert refreshed == {"calls": 2}
+    assert cache.stats()["stale_hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_get_does_not_cache_errors():
+    """Test ResponseCache raises errors to the caller and computes the key again next time"""
+    cache = ResponseCache(ttl=60, stale_ttl=0)
+    compute = Counter()
+
+    async def failing():
+        raise ValueError("Database error")
+
+    with pytest.raises(ValueError):
+        await cache.get("key", failing)
+
+    assert await cache.get("key", compute) == ({"calls": 1}, cache.entries["key"][2])
+
+
+@pytest.mark.asyncio
+async def test_get_disabled():
+    """Test ResponseCache computes every call when its TTL is 0"""
+    cache = ResponseCache(ttl=0)
+    compute = Counter()
+
+    await cache.get("key", compute)
+    await cache.get("key", compute)
+
+    assert compute.calls == 2
+
+
+def test_etag_matches():
+    """Test etag_matches compares the If-None-Match header with the ETag"""
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches('"a"', '"b"')
+    assert not etag_matches(None, '"b"')
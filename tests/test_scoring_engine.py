@@ -0,0 +1,87 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the modules to test
+from app.scoring.engine import ScoringEngine, score_texts
+from app.scoring.polarity import classify_polarity, get_polarity
+
+TEXTS = [
+    "This is amazing! I love it.",
+    "This is terrible! I hate it.",
+    "This is a neutral statement.",
+]
+
+
+def test_classify_polarity_thresholds():
+    """Test classify_polarity uses the 0.1 / -0.1 thresholds"""
+    assert classify_polarity(0.5) == "positive"
+    assert classify_polarity(-0.5) == "negative"
+    assert classify_polarity(0.1) == "neutral"
+    assert classify_polarity(-0.1) == "neutral"
+
+
+def test_score_texts_matches_get_polarity():
+    """Test score_texts scores every text like get_polarity, in order"""
+    assert score_texts(TEXTS) == [get_polarity(text) for text in TEXTS]
+
+
+def test_invalid_executor():
+    """Test ScoringEngine rejects unknown executor kinds"""
+    with pytest.raises(ValueError):
+        ScoringEngine(executor="gpu")
+
+
+@pytest.mark.asyncio
+async def test_score_batch_without_start():
+    """Test ScoringEngine scores inline when the pool was not started"""
+    engine = ScoringEngine()
+
+    result = await engine.score_batch(TEXTS)
+
+    assert engine.executor is None
+    assert result == score_texts(TEXTS)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("executor", ["thread", "process"])
+async def test_score_batch_on_pool(executor):
+    """Test ScoringEngine keeps the input order when chunks are scored on the pool"""
+    engine = ScoringEngine(executor=executor, workers=2, batch_size=2)
+    engine.start()
+
+    try:
+        result = await engine.score_batch(TEXTS * 3)
+    finally:
+        await engine.shutdown()
+
+    assert result == score_texts(TEXTS * 3)
+    assert engine.executor is None
+
+
+@pytest.mark.asyncio
+async def test_score_batch_empty():
+    """Test ScoringEngine returns an empty list for no texts"""
+    engine = ScoringEngine()
+    engine.start()
+
+    try:
+        assert await engine.score_batch([]) == []
+    finally:
+        await engine.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_warm_up_starts_the_workers():
+    """Test ScoringEngine's warm_up starts every process of the pool before any comment is scored"""
+    engine = ScoringEngine(executor="process", workers=2)
+    engine.start()
+
+    try:
+        await engine.warm_up()
+        assert len(engine.executor._processes) == 2
+    finally:
+        await engine.shutdown()
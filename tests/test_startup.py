@@ -0,0 +1,43 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+# Seconds a fresh interpreter may take to import the API, generous enough for slow CI machines
+STARTUP_TIME_LIMIT = float(os.getenv("STARTUP_TIME_LIMIT", 2.0))
+
+# Modules only needed once the API serves traffic, loaded by the lifespan rather than on import
+DEFERRED_MODULES = ["textblob", "nltk"]
+
+IMPORT_SCRIPT = """
+import json, logging, sys, time
+start = time.perf_counter()
+import app.app
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "modules": sorted(sys.modules), "handlers": len(logging.getLogger().handlers)}))
+"""
+
+
+def import_app() -> dict:
+    """Imports the API in a fresh interpreter and returns how long it took and what it loaded"""
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SCRIPT], cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_import_defers_heavy_modules():
+    """Test importing the API neither loads TextBlob and NLTK nor sets the logging up"""
+    result = import_app()
+
+    assert not [module for module in DEFERRED_MODULES if module in result["modules"]]
+    assert result["handlers"] == 0
+
+
+def test_import_time_within_limit():
+    """Test the API imports within the cold start limit, taking the best of three runs to absorb noise"""
+    seconds = min(import_app()["seconds"] for _ in range(3))
+
+    assert seconds < STARTUP_TIME_LIMIT, f"importing app.app took {seconds:.2f}s, above {STARTUP_TIME_LIMIT}s"
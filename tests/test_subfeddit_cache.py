@@ -0,0 +1,121 @@
+import asyncio
+import os
+import sys
+from unittest.mock import AsyncMock, patch
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the modules to test
+from app.database.postgre import SubfedditNotFoundError
+from app.database.subfeddit_cache import SubfedditCache
+
+
+@pytest.fixture
+def db_client():
+    """Fixture to create a mock PostgreClient knowing two subfeddits"""
+    client = AsyncMock()
+    client.get_subfeddits.return_value = {"Dummy Topic 1": 1, "Dummy Topic 2": 2}
+    client.get_subfeddit_id.side_effect = SubfedditNotFoundError("Subfeddit 'unknown' not found.")
+    return client
+
+
+@pytest.mark.asyncio
+async def test_start_warms_the_cache(db_client):
+    """Test SubfedditCache loads all subfeddits at start and serves them without querying the database"""
+    cache = SubfedditCache(db_client, refresh_interval=60)
+
+    await cache.start()
+    try:
+        assert await cache.get_id("Dummy Topic 2") == 2
+    finally:
+        await cache.stop()
+
+    db_client.get_subfeddits.assert_called_once()
+    db_client.get_subfeddit_id.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_miss_falls_back_to_database(db_client):
+    """Test SubfedditCache queries the database on a miss and caches the result"""
+    db_client.get_subfeddit_id.side_effect = None
+    db_client.get_subfeddit_id.return_value = 3
+    cache = SubfedditCache(db_client)
+
+    assert await cache.get_id("New Topic") == 3
+    assert await cache.get_id("New Topic") == 3
+
+    db_client.get_subfeddit_id.assert_called_once_with(subfeddit_name="New Topic")
+
+
+@pytest.mark.asyncio
+async def test_negative_cache(db_client):
+    """Test SubfedditCache remembers unknown subfeddits until the negative TTL expires"""
+    cache = SubfedditCache(db_client, negative_ttl=30)
+
+    with patch("app.database.subfeddit_cache.time.monotonic", return_value=100):
+        for _ in range(2):
+            with pytest.raises(SubfedditNotFoundError):
+                await cache.get_id("unknown")
+
+    assert db_client.get_subfeddit_id.call_count == 1
+
+    with patch("app.database.subfeddit_cache.time.monotonic", return_value=131):
+        with pytest.raises(SubfedditNotFoundError):
+            await cache.get_id("unknown")
+
+    assert db_client.get_subfeddit_id.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_forgets_unknown_names(db_client):
+    """Test SubfedditCache's refresh method reloads the map and clears the negative cache"""
+    cache = SubfedditCache(db_client)
+    cache.add_unknown("Dummy Topic 1")
+
+    await cache.refresh()
+
+    assert not cache.is_unknown("Dummy Topic 1")
+    assert cache.lookup("Dummy Topic 1") == 1
+
+
+@pytest.mark.asyncio
+async def test_notification_triggers_refresh(db_client):
+    """Test SubfedditCache listens to the notify channel and refreshes on notifications"""
+    cache = SubfedditCache(db_client, refresh_interval=60, notify_channel="subfeddit_changed")
+
+    await cache.start()
+    cache.on_notification(None, 0, "subfeddit_changed", "")
+    await asyncio.sleep(0)
+    await cache.stop()
+
+    db_client.listen.assert_called_once_with("subfeddit_changed", cache.on_notification)
+    db_client.listen.return_value.close.assert_called_once()
+    assert db_client.get_subfeddits.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_notifications_share_running_refresh(db_client):
+    """Test SubfedditCache keeps the refresh task of a notification, and does not start another while it runs"""
+    cache = SubfedditCache(db_client, refresh_interval=60)
+    release = asyncio.Event()
+
+    async def slow_refresh():
+        await release.wait()
+        raise ConnectionError("database unavailable")
+
+    db_client.get_subfeddits.side_effect = slow_refresh
+
+    cache.on_notification(None, 0, "subfeddit_changed", "")
+    refresh_task = cache.refresh_task
+    cache.on_notification(None, 0, "subfeddit_changed", "")
+    assert cache.refresh_task is refresh_task
+
+    # The failed refresh is logged rather than left unobserved in the task
+    release.set()
+    await refresh_task
+    assert db_client.get_subfeddits.call_count == 1
+
+    await cache.stop()
+    assert cache.refresh_task is None
@@ -0,0 +1,103 @@
+import json
+import os
+import sys
+from datetime import date
+from unittest.mock import patch
+
+from fastapi.testclient import TestClient
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+
+from app.app import app
+from app.database.postgre import SubfedditNotFoundError
+from app.endpoints.subfeddits import subfeddits_handler
+from app.handlers.live_feed import LiveFeedOverflowError
+
+client = TestClient(app)
+
+
+def test_get_sentiment_api_success():
+    """Test the get_sentiment API endpoint for successful case"""
+    distribution = {"positive": 2, "neutral": 1, "negative": 1, "count": 4, "mean_polarity": 0.2}
+
+    with patch.object(subfeddits_handler, "get_sentiment") as mock_get_sentiment:
+        mock_get_sentiment.return_value = {
+            "subfeddit_name": "test_subfeddit",
+            "bucket": "month",
+            "total": distribution,
+            "buckets": [{"start": date(2023, 1, 1), **distribution}],
+        }
+
+        response = client.get(
+            "/subfeddits/test_subfeddit/sentiment", params={"bucket": "month", "from_date": "01-01-2023"}
+        )
+
+    assert response.status_code == 200
+    assert response.json()["buckets"][0]["start"] == "2023-01-01"
+    mock_get_sentiment.assert_called_once_with(
+        subfeddit_name="test_subfeddit", from_date="01-01-2023", to_date=None, bucket="month"
+    )
+
+
+def test_get_sentiment_api_invalid_date():
+    """Test the get_sentiment API endpoint returns a 400 error for a malformed date"""
+    response = client.get("/subfeddits/test_subfeddit/sentiment", params={"from_date": "2023-01-01"})
+
+    assert response.status_code == 400
+
+
+def test_get_sentiment_api_subfeddit_not_found():
+    """Test the get_sentiment API endpoint returns a 404 error for an unknown subfeddit"""
+    with patch.object(subfeddits_handler, "get_sentiment") as mock_get_sentiment:
+        mock_get_sentiment.side_effect = SubfedditNotFoundError("Subfeddit 'unknown' not found.")
+
+        response = client.get("/subfeddits/unknown/sentiment")
+
+    assert response.status_code == 404
+
+
+def test_get_live_comments_api_success():
+    """Test the get_live_comments API endpoint streams the comments as Server-Sent Events, until the client overflows"""
+    comment = {"id": 7, "text": "too slow", "polarity_score": -0.4, "polarity_classification": "negative"}
+
+    async def batches():
+        yield [{"change_seq": 9, **comment}]
+        yield []
+        raise LiveFeedOverflowError("More than 1000 comments were waiting to be sent.")
+
+    with patch.object(subfeddits_handler, "live_comments") as mock_live_comments:
+        mock_live_comments.return_value = batches()
+
+        response = client.get(
+            "/subfeddits/test_subfeddit/live", params={"max_polarity": 0}, headers={"Last-Event-ID": "5"}
+        )
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    events = response.text.split("\n\n")
+    # The event ID is the change sequence number of the comment, which is not in its data
+    assert events[0].split("\n")[:2] == ["id: 9", "event: comment"]
+    assert json.loads(events[0].split("data: ")[1]) == comment
+    assert events[1] == ": keep-alive"
+    assert events[2].startswith("event: overflow")
+    mock_live_comments.assert_called_once_with(
+        subfeddit_name="test_subfeddit", min_polarity=-1, max_polarity=0, last_event_id=5
+    )
+
+
+def test_get_live_comments_api_subfeddit_not_found():
+    """Test the get_live_comments API endpoint returns a 404 error for an unknown subfeddit"""
+    with patch.object(subfeddits_handler, "live_comments") as mock_live_comments:
+        mock_live_comments.side_effect = SubfedditNotFoundError("Subfeddit 'unknown' not found.")
+
+        response = client.get("/subfeddits/unknown/live")
+
+    assert response.status_code == 404
+
+
+def test_get_live_comments_api_invalid_polarity():
+    """Test the get_live_comments API endpoint returns a 400 error for a polarity out of range"""
+    response = client.get("/subfeddits/test_subfeddit/live", params={"min_polarity": -2})
+
+    assert response.status_code == 400
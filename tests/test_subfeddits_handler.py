@@ -0,0 +1,67 @@
+import os
+import sys
+from datetime import date
+from unittest.mock import AsyncMock
+
+import pytest
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+# Import the modules to test
+from app.database.postgre import SubfedditNotFoundError
+from app.database.subfeddit_cache import SubfedditCache
+from app.handlers.subfeddits_handler import SubfedditsHandler
+
+
+@pytest.fixture
+def subfeddits_handler():
+    """Fixture to create a test SubfedditsHandler instance with a mock PostgreClient"""
+    db_client = AsyncMock()
+    return SubfedditsHandler(db_client, SubfedditCache(db_client))
+
+
+@pytest.mark.asyncio
+async def test_get_sentiment(subfeddits_handler):
+    """Test SubfedditsHandler's get_sentiment method computes the distribution per bucket and in total"""
+    # Configure mocks
+    subfeddits_handler.subfeddit_cache.add("test_subfeddit", 123)
+    subfeddits_handler.db_client.get_sentiment.return_value = [
+        {"bucket": date(2023, 1, 1), "positive": 2, "neutral": 1, "negative": 1, "polarity_sum": 0.8},
+        {"bucket": date(2023, 1, 2), "positive": 0, "neutral": 0, "negative": 0, "polarity_sum": 0.0},
+        {"bucket": date(2023, 1, 3), "positive": 0, "neutral": 0, "negative": 4, "polarity_sum": -2.0},
+    ]
+
+    # Call the method
+    result = await subfeddits_handler.get_sentiment("test_subfeddit", bucket="day")
+
+    # Assertions
+    subfeddits_handler.db_client.get_sentiment.assert_called_once_with(
+        subfeddit_id=123, from_date=None, to_date=None, bucket="day"
+    )
+    assert [bucket["start"] for bucket in result["buckets"]] == [date(2023, 1, 1), date(2023, 1, 3)]
+    assert result["buckets"][0]["count"] == 4
+    assert result["buckets"][0]["mean_polarity"] == pytest.approx(0.2)
+    assert result["total"]["negative"] == 5
+    assert result["total"]["mean_polarity"] == pytest.approx(-1.2 / 8)
+
+
+@pytest.mark.asyncio
+async def test_get_sentiment_empty(subfeddits_handler):
+    """Test SubfedditsHandler's get_sentiment method without scored comments"""
+    subfeddits_handler.subfeddit_cache.add("test_subfeddit", 123)
+    subfeddits_handler.db_client.get_sentiment.return_value = []
+
+    result = await subfeddits_handler.get_sentiment("test_subfeddit")
+
+    assert result["buckets"] == []
+    assert result["total"]["count"] == 0
+    assert result["total"]["mean_polarity"] is None
+
+
+@pytest.mark.asyncio
+async def test_get_sentiment_unknown_subfeddit(subfeddits_handler):
+    """Test SubfedditsHandler's get_sentiment method raises for an unknown subfeddit"""
+    subfeddits_handler.db_client.get_subfeddit_id.side_effect = SubfedditNotFoundError("not found")
+
+    with pytest.raises(SubfedditNotFoundError):
+        await subfeddits_handler.get_sentiment("unknown")